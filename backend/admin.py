@@ -1,27 +1,93 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, Response, stream_with_context
 import sqlite3
+import csv
+import io
+import json
+import math
+import maintenance
+from config import get_settings
 
 app = Flask(__name__)
 
 app.secret_key = '123'
+settings = get_settings()
 
 # Function to get a database connection with a timeout to avoid locking
+indexes_checked = False
+
 def get_db_connection():
-    conn = sqlite3.connect('nutri.db', timeout=10)  # Connect to your nutri.db with a timeout
+    global indexes_checked
+    conn = sqlite3.connect(settings.database_path, timeout=10)  # Connect to your nutri.db with a timeout
     conn.row_factory = sqlite3.Row  # This allows us to access columns by name
+    if not indexes_checked:
+        # Older databases were created without the user_id indexes
+        maintenance.ensure_user_indexes(conn)
+        indexes_checked = True
     return conn
 
+# Columns used by the bulk food import/export
+FOOD_COLUMNS = ['food_name', 'type', 'carbs', 'protein', 'fats', 'calorie', 'grams', 'meal_type', 'category', 'recipe_link']
+MEAL_TYPES = {'Breakfast', 'Lunch', 'Dinner', 'Snack', 'Snacks', 'Dessert', 'General', 'Rice'}
+IMPORT_CHUNK_SIZE = 500  # Rows per executemany batch
+EXPORT_CHUNK_SIZE = 500  # Rows fetched from the cursor at a time
+MAX_REPORTED_ERRORS = 1000  # Keep the error report bounded for very bad files
+PAGE_SIZES = [25, 50, 100, 200]
+
 # Define a route for the admin dashboard
 @app.route('/')
 def admin_dashboard():
     return render_template('main.html')
 
+def paginate(conn, table, sortable, searchable, default_sort):
+    # Reads page/per_page/sort/dir/q from the query string and fetches only the requested page
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    try:
+        per_page = int(request.args.get('per_page', PAGE_SIZES[0]))
+    except ValueError:
+        per_page = PAGE_SIZES[0]
+    if per_page not in PAGE_SIZES:
+        per_page = PAGE_SIZES[0]
+    sort = request.args.get('sort', default_sort)
+    if sort not in sortable:
+        sort = default_sort
+    direction = 'desc' if request.args.get('dir') == 'desc' else 'asc'
+    search = request.args.get('q', '').strip()
+
+    where, params = '', []
+    if search:
+        where = 'WHERE ' + ' OR '.join(f'{column} LIKE ?' for column in searchable)
+        params = [f'%{search}%'] * len(searchable)
+
+    total = conn.execute(f'SELECT COUNT(*) FROM {table} {where}', params).fetchone()[0]
+    pages = max((total + per_page - 1) // per_page, 1)
+    page = min(page, pages)
+    # The primary key keeps the order stable when the sort column has duplicates
+    rows = conn.execute(
+        f'SELECT * FROM {table} {where} ORDER BY {sort} {direction}, rowid {direction} LIMIT ? OFFSET ?',
+        params + [per_page, (page - 1) * per_page],
+    ).fetchall()
+
+    pagination = {'page': page, 'pages': pages, 'per_page': per_page, 'total': total,
+                  'sort': sort, 'dir': direction, 'q': search, 'page_sizes': PAGE_SIZES}
+    return rows, pagination
+
 # Route to manage existing foods
 @app.route('/food', methods=['GET'])
 def manage_food():
-    with get_db_connection() as conn:
-        foods = conn.execute('SELECT * FROM foods').fetchall()
-    return render_template('food.html', foods=foods)
+    conn = get_db_connection()
+    try:
+        foods, pagination = paginate(
+            conn, 'foods',
+            sortable=['food_id', 'food_name', 'type', 'calorie', 'grams', 'meal_type', 'category'],
+            searchable=['food_name', 'type', 'meal_type', 'category'],
+            default_sort='food_id',
+        )
+    finally:
+        conn.close()
+    return render_template('food.html', foods=foods, pagination=pagination)
 
 # Route to add new food separately
 @app.route('/food/add', methods=['GET', 'POST'])
@@ -100,21 +166,242 @@ def delete_food(food_id):
     flash('Food deleted successfully!')
     return redirect(url_for('manage_food'))
 
+# Route to export the whole food catalog as CSV or NDJSON, streamed in chunks
+@app.route('/food/export', methods=['GET'])
+def export_food():
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        flash('Unknown export format.')
+        return redirect(url_for('manage_food'))
+
+    def generate():
+        conn = get_db_connection()
+        try:
+            cursor = conn.execute('SELECT food_id, ' + ', '.join(FOOD_COLUMNS) + ' FROM foods ORDER BY food_id')
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if export_format == 'csv':
+                writer.writerow(['food_id'] + FOOD_COLUMNS)
+            while True:
+                rows = cursor.fetchmany(EXPORT_CHUNK_SIZE)
+                if not rows:
+                    break
+                if export_format == 'csv':
+                    writer.writerows(tuple(row) for row in rows)
+                else:
+                    for row in rows:
+                        buffer.write(json.dumps(dict(row)) + '\n')
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        finally:
+            conn.close()
+
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    extension = 'csv' if export_format == 'csv' else 'ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=foods.{extension}'})
+
+
+def parse_macro(value):
+    # Macros are stored like '5g' in the catalog; accept '5', '5g' or '5.5 g'
+    number = float(str(value).lower().replace('g', '').strip())
+    if not math.isfinite(number) or number < 0:
+        raise ValueError('must be a non-negative number')
+    return f'{number:g}g'
+
+
+def parse_whole_number(value):
+    number = float(str(value).strip())
+    if not math.isfinite(number) or number < 0 or number != int(number):
+        raise ValueError('must be a non-negative whole number')
+    return int(number)
+
+
+def validate_food_row(row, known_types, allow_new_types=False):
+    # Returns (food, error) where food is a tuple in FOOD_COLUMNS order
+    row = {key.strip(): value for key, value in row.items() if key is not None}
+    missing = [column for column in FOOD_COLUMNS if column != 'recipe_link' and (row.get(column) is None or str(row.get(column)).strip() == '')]
+    if missing:
+        return None, 'Missing ' + ', '.join(missing)
+
+    try:
+        carbs = parse_macro(row['carbs'])
+        protein = parse_macro(row['protein'])
+        fats = parse_macro(row['fats'])
+    except ValueError:
+        return None, 'carbs, protein and fats must be numbers (optionally ending in g)'
+    try:
+        calorie = parse_whole_number(row['calorie'])
+        grams = parse_whole_number(row['grams'])
+    except ValueError:
+        return None, 'calorie and grams must be non-negative whole numbers'
+
+    food_type = str(row['type']).strip()
+    meal_type = str(row['meal_type']).strip()
+    if food_type in known_types:
+        # Stored the way the catalog spells it ('Snack ' has a trailing space), so filters and grouping see one type
+        food_type = known_types[food_type]
+    elif not allow_new_types:
+        return None, f"Unknown type '{food_type}'"
+    if meal_type not in MEAL_TYPES:
+        return None, f"Unknown meal_type '{meal_type}'"
+
+    recipe_link = str(row.get('recipe_link') or '').strip() or None
+    return (str(row['food_name']).strip(), food_type, carbs, protein, fats, calorie, grams,
+            meal_type, str(row['category']).strip(), recipe_link), None
+
+
+def upsert_food_chunk(conn, chunk):
+    # Upsert by (food_name, category): update the rows that already exist, insert the rest
+    keys = {(food[0], food[8]) for food in chunk}
+    existing = {}
+    key_list = list(keys)
+    for start in range(0, len(key_list), 400):  # Stay under SQLite's bound parameter limit
+        part = key_list[start:start + 400]
+        placeholders = ' OR '.join(['(food_name = ? AND category = ?)'] * len(part))
+        params = [value for key in part for value in key]
+        for row in conn.execute(f'SELECT food_id, food_name, category FROM foods WHERE {placeholders}', params):
+            existing[(row['food_name'], row['category'])] = row['food_id']
+
+    # Later rows with the same key win, like they would with row-by-row upserts
+    latest = {}
+    for food in chunk:
+        latest[(food[0], food[8])] = food
+
+    updates = [food + (existing[key],) for key, food in latest.items() if key in existing]
+    inserts = [food for key, food in latest.items() if key not in existing]
+    conn.executemany('UPDATE foods SET food_name = ?, type = ?, carbs = ?, protein = ?, fats = ?, calorie = ?, grams = ?, meal_type = ?, category = ?, recipe_link = ? WHERE food_id = ?',
+                     updates)
+    conn.executemany('INSERT INTO foods (' + ', '.join(FOOD_COLUMNS) + ') VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                     inserts)
+    conn.commit()
+    return len(inserts), len(updates)
+
+
+def read_ndjson_rows(stream):
+    # Yields (row, error) so one bad line doesn't stop the rest of the import
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield None, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(row, dict):
+            yield None, 'Row must be a JSON object'
+            continue
+        yield row, None
+
+
+# Route to bulk import foods from a CSV or NDJSON upload
+@app.route('/food/import', methods=['GET', 'POST'])
+def import_food():
+    if request.method == 'GET':
+        return render_template('import_food.html', report=None)
+
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        flash('Please choose a file to import.')
+        return redirect(url_for('import_food'))
+
+    import_format = request.form.get('format') or ('ndjson' if upload.filename.endswith(('.ndjson', '.jsonl')) else 'csv')
+    allow_new_types = request.form.get('allow_new_types') == 'on'
+
+    # Read the upload as a text stream so large files are never held in memory
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    rows = read_ndjson_rows(stream) if import_format == 'ndjson' else ((row, None) for row in csv.DictReader(stream))
+
+    report = {'inserted': 0, 'updated': 0, 'failed': 0, 'errors': []}
+    conn = get_db_connection()
+    try:
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_foods_name_category ON foods (food_name, category)')
+        # Trimmed spelling -> spelling stored in the catalog
+        known_types = {}
+        for type_row in conn.execute('SELECT DISTINCT type FROM foods ORDER BY type'):
+            known_types.setdefault(type_row['type'].strip(), type_row['type'])
+
+        chunk = []
+        row_number = 0
+        try:
+            for row_number, (row, error) in enumerate(rows, start=1):
+                food = None
+                if error is None:
+                    food, error = validate_food_row(row, known_types, allow_new_types)
+                if error:
+                    report['failed'] += 1
+                    if len(report['errors']) < MAX_REPORTED_ERRORS:
+                        report['errors'].append({'row': row_number, 'error': error})
+                    continue
+
+                chunk.append(food)
+                if len(chunk) >= IMPORT_CHUNK_SIZE:
+                    inserted, updated = upsert_food_chunk(conn, chunk)
+                    report['inserted'] += inserted
+                    report['updated'] += updated
+                    chunk = []
+        except (csv.Error, UnicodeDecodeError) as e:
+            # The rest of the file can't be read; keep what was already imported
+            report['failed'] += 1
+            report['errors'].append({'row': row_number + 1, 'error': f'Unreadable file from here on: {e}'})
+
+        if chunk:
+            inserted, updated = upsert_food_chunk(conn, chunk)
+            report['inserted'] += inserted
+            report['updated'] += updated
+    finally:
+        conn.close()
+
+    report['truncated'] = report['failed'] > len(report['errors'])
+    if request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json':
+        return report
+    return render_template('import_food.html', report=report)
+
 # Route to manage users
 @app.route('/user')
 def manage_user():
-    with get_db_connection() as conn:
-        users = conn.execute('SELECT * FROM tbl_users').fetchall()
-    return render_template('user.html', users=users)
+    conn = get_db_connection()
+    try:
+        users, pagination = paginate(
+            conn, 'tbl_users',
+            sortable=['user_id', 'username', 'firstname', 'lastname', 'age'],
+            searchable=['username', 'firstname', 'lastname'],
+            default_sort='user_id',
+        )
+    finally:
+        conn.close()
+    return render_template('user.html', users=users, pagination=pagination, cleanup=orphan_cleanup_job.status)
 
-# Route to delete a user
+# Route to delete a user together with their BMI, filtered foods, records and progress
 @app.route('/delete_user/<int:user_id>', methods=['POST'])
 def delete_user(user_id):
-    with get_db_connection() as conn:
-        conn.execute('DELETE FROM tbl_users WHERE user_id = ?', (user_id,))
-        conn.commit()
+    conn = get_db_connection()
+    try:
+        maintenance.delete_user_cascade(conn, user_id, archive_path=settings.archive_database_path)
+    finally:
+        conn.close()
     flash('User deleted successfully!')
     return redirect(url_for('manage_user'))
 
+
+def run_orphan_cleanup():
+    conn = get_db_connection()
+    try:
+        return maintenance.cleanup_orphans(conn, archive_path=settings.archive_database_path)
+    finally:
+        conn.close()
+
+orphan_cleanup_job = maintenance.BackgroundJob('orphan cleanup', run_orphan_cleanup)
+
+# Route to start removing rows that belong to users who no longer exist
+@app.route('/user/cleanup-orphans', methods=['POST'])
+def cleanup_orphans():
+    if orphan_cleanup_job.start():
+        flash('Orphan cleanup started in the background.')
+    else:
+        flash('Orphan cleanup is already running.')
+    return redirect(url_for('manage_user'))
+
 if __name__ == '__main__':
     app.run(debug=True)
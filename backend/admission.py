@@ -0,0 +1,138 @@
+import asyncio
+import json
+import math
+import time
+from starlette.routing import Match
+import metrics
+from cache import LRUCache
+from config import RouteLimit
+
+MAX_TRACKED_KEYS = 10000  # Token buckets kept per route; idle clients fall out first
+
+metrics.describe("admission_in_flight", "Requests currently running on a limited route")
+metrics.describe("admission_queue_depth", "Requests waiting for a concurrency slot")
+metrics.describe("admission_admitted_total", "Requests let through by admission control")
+metrics.describe("admission_shed_total", "Requests rejected by admission control")
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: int):
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, rate: float, burst: int):
+        # Returns 0 when a token was taken, otherwise the seconds until one is available
+        now = time.monotonic()
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / rate if rate > 0 else 60
+
+
+class RouteGate:
+    # Concurrency slots plus per-key token buckets for one route
+
+    def __init__(self, name: str, limit: RouteLimit):
+        self.name = name
+        self.limit = limit
+        self.buckets = LRUCache(maxsize=MAX_TRACKED_KEYS)
+        self.semaphore = None
+        self.waiting = 0
+
+    def check_rate(self, key: str):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.limit.burst)
+            self.buckets.set(key, bucket)
+        return bucket.take(self.limit.rate, self.limit.burst)
+
+    async def acquire(self):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.limit.concurrency)
+        if self.semaphore.locked() and self.waiting >= self.limit.queue:
+            return False
+        self.waiting += 1
+        metrics.set_gauge("admission_queue_depth", self.waiting, {"route": self.name})
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.limit.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+            metrics.set_gauge("admission_queue_depth", self.waiting, {"route": self.name})
+
+    def release(self):
+        self.semaphore.release()
+
+
+class AdmissionControlMiddleware:
+    """
+    Sheds load on expensive routes before it reaches the threadpool, so a burst
+    of bcrypt logins can't starve the cheap reads. Limits are keyed by
+    "METHOD /route/{template}" and only apply to the routes listed.
+    """
+
+    def __init__(self, app, routes, limits: dict):
+        self.app = app
+        self.routes = routes
+        self.gates = {name: RouteGate(name, limit) for name, limit in limits.items()}
+
+    def match(self, scope):
+        for route in self.routes:
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                name = f"{scope['method']} {route.path}"
+                return self.gates.get(name), child_scope.get("path_params", {})
+        return None, {}
+
+    async def reject(self, send, status: int, retry_after: float, detail: str):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.gates:
+            await self.app(scope, receive, send)
+            return
+        gate, path_params = self.match(scope)
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+
+        labels = {"route": gate.name}
+        if gate.limit.key == "user" and "user_id" in path_params:
+            key = f"user:{path_params['user_id']}"
+        else:
+            key = f"client:{scope['client'][0] if scope.get('client') else 'unknown'}"
+
+        wait = gate.check_rate(key)
+        if wait:
+            metrics.inc("admission_shed_total", {**labels, "reason": "rate"})
+            await self.reject(send, 429, wait, "Too many requests, slow down.")
+            return
+
+        if not await gate.acquire():
+            metrics.inc("admission_shed_total", {**labels, "reason": "concurrency"})
+            await self.reject(send, 503, gate.limit.queue_timeout, "Server busy, try again shortly.")
+            return
+
+        metrics.inc("admission_admitted_total", labels)
+        metrics.add_gauge("admission_in_flight", 1, labels)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            metrics.add_gauge("admission_in_flight", -1, labels)
+            gate.release()
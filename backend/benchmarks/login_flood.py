@@ -0,0 +1,123 @@
+"""
+Login-flood load test for admission control.
+
+Starts uvicorn on a throwaway copy of nutri.db, floods POST /login from many
+simulated clients (one X-Forwarded-For address each) and meanwhile times a
+steady stream of cheap reads. Runs once with admission control off and once
+with the default limits, and prints read latency percentiles plus how the
+logins were answered.
+
+    python benchmarks/login_flood.py --flooders 64 --seconds 10
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from startup import BACKEND_DIR, free_port
+
+USERNAME = "flood-test"
+PASSWORD = "flood-test-password"
+
+
+def percentile(samples, share):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+async def wait_until_up(client, timeout=60):
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            await client.get("/foods/1/similar")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.05)
+    raise RuntimeError("uvicorn did not start")
+
+
+async def flood_logins(client, address, deadline, outcomes):
+    headers = {"X-Forwarded-For": address}
+    while time.perf_counter() < deadline:
+        try:
+            response = await client.post("/login", json={"username": USERNAME, "password": PASSWORD}, headers=headers)
+            outcomes[response.status_code] += 1
+            if response.status_code in (429, 503):
+                # A well-behaved client honours Retry-After; a hostile one wouldn't, so only back off briefly
+                await asyncio.sleep(0.05)
+        except httpx.TransportError:
+            outcomes["error"] += 1
+
+
+async def time_reads(client, user_id, deadline, interval):
+    latencies = []
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await client.get(f"/records/{user_id}")
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def run_load(port, flooders, seconds):
+    limits = httpx.Limits(max_connections=flooders + 8)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=30, limits=limits) as client:
+        await wait_until_up(client)
+        await client.post("/register", json={"username": USERNAME, "password": PASSWORD, "firstname": "Flood", "lastname": "Test", "age": 30})
+        user_id = (await client.post("/login", json={"username": USERNAME, "password": PASSWORD}, headers={"X-Forwarded-For": "10.255.0.1"})).json()["user_id"]
+
+        baseline = await time_reads(client, user_id, time.perf_counter() + 2, 0.01)
+        outcomes = collections.Counter()
+        deadline = time.perf_counter() + seconds
+        flood = [flood_logins(client, f"10.0.{i // 250}.{i % 250 + 1}", deadline, outcomes) for i in range(flooders)]
+        results = await asyncio.gather(time_reads(client, user_id, deadline, 0.01), *flood)
+        return baseline, results[0], outcomes
+
+
+def run_case(label, env, flooders, seconds):
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning",
+         "--proxy-headers", "--forwarded-allow-ips", "127.0.0.1"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        baseline, loaded, outcomes = asyncio.run(run_load(port, flooders, seconds))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{label}:")
+    for name, samples in (("idle", baseline), ("flood", loaded)):
+        print(f"  reads {name:5}: n={len(samples):5}  p50 {percentile(samples, 0.5) * 1000:7.1f} ms  p99 {percentile(samples, 0.99) * 1000:7.1f} ms")
+    print("  logins: " + ", ".join(f"{status}={count}" for status, count in sorted(outcomes.items(), key=str)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--flooders", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        env = dict(os.environ)
+        env["NUTRI_DATABASE_PATH"] = os.path.join(scratch, "nutri.db")
+        env["NUTRI_ARCHIVE_DATABASE_PATH"] = os.path.join(scratch, "nutri_archive.db")
+        shutil.copy(os.path.join(BACKEND_DIR, "nutri.db"), env["NUTRI_DATABASE_PATH"])
+        subprocess.run([sys.executable, "maintenance.py", "--db", env["NUTRI_DATABASE_PATH"], "init-db"],
+                       cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+        run_case("admission control off", {**env, "NUTRI_ROUTE_LIMITS": json.dumps({})}, args.flooders, args.seconds)
+        run_case("default route limits", env, args.flooders, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
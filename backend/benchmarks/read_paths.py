@@ -0,0 +1,133 @@
+"""
+ORM vs Core read-path benchmark.
+
+Fills a throwaway copy of nutri.db with --rows records and filtered foods for
+one user, then times the old ORM read (query().all() plus building response
+models from the entities) against queries.py (Core select() plus one
+validation pass of plain rows, which is what FastAPI then does with them).
+Reports rows per second and peak Python memory per 10k rows.
+
+    python benchmarks/read_paths.py --rows 10000 --runs 5
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(database_path, rows):
+    conn = sqlite3.connect(database_path)
+    conn.execute("INSERT INTO tbl_users (username, hashed_password, firstname, lastname, age) VALUES ('bench-reads', 'x', 'Bench', 'Reads', 30)")
+    user_id = conn.execute("SELECT user_id FROM tbl_users WHERE username = 'bench-reads'").fetchone()[0]
+    food_id = conn.execute("SELECT food_id FROM foods LIMIT 1").fetchone()[0]
+    conn.executemany(
+        "INSERT INTO filtered_foods (user_id, food_id, food_name, type, carbs, protein, fats, calorie, grams, meal_type, category) "
+        "VALUES (?, ?, ?, 'Meat', '12g', '8g', '4g', 180, 100, 'Lunch', 'Main')",
+        [(user_id, food_id, f"food {i}") for i in range(rows)],
+    )
+    conn.executemany(
+        "INSERT INTO records (user_id, food_name, type, carbs, protein, fats, calorie, grams, meal_type, category, consumed_at, local_date) "
+        "VALUES (?, ?, 'Meat', 12, 8, 4, 180, 100, 'Lunch', 'Main', '2025-01-01 12:00:00.000000', '2025-01-01')",
+        [(user_id, f"food {i}") for i in range(rows)],
+    )
+    conn.commit()
+    conn.close()
+    return user_id
+
+
+def orm_records(db, user_id):
+    from models import Record
+    import schemas
+    return [
+        schemas.RecordResponse(
+            record_id=record.record_id, user_id=record.user_id, filtered_id=record.filtered_food_id,
+            food_name=record.food_name, type=record.type, carbs=record.carbs, protein=record.protein,
+            fats=record.fats, calorie=record.calorie, grams=record.grams, meal_type=record.meal_type,
+            category=record.category, consumed_at=record.consumed_at, local_date=record.local_date,
+        )
+        for record in db.query(Record).filter(Record.user_id == user_id).all()
+    ]
+
+
+def orm_filtered_foods(db, user_id):
+    from models import FilteredFood
+    from schemas import FilteredFoodResponse
+    parse = lambda value: int(float(value.replace('g', '').strip())) if isinstance(value, str) else value
+    return [
+        FilteredFoodResponse(
+            filtered_id=entry.filtered_id, food_name=entry.food_name, calories=entry.calorie, type=entry.type,
+            grams=entry.grams, categories=entry.category, mealtype=entry.meal_type, carbs=parse(entry.carbs),
+            protein=parse(entry.protein), fats=parse(entry.fats), recipe_link=entry.recipe_link,
+        )
+        for entry in db.query(FilteredFood).filter(FilteredFood.user_id == user_id).all()
+    ]
+
+
+def core_path(read, model):
+    from pydantic import TypeAdapter
+    adapter = TypeAdapter(List[model])
+    return lambda db, user_id: adapter.validate_python(read(db, user_id))
+
+
+def measure(session_factory, read, user_id, runs):
+    timings = []
+    for _ in range(runs):
+        db = session_factory()
+        started = time.perf_counter()
+        rows = read(db, user_id)
+        timings.append(time.perf_counter() - started)
+        db.close()
+
+    db = session_factory()
+    tracemalloc.start()
+    read(db, user_id)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    db.close()
+    return len(rows), statistics.median(timings), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        database_path = os.path.join(scratch, "nutri.db")
+        shutil.copy(os.path.join(BACKEND_DIR, "nutri.db"), database_path)
+        subprocess.run([sys.executable, "maintenance.py", "--db", database_path, "init-db"],
+                       cwd=BACKEND_DIR, check=True, stdout=subprocess.DEVNULL)
+        user_id = seed(database_path, args.rows)
+
+        sys.path.insert(0, BACKEND_DIR)
+        os.environ["NUTRI_DATABASE_PATH"] = database_path
+        os.environ["NUTRI_ARCHIVE_DATABASE_PATH"] = os.path.join(scratch, "nutri_archive.db")
+        import config
+        import database
+        import queries
+        import schemas
+        database.init_engine(config.get_settings())
+
+        cases = [
+            ("records", orm_records, core_path(queries.get_records, schemas.RecordResponse)),
+            ("filtered foods", orm_filtered_foods, core_path(queries.get_filtered_foods, schemas.FilteredFoodResponse)),
+        ]
+        for name, orm_read, core_read in cases:
+            for label, read in (("orm", orm_read), ("core", core_read)):
+                count, seconds, peak = measure(database.SessionLocal, read, user_id, args.runs)
+                print(f"{name:15} {label:5} {count / seconds:10,.0f} rows/s   {peak / count * 10000 / 1e6:6.1f} MB peak per 10k rows")
+        database.dispose_engine()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Startup-time benchmark for the API.
+
+Measures how long `import main` takes in a fresh interpreter and how long a
+multi-worker uvicorn deployment takes to answer its first request. Runs
+against a throwaway copy of nutri.db so the real database is never touched.
+
+    python benchmarks/startup.py --workers 1 2 4 --runs 5
+"""
+import argparse
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_import(env):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-W", "ignore", "-c", "import main"], cwd=BACKEND_DIR, env=env, check=True)
+    return time.perf_counter() - started
+
+
+def time_first_request(env, workers, timeout=60):
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/foods", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError(f"uvicorn with {workers} workers did not answer within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        env = dict(os.environ)
+        env["NUTRI_DATABASE_PATH"] = os.path.join(scratch, "nutri.db")
+        env["NUTRI_ARCHIVE_DATABASE_PATH"] = os.path.join(scratch, "nutri_archive.db")
+        shutil.copy(os.path.join(BACKEND_DIR, "nutri.db"), env["NUTRI_DATABASE_PATH"])
+
+        imports = [time_import(env) for _ in range(args.runs)]
+        print(f"import main: median {statistics.median(imports) * 1000:.0f} ms over {args.runs} runs")
+
+        for workers in args.workers:
+            firsts = [time_first_request(env, workers) for _ in range(args.runs)]
+            print(f"{workers} worker(s): first request after median {statistics.median(firsts) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+import metrics
+
+
+class LRUCache:
+    """
+    Small thread-safe LRU map. Sync endpoints run in a threadpool, so every
+    access goes through the lock.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.data:
+                return default
+            self.data.move_to_end(key)
+            return self.data[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            return self.data.pop(key, default)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
+
+
+class MemoryBackend:
+    """
+    In-process cache backend: an LRUCache whose entries also expire. Each
+    worker has its own; that only costs hit rate, since keys carry the data
+    version and another worker's write moves readers to a new key.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self.entries = LRUCache(maxsize=maxsize)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires is not None and time.monotonic() >= expires:
+            self.entries.pop(key)
+            return None
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        self.entries.set(key, (time.monotonic() + ttl if ttl else None, value))
+
+
+class RedisBackend:
+    """
+    Shared backend over anything that speaks the redis-py client API (get and
+    set with ex=), e.g. redis.Redis or a local stand-in. Values are stored as JSON.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("NUTRI_CACHE_BACKEND=redis needs the redis package installed")
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key):
+        value = self.client.get(key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value, ttl: float = None):
+        self.client.set(key, json.dumps(value), ex=math.ceil(ttl) if ttl else None)
+
+
+class ResponseCache:
+    """
+    Cache of read responses keyed by their ETag. The ETag comes from the
+    user's data version in the database, which every writer bumps (API
+    endpoints on any worker, the archive job, user deletion), so a write
+    moves readers to a new key and the old entry just ages out. Nothing has
+    to be invalidated, and 304s are decided from the database, never from here.
+    """
+
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+
+    def key(self, resource: str, etag: str):
+        return f"resp:{resource}:{etag}"
+
+    def get(self, key: str, resource: str):
+        value = self.backend.get(key)
+        metrics.inc("response_cache_requests_total", {"resource": resource, "result": "miss" if value is None else "hit"})
+        return value
+
+    def set(self, key: str, value):
+        self.backend.set(key, value, self.ttl)
+
+
+def hit_ratios():
+    # resource -> hits / lookups since the worker started
+    lookups = {}
+    with metrics.lock:
+        for (name, labels), value in metrics.counters.items():
+            if name == "response_cache_requests_total":
+                labels = dict(labels)
+                hits, total = lookups.get(labels["resource"], (0, 0))
+                lookups[labels["resource"]] = (hits + (value if labels["result"] == "hit" else 0), total + value)
+    return {resource: hits / total for resource, (hits, total) in lookups.items() if total}
+
+
+metrics.describe("response_cache_requests_total", "Per-user response cache lookups by result")
+metrics.describe("response_cache_hit_ratio", "Share of per-user response cache lookups that hit")
+
+response_cache = ResponseCache(MemoryBackend(), ttl=60)
+
+
+def configure_response_cache(settings):
+    global response_cache
+    if settings.cache_backend == "redis":
+        backend = RedisBackend.from_url(settings.cache_redis_url)
+    else:
+        backend = MemoryBackend(maxsize=settings.cache_max_entries)
+    response_cache = ResponseCache(backend, ttl=settings.cache_ttl_seconds)
+    return response_cache
+
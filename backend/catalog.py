@@ -0,0 +1,67 @@
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.orm import Session
+import queries
+from models import Food, FoodChange
+
+# The catalog version is the change_id of the last food_changes row: the triggers on foods write
+# one per insert, update and delete from any writer, and AUTOINCREMENT never hands an id out twice.
+
+CHANGES_PAGE_SIZE = 1000  # Log rows per response by default
+MAX_CHANGES_PAGE_SIZE = 5000  # Also keeps the IN (...) below SQLite's bound-parameter limit
+
+CATALOG_VERSION = select(func.coalesce(func.max(FoodChange.change_id), 0))
+
+CHANGES_SINCE = (
+    select(FoodChange.change_id, FoodChange.food_id, FoodChange.changed_at)
+    .where(FoodChange.change_id > bindparam("since"))
+    .order_by(FoodChange.change_id)
+    .limit(bindparam("limit"))
+)
+
+FOODS_BY_ID = select(Food.__table__).where(Food.food_id.in_(bindparam("food_ids", expanding=True)))
+
+
+def get_catalog_version(db: Session):
+    return db.execute(CATALOG_VERSION).scalar()
+
+
+def get_catalog_changes(db: Session, since: int = None, limit: int = CHANGES_PAGE_SIZE):
+    """
+    Foods inserted or updated and tombstones for foods deleted after catalog
+    version `since`, at most `limit` log entries at a time (`has_more` says
+    whether to ask again from the returned version). Without `since`, or with
+    one newer than the server's (a restored database), the whole catalog comes
+    back with `reset` set and the client replaces its copy.
+    """
+    # Read before the rows, so anything written in between is sent again next time rather than missed
+    version = get_catalog_version(db)
+    if since is None or since > version:
+        return {"version": version, "reset": True, "has_more": False, "foods": queries.get_foods(db), "deleted": []}
+
+    changes = db.execute(CHANGES_SINCE, {"since": since, "limit": limit + 1}).all()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    # Only the latest change per food matters; what it is now decides between a row and a tombstone
+    latest = {}
+    for change_id, food_id, changed_at in changes:
+        latest[food_id] = (change_id, changed_at)
+    current = {}
+    if latest:
+        current = {row["food_id"]: dict(row) for row in db.execute(FOODS_BY_ID, {"food_ids": list(latest)}).mappings()}
+
+    foods, deleted = [], []
+    for food_id, (change_id, changed_at) in sorted(latest.items(), key=lambda item: item[1][0]):
+        row = current.get(food_id)
+        if row is not None:
+            foods.append({**row, "version": change_id, "updated_at": changed_at})
+        else:
+            deleted.append({"food_id": food_id, "version": change_id, "deleted_at": changed_at})
+
+    return {
+        "version": changes[-1].change_id if changes else since,
+        "reset": False,
+        "has_more": has_more,
+        "foods": foods,
+        "deleted": deleted,
+    }
@@ -0,0 +1,75 @@
+from fastapi import HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from sqlalchemy.orm import Session
+import cache
+import crud
+
+
+def version_validators(db: Session, user_id: int, resource: str, *variant, not_before: datetime = None):
+    """
+    Build an ETag and Last-Modified for a user's resource from its change counter.
+    `variant` covers anything else the response depends on (query flags, today's date).
+    A response that moves on to a new day by itself passes the start of that day
+    as `not_before`, so If-Modified-Since from yesterday no longer matches.
+    """
+    data_version = crud.get_data_version(db, user_id, resource)
+    version = data_version.version if data_version else 0
+    last_modified = data_version.updated_at.replace(tzinfo=timezone.utc) if data_version else None
+    if last_modified:
+        # Counters start again for a re-created user whose id was reused; the write time keeps their tags apart
+        version = f"{version}.{int(last_modified.timestamp() * 1000000):x}"
+        if not_before and not_before > last_modified:
+            last_modified = not_before.astimezone(timezone.utc)
+    # Weak, because GZip changes the bytes but not the meaning of the body
+    etag = 'W/"' + "-".join(str(part) for part in (resource, user_id, version, *variant)) + '"'
+    return etag, last_modified
+
+
+def validator_headers(etag: str, last_modified: datetime | None):
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if last_modified:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    return headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime | None):
+    # If-None-Match wins over If-Modified-Since (RFC 9110 13.2.2)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        # Weak comparison: W/"x" and "x" match each other
+        return "*" in tags or etag.removeprefix("W/") in [tag.removeprefix("W/") for tag in tags]
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def cached_response(request: Request, http_response: Response, resource: str, etag: str, last_modified: datetime | None,
+                    load, missing: str):
+    """
+    Answer a read whose validators are already known: 304 if the client's copy
+    matches, else the body from the response cache or `load()`. An empty body
+    is a 404 with `missing` as the detail (cached as well).
+    """
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=validator_headers(etag, last_modified))
+
+    key = cache.response_cache.key(resource, etag)
+    entry = cache.response_cache.get(key, resource)
+    if entry is None:
+        entry = {"body": jsonable_encoder(load() or None)}
+        cache.response_cache.set(key, entry)
+    if entry["body"] is None:
+        raise HTTPException(status_code=404, detail=missing)
+    http_response.headers.update(validator_headers(etag, last_modified))
+    return entry["body"]
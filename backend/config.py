@@ -0,0 +1,104 @@
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# Resolved against this file, not the working directory, so uvicorn can be started from anywhere
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_ORIGINS = [
+    "http://localhost:8081",
+    "http://localhost",
+    "http://127.0.0.1",
+    "http://192.168.1.5",
+]
+
+@dataclass
+class RouteLimit:
+    concurrency: int  # Requests running at once
+    queue: int  # Requests allowed to wait for a slot; the rest get 503 straight away
+    queue_timeout: float  # Seconds a queued request waits before giving up with 503
+    rate: float  # Token bucket refill per second, per key
+    burst: int  # Token bucket size
+    key: str = "client"  # "client" (remote address) or "user" (the user_id path parameter)
+
+
+# bcrypt is CPU-bound, so running more hashes at once than half the cores only slows every other request down
+PASSWORD_HASH_SLOTS = max(1, (os.cpu_count() or 2) // 2)
+
+# Admission control per "METHOD /route"; anything not listed is never limited.
+# bcrypt makes register/login the expensive calls, so they get few slots and a short queue.
+DEFAULT_ROUTE_LIMITS = {
+    "POST /register": RouteLimit(concurrency=PASSWORD_HASH_SLOTS, queue=4 * PASSWORD_HASH_SLOTS, queue_timeout=2.0, rate=0.2, burst=5),
+    "POST /login": RouteLimit(concurrency=PASSWORD_HASH_SLOTS, queue=4 * PASSWORD_HASH_SLOTS, queue_timeout=2.0, rate=1.0, burst=10),
+    # Hashes on every core, so one batch at a time
+    "POST /users/bulk": RouteLimit(concurrency=1, queue=2, queue_timeout=30.0, rate=0.1, burst=5),
+    "POST /filter-foods/{user_id}": RouteLimit(concurrency=2, queue=4, queue_timeout=2.0, rate=0.1, burst=3, key="user"),
+}
+
+
+@dataclass
+class Settings:
+    database_path: str = os.path.join(BACKEND_DIR, "nutri.db")
+    archive_database_path: str = os.path.join(BACKEND_DIR, "nutri_archive.db")
+    pool_size: int = 5
+    max_overflow: int = 10
+    cors_origins: List[str] = field(default_factory=lambda: list(DEFAULT_ORIGINS))
+    # Off by default: schema changes go through `python maintenance.py init-db`
+    init_db_on_startup: bool = False
+    route_limits: Dict[str, RouteLimit] = field(default_factory=lambda: dict(DEFAULT_ROUTE_LIMITS))
+    # Guards the /admin API endpoints; they answer 404 while it's unset
+    admin_token: Optional[str] = None
+    # Share of requests profiled at random; requests sending the admin token in X-Profile-Token always are
+    profile_sample_rate: float = 0.0
+    profile_directory: str = os.path.join(BACKEND_DIR, "profiles")
+    profile_keep: int = 100
+    # Per-user response cache: "memory" (per worker) or "redis" (shared between workers, needs the redis package)
+    cache_backend: str = "memory"
+    cache_redis_url: str = "redis://localhost:6379/0"
+    cache_ttl_seconds: float = 60.0
+    cache_max_entries: int = 10000
+    # Snapshots from `python maintenance.py backup` and POST /admin/backups
+    backup_directory: str = os.path.join(BACKEND_DIR, "backups")
+    backup_keep: int = 7
+
+    @property
+    def database_url(self):
+        return f"sqlite:///{self.database_path}"
+
+    @property
+    def archive_database_url(self):
+        return f"sqlite:///{self.archive_database_path}"
+
+
+def get_settings():
+    # NUTRI_* environment variables override the defaults; a .env file is honoured when python-dotenv is installed
+    try:
+        from dotenv import load_dotenv
+        load_dotenv(os.path.join(BACKEND_DIR, ".env"))
+    except ImportError:
+        pass
+
+    settings = Settings()
+    settings.database_path = os.environ.get("NUTRI_DATABASE_PATH", settings.database_path)
+    settings.archive_database_path = os.environ.get("NUTRI_ARCHIVE_DATABASE_PATH", settings.archive_database_path)
+    settings.pool_size = int(os.environ.get("NUTRI_POOL_SIZE", settings.pool_size))
+    settings.max_overflow = int(os.environ.get("NUTRI_MAX_OVERFLOW", settings.max_overflow))
+    if os.environ.get("NUTRI_CORS_ORIGINS"):
+        settings.cors_origins = [origin.strip() for origin in os.environ["NUTRI_CORS_ORIGINS"].split(",") if origin.strip()]
+    settings.init_db_on_startup = os.environ.get("NUTRI_INIT_DB_ON_STARTUP", "").lower() in ("1", "true", "yes")
+    settings.admin_token = os.environ.get("NUTRI_ADMIN_TOKEN") or None
+    settings.profile_sample_rate = float(os.environ.get("NUTRI_PROFILE_SAMPLE_RATE", settings.profile_sample_rate))
+    settings.profile_directory = os.environ.get("NUTRI_PROFILE_DIRECTORY", settings.profile_directory)
+    settings.profile_keep = int(os.environ.get("NUTRI_PROFILE_KEEP", settings.profile_keep))
+    settings.cache_backend = os.environ.get("NUTRI_CACHE_BACKEND", settings.cache_backend)
+    settings.cache_redis_url = os.environ.get("NUTRI_CACHE_REDIS_URL", settings.cache_redis_url)
+    settings.cache_ttl_seconds = float(os.environ.get("NUTRI_CACHE_TTL_SECONDS", settings.cache_ttl_seconds))
+    settings.cache_max_entries = int(os.environ.get("NUTRI_CACHE_MAX_ENTRIES", settings.cache_max_entries))
+    settings.backup_directory = os.environ.get("NUTRI_BACKUP_DIRECTORY", settings.backup_directory)
+    settings.backup_keep = int(os.environ.get("NUTRI_BACKUP_KEEP", settings.backup_keep))
+    if "NUTRI_ROUTE_LIMITS" in os.environ:
+        # JSON like {"POST /login": {"concurrency": 4, "queue": 16, "queue_timeout": 2, "rate": 1, "burst": 10}}; {} turns limiting off
+        limits = json.loads(os.environ["NUTRI_ROUTE_LIMITS"] or "{}")
+        settings.route_limits = {route: RouteLimit(**limit) for route, limit in limits.items()}
+    return settings
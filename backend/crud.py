@@ -1,14 +1,70 @@
 from sqlalchemy.orm import Session
-from models import User, BMI, Recommendation, Food, FilteredFood,Progress
-from schemas import UserCreate, BMICreate, FoodFilter, FilteredFoodResponse,ProgressResponse  
-from passlib.context import CryptContext
+from models import User, BMI, Recommendation, Food, FilteredFood,Progress, UserDataVersion, UserFoodFilter, DEFAULT_TIMEZONE
+from schemas import UserCreate, BMICreate, FoodFilter, FilteredFoodResponse,ProgressResponse, DailyCaloriesResponse
 from fastapi import HTTPException
 import logging
+import os
 from datetime import date 
 from sqlalchemy.orm import joinedload
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import datetime
+import database
+from functools import lru_cache
+import pytz
 
-# Initialize password context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# consumed_at has always been stored as Manila wall-clock time
+STORAGE_TIMEZONE = pytz.timezone('Asia/Manila')
+
+# Password context is built on first use; importing passlib and loading bcrypt slows worker boot
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def bump_data_version(db: Session, user_id: int, *resources: str):
+    # Runs inside the caller's transaction so the version moves together with the data
+    bump_data_versions(db, [user_id], *resources)
+
+def bump_data_versions(db: Session, user_ids, *resources: str):
+    # One executemany for many users, e.g. a bulk registration
+    now = datetime.utcnow()
+    statement = sqlite_insert(UserDataVersion)
+    rows = [{"user_id": user_id, "resource": resource, "version": 1, "updated_at": now} for user_id in user_ids for resource in resources]
+    if rows:
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[UserDataVersion.user_id, UserDataVersion.resource],
+            set_={"version": UserDataVersion.version + 1, "updated_at": statement.excluded.updated_at},
+        ), rows)
+
+def get_data_version(db: Session, user_id: int, resource: str):
+    return db.query(UserDataVersion).filter(UserDataVersion.user_id == user_id, UserDataVersion.resource == resource).first()
+
+def validate_timezone(timezone: str):
+    if timezone not in pytz.all_timezones_set:
+        raise HTTPException(status_code=400, detail=f"Unknown timezone '{timezone}'.")
+    return timezone
+
+def get_user_timezone(user: User):
+    return pytz.timezone(user.timezone or DEFAULT_TIMEZONE)
+
+def user_today(user: User):
+    # "Today" is the user's calendar day, not the server's
+    return datetime.now(get_user_timezone(user)).date()
+
+def local_day_start(user: User, day: date):
+    # Midnight at the start of `day` in the user's timezone, as an aware datetime
+    return get_user_timezone(user).localize(datetime.combine(day, datetime.min.time()))
+
+def to_storage_time(consumed_at: datetime):
+    if consumed_at.tzinfo is None:
+        return consumed_at
+    return consumed_at.astimezone(STORAGE_TIMEZONE)
+
+def local_date_for(user: User, consumed_at: datetime):
+    if consumed_at.tzinfo is None:
+        consumed_at = STORAGE_TIMEZONE.localize(consumed_at)
+    return consumed_at.astimezone(get_user_timezone(user)).date()
 
 def get_user_by_username(db: Session, username: str):
     user = db.query(User).filter(User.username == username).first()
@@ -16,13 +72,14 @@ def get_user_by_username(db: Session, username: str):
     return user
 
 def create_user(db: Session, user: UserCreate):
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = get_pwd_context().hash(user.password)
     db_user = User(
         username=user.username,
         hashed_password=hashed_password,
         firstname=user.firstname,
         lastname=user.lastname,
-        age=user.age
+        age=user.age,
+        timezone=validate_timezone(user.timezone) if user.timezone else DEFAULT_TIMEZONE
     )
     db.add(db_user)
     db.commit()
@@ -32,15 +89,17 @@ def create_user(db: Session, user: UserCreate):
 def calculate_bmi(weight: float, height: float) -> float:
     return weight / (height ** 2)
 
-def create_bmi_record(db: Session, bmi_data: BMICreate):
-    bmi_value = calculate_bmi(bmi_data.weight, bmi_data.height)
-
+def recommendation_id_for(bmi_value: float):
     if bmi_value < 18.5:
-        recommendation_id = 1
+        return 1
     elif 18.5 <= bmi_value <= 24.9:
-        recommendation_id = 2
+        return 2
     else:
-        recommendation_id = 3
+        return 3
+
+def create_bmi_record(db: Session, bmi_data: BMICreate):
+    bmi_value = calculate_bmi(bmi_data.weight, bmi_data.height)
+    recommendation_id = recommendation_id_for(bmi_value)
 
     db_bmi = BMI(
         height=bmi_data.height,
@@ -50,6 +109,7 @@ def create_bmi_record(db: Session, bmi_data: BMICreate):
         recommendation_id=recommendation_id
     )
     db.add(db_bmi)
+    bump_data_version(db, bmi_data.user_id, "progress", "bmi")  # Today's progress carries the daily calorie target
     db.commit()
     db.refresh(db_bmi)
     return db_bmi
@@ -57,23 +117,23 @@ def create_bmi_record(db: Session, bmi_data: BMICreate):
 def get_bmi_records_by_user(db: Session, user_id: int):
     return db.query(BMI).filter(BMI.user_id == user_id).first()
 
+# FoodFilter answer -> the food type it rules out
+ALLERGEN_FOOD_TYPES = {
+    'pork': 'Pork',
+    'allergic_to_milk': 'Milk',
+    'allergic_to_fish': 'Fish',
+    'allergic_to_soy': 'Soy',
+    'allergic_to_chicken': 'Chicken',
+    'allergic_to_mussels': 'Mussels',
+    'allergic_to_beef': 'Beef',
+}
+
+def excluded_food_types(answer: FoodFilter):
+    return [food_type for field, food_type in ALLERGEN_FOOD_TYPES.items() if getattr(answer, field)]
+
 def filter_foods(db: Session, answer: FoodFilter, user_id: int):
-    filters = []
-
-    if answer.pork:
-        filters.append(Food.type != 'Pork')
-    if answer.allergic_to_milk:
-        filters.append(Food.type != 'Milk')
-    if answer.allergic_to_fish:
-        filters.append(Food.type != 'Fish')
-    if answer.allergic_to_soy:
-        filters.append(Food.type != 'Soy')
-    if answer.allergic_to_chicken:
-        filters.append(Food.type != 'Chicken')
-    if answer.allergic_to_mussels:
-        filters.append(Food.type != 'Mussels')
-    if answer.allergic_to_beef:
-        filters.append(Food.type != 'Beef')
+    excluded_types = excluded_food_types(answer)
+    filters = [Food.type != food_type for food_type in excluded_types]
 
     try:
         query = db.query(Food)
@@ -106,6 +166,14 @@ def filter_foods(db: Session, answer: FoodFilter, user_id: int):
             db.flush()  
             filtered_food_entries.append(filtered_food_entry)
 
+        # Kept so other endpoints can honour the answers without guessing them from filtered_foods
+        db.execute(sqlite_insert(UserFoodFilter).values(
+            user_id=user_id, excluded_types=",".join(excluded_types), updated_at=datetime.utcnow(),
+        ).on_conflict_do_update(
+            index_elements=[UserFoodFilter.user_id],
+            set_={"excluded_types": ",".join(excluded_types), "updated_at": datetime.utcnow()},
+        ))
+        bump_data_version(db, user_id, "filtered_foods")
         db.commit()  
         return filtered_food_entries  
     except Exception as e:
@@ -139,6 +207,35 @@ def get_filtered_foods(db: Session, user_id: int):
     return response
 
 
+def get_archived_records(user_id: int, start_date: date = None, end_date: date = None):
+    # Records moved out by the retention job live in a separate database file
+    if not os.path.exists(database.archive_engine.url.database):
+        return []
+    query = "SELECT * FROM records WHERE user_id = :user_id"
+    # The user's local day, as for live records (maintenance.ensure_archive_schema fills it in for older archives)
+    if start_date:
+        query += " AND local_date >= :start_date"
+    if end_date:
+        query += " AND local_date <= :end_date"
+    with database.archive_engine.connect() as conn:
+        return conn.execute(
+            text(query + " ORDER BY record_id"),
+            {"user_id": user_id, "start_date": str(start_date), "end_date": str(end_date)},
+        ).mappings().all()
+
+
+def get_excluded_food_types(db: Session, user_id: int):
+    # The types ruled out by the user's latest /filter-foods answers
+    stored = db.query(UserFoodFilter.excluded_types).filter(UserFoodFilter.user_id == user_id).scalar()
+    if stored is not None:
+        return set(stored.split(",")) - {""}
+    # Answered before the answers were stored: guess from the filtered foods until they answer again
+    kept_types = {row[0] for row in db.query(FilteredFood.type).filter(FilteredFood.user_id == user_id).distinct()}
+    if not kept_types:
+        return set()
+    return {food_type for food_type in ALLERGEN_FOOD_TYPES.values() if food_type not in kept_types}
+
+
 def get_latest_bmi_record_for_user(db: Session, user_id: int):
     return db.query(BMI).filter(BMI.user_id == user_id).order_by(BMI.bmi_id.desc()).first()
 
@@ -151,12 +248,38 @@ def get_recommendation(db: Session, bmi: float):
         return db.query(Recommendation).filter(Recommendation.id == 3).first()
 
 
+def get_today_progress(db: Session, user: User, today: date = None):
+    # Today's totals together with the daily target from the latest BMI, or None if nothing was logged yet
+    today = today or user_today(user)
+    progress = db.query(Progress).filter(Progress.user_id == user.user_id, Progress.date == today).first()
+    if not progress:
+        return None
+
+    bmi_record = db.query(BMI).options(joinedload(BMI.recommendation)).filter(BMI.user_id == user.user_id).order_by(BMI.bmi_id.desc()).first()
+    if bmi_record and bmi_record.recommendation:
+        bmi_response = DailyCaloriesResponse(daily_calories=bmi_record.recommendation.daily_calories)
+    else:
+        bmi_response = DailyCaloriesResponse(daily_calories=2000)
+
+    return ProgressResponse(
+        progress_id=progress.progress_id,
+        user_id=progress.user_id,
+        filtered_id=progress.filtered_id,
+        total_calories=progress.total_calories,
+        date=progress.date,
+        bmi=bmi_response
+    )
+
+
 def update_progress(db: Session, user_id: int, filtered_id: int):
     food = db.query(FilteredFood).filter(FilteredFood.filtered_id == filtered_id).first()
     if not food:
         raise HTTPException(status_code=404, detail="Filtered food not found.")
 
-    today = date.today()
+    user = db.query(User).filter(User.user_id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found.")
+    today = user_today(user)
 
     progress = db.query(Progress).filter(Progress.user_id == user_id, Progress.date == today).first()
 
@@ -180,6 +303,7 @@ def update_progress(db: Session, user_id: int, filtered_id: int):
         db.add(new_progress)
         progress = new_progress
 
+    bump_data_version(db, user_id, "progress")
     db.commit()
     db.refresh(progress)
     
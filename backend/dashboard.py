@@ -0,0 +1,68 @@
+import time
+from datetime import datetime
+import pytz
+from sqlalchemy.orm import Session
+import crud
+import queries
+from cache import LRUCache
+
+DASHBOARD_TTL_SECONDS = 30
+HOT_USERS = 1024  # Dashboards kept per worker
+# Every write the dashboard shows bumps one of these (BMI updates bump "progress")
+DASHBOARD_RESOURCES = ("filtered_foods", "progress", "records")
+
+dashboard_cache = LRUCache(maxsize=HOT_USERS)
+
+
+def build_dashboard(db: Session, user_id: int):
+    # Four queries on one session: user + latest BMI + plan, today's progress, filtered foods, today's records
+    user = queries.get_user_with_latest_bmi(db, user_id)
+    if user is None:
+        return None
+    today = crud.user_today(user)
+
+    progress = queries.get_progress_on_day(db, user_id, today)
+    daily_calories = user.daily_calories if user.daily_calories is not None else queries.DEFAULT_DAILY_CALORIES
+    if progress is not None:
+        progress["bmi"] = {"daily_calories": daily_calories}
+
+    return {
+        "date": today,
+        "user": {
+            "user_id": user.user_id,
+            "username": user.username,
+            "firstname": user.firstname,
+            "lastname": user.lastname,
+            "age": user.age,
+            "timezone": user.timezone or crud.DEFAULT_TIMEZONE,
+        },
+        "bmi": {"bmi_id": user.bmi_id, "height": user.height, "weight": user.weight, "bmi": user.bmi} if user.bmi_id else None,
+        "recommendation": {"daily_calories": user.daily_calories, "plan": user.plan} if user.plan is not None else None,
+        "daily_calories": daily_calories,
+        "progress_today": progress,
+        "filtered_foods": queries.get_filtered_foods(db, user_id),
+        "records_today": queries.get_records(db, user_id, today, today),
+    }
+
+
+def get_dashboard(db: Session, user_id: int):
+    """
+    The dashboard from the per-user cache when it is younger than the TTL and
+    none of the user's data versions moved since, otherwise rebuilt. The version
+    check is one indexed read, so writes made on other workers show up at once.
+    """
+    versions = queries.get_data_versions(db, user_id)
+    stamp = tuple(versions.get(resource, 0) for resource in DASHBOARD_RESOURCES)
+
+    cached = dashboard_cache.get(user_id)
+    if cached is not None:
+        expires, cached_stamp, dashboard = cached
+        # A new local day changes "today", so the date is part of the check
+        today = datetime.now(pytz.timezone(dashboard["user"]["timezone"])).date()
+        if time.monotonic() < expires and cached_stamp == stamp and dashboard["date"] == today:
+            return dashboard
+
+    dashboard = build_dashboard(db, user_id)
+    if dashboard is not None:
+        dashboard_cache.set(user_id, (time.monotonic() + DASHBOARD_TTL_SECONDS, stamp, dashboard))
+    return dashboard
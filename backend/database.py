@@ -1,11 +1,48 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./nutri.db"
+# Engines are created by init_engine() when the app starts, never at import time
+engine = None
+# Raw records moved out by the retention job (see maintenance.py)
+archive_engine = None
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 
 Base = declarative_base()
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # Only takes effect on a brand-new database; existing ones are switched once
+    # with `python maintenance.py enable-incremental-vacuum`
+    dbapi_connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+
+def init_engine(settings):
+    global engine, archive_engine
+    engine = create_engine(
+        settings.database_url,
+        connect_args={"check_same_thread": False},
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+    )
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    archive_engine = create_engine(settings.archive_database_url, connect_args={"check_same_thread": False})
+    SessionLocal.configure(bind=engine)
+    return engine
+
+
+def dispose_engine():
+    global engine, archive_engine
+    if engine is not None:
+        engine.dispose()
+    if archive_engine is not None:
+        archive_engine.dispose()
+    engine = None
+    archive_engine = None
+
+
+def init_db(bind=None):
+    # Creates any missing tables; models are imported here so they register on Base
+    import models  # noqa: F401
+    Base.metadata.create_all(bind=bind or engine)
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import threading
+
+MAX_SUBSCRIBERS = 1000  # Open streams per worker
+MAX_SUBSCRIBERS_PER_CHANNEL = 5  # e.g. one user with the app open on a few devices
+SUBSCRIBER_QUEUE_SIZE = 1  # Progress events carry full totals, so only the newest one matters
+
+
+class SubscriberLimitReached(Exception):
+    pass
+
+
+def progress_channel(user_id: int):
+    return f"progress:{user_id}"
+
+
+def format_event(event: str, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class Subscription:
+    def __init__(self, broker, channel: str, loop: asyncio.AbstractEventLoop):
+        self.broker = broker
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.closed = False
+
+    def offer(self, message):
+        # Runs on the subscriber's event loop; a slow reader only ever misses stale totals
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout: float = None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.broker.unsubscribe(self)
+
+
+class Broker:
+    """
+    Pub/sub used by the streaming endpoints. publish() may be called from any
+    thread (sync endpoints run in a threadpool); subscribe() from the event loop.
+    A cross-worker implementation (e.g. Redis pub/sub) only needs these methods.
+    """
+
+    def subscribe(self, channel: str) -> Subscription:
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription: Subscription):
+        raise NotImplementedError
+
+    def publish(self, channel: str, message):
+        raise NotImplementedError
+
+
+class LocalBroker(Broker):
+    # Fans out to subscribers in this process only; each worker sees its own writes
+
+    def __init__(self, max_subscribers: int = MAX_SUBSCRIBERS, max_per_channel: int = MAX_SUBSCRIBERS_PER_CHANNEL):
+        self.max_subscribers = max_subscribers
+        self.max_per_channel = max_per_channel
+        self.channels = {}
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def subscribe(self, channel: str):
+        subscription = Subscription(self, channel, asyncio.get_running_loop())
+        with self.lock:
+            subscribers = self.channels.get(channel, set())
+            if self.count >= self.max_subscribers:
+                raise SubscriberLimitReached("Too many open streams, try again later.")
+            if len(subscribers) >= self.max_per_channel:
+                raise SubscriberLimitReached("Too many open streams for this user.")
+            subscribers.add(subscription)
+            self.channels[channel] = subscribers
+            self.count += 1
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.lock:
+            subscribers = self.channels.get(subscription.channel)
+            if subscribers and subscription in subscribers:
+                subscribers.discard(subscription)
+                self.count -= 1
+                if not subscribers:
+                    del self.channels[subscription.channel]
+
+    def publish(self, channel: str, message):
+        with self.lock:
+            subscribers = list(self.channels.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, message)
+            except RuntimeError:
+                subscription.close()  # Its loop has shut down
+
+
+broker = LocalBroker()
@@ -0,0 +1,114 @@
+import csv
+import io
+import json
+import os
+from datetime import date, datetime
+from sqlalchemy import select, text
+import database
+from database import SessionLocal
+from models import BMI, Progress, Record
+
+# Rows read per query; each batch is its own short read, so a slow download never
+# holds SQLite's shared lock (which would block every writer in rollback-journal mode)
+EXPORT_BATCH_SIZE = 1000
+
+RECORD_COLUMNS = ["record_id", "filtered_food_id", "food_name", "type", "carbs", "protein", "fats",
+                  "calorie", "grams", "meal_type", "category", "consumed_at", "local_date"]
+BMI_COLUMNS = ["bmi_id", "height", "weight", "bmi", "recommendation_id"]
+PROGRESS_COLUMNS = ["progress_id", "filtered_id", "total_calories", "date", "daily_calories"]
+
+# One rectangular CSV: a `kind` column says which of the column groups a row fills in
+CSV_COLUMNS = ["kind", "user_id"] + RECORD_COLUMNS + BMI_COLUMNS + [
+    column for column in PROGRESS_COLUMNS if column not in RECORD_COLUMNS + BMI_COLUMNS
+]
+
+
+def to_json_value(value):
+    # json.dumps default= hook, only called for values json can't encode itself
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def keyset_batches(session, table, key_column, columns, user_id):
+    # Walks the user's rows in primary-key order, one bounded query at a time
+    last_key = None
+    while True:
+        query = (
+            select(*[table.c[column] for column in columns])
+            .where(table.c.user_id == user_id)
+            .order_by(table.c[key_column])
+            .limit(EXPORT_BATCH_SIZE)
+        )
+        if last_key is not None:
+            query = query.where(table.c[key_column] > last_key)
+        rows = session.execute(query).mappings().all()
+        session.rollback()  # Ends the read so the lock is released before the batch is sent
+        if not rows:
+            return
+        yield rows
+        last_key = rows[-1][key_column]
+        if len(rows) < EXPORT_BATCH_SIZE:
+            return
+
+
+def archived_record_batches(user_id):
+    if not os.path.exists(database.archive_engine.url.database):
+        return
+    last_key = 0
+    while True:
+        with database.archive_engine.connect() as conn:
+            rows = conn.execute(
+                text(f"SELECT {', '.join(RECORD_COLUMNS)} FROM records WHERE user_id = :user_id AND record_id > :last "
+                     "ORDER BY record_id LIMIT :limit"),
+                {"user_id": user_id, "last": last_key, "limit": EXPORT_BATCH_SIZE},
+            ).mappings().all()
+        if not rows:
+            return
+        yield rows
+        last_key = rows[-1]["record_id"]
+        if len(rows) < EXPORT_BATCH_SIZE:
+            return
+
+
+def user_history_batches(user_id: int, include_archived: bool = False):
+    """
+    Yields (kind, rows) batches of a user's records (archived ones first when
+    asked for), BMI history and progress, never more than EXPORT_BATCH_SIZE rows at once.
+    """
+    if include_archived:
+        for rows in archived_record_batches(user_id):
+            yield "archived_record", rows
+
+    session = SessionLocal()
+    try:
+        sections = [
+            ("record", Record.__table__, "record_id", RECORD_COLUMNS),
+            ("bmi", BMI.__table__, "bmi_id", BMI_COLUMNS),
+            ("progress", Progress.__table__, "progress_id", PROGRESS_COLUMNS),
+        ]
+        for kind, table, key_column, columns in sections:
+            for rows in keyset_batches(session, table, key_column, columns, user_id):
+                yield kind, rows
+    finally:
+        session.close()
+
+
+def generate_ndjson(user_id: int, include_archived: bool = False):
+    for kind, rows in user_history_batches(user_id, include_archived):
+        yield "".join(
+            json.dumps({"kind": kind, "user_id": user_id, **row}, default=to_json_value) + "\n"
+            for row in rows
+        )
+
+
+def generate_csv(user_id: int, include_archived: bool = False):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    for kind, rows in user_history_batches(user_id, include_archived):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows({"kind": kind, "user_id": user_id, **row} for row in rows)
+        yield buffer.getvalue()
@@ -0,0 +1,144 @@
+import math
+from datetime import datetime
+from sqlalchemy import event, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from cache import LRUCache
+from models import FilteredFood, FoodFrequency, Record
+import crud
+
+# A use counts half as much after this long, so last week's habits outrank last year's
+HALF_LIFE_DAYS = 14
+# Scores are stored as log2 of the forward-decayed sum relative to this fixed point, so
+# ranking by the stored value equals ranking by the decayed score at any later time
+DECAY_EPOCH = crud.STORAGE_TIMEZONE.localize(datetime(2024, 1, 1))
+HOT_USERS = 1024  # Users whose lists are kept in memory
+
+frequent_foods_cache = LRUCache(maxsize=HOT_USERS)
+
+
+def age_in_half_lives(moment: datetime):
+    if moment.tzinfo is None:
+        moment = crud.STORAGE_TIMEZONE.localize(moment)
+    return (moment - DECAY_EPOCH).total_seconds() / (HALF_LIFE_DAYS * 86400)
+
+
+def combine_decay_keys(decay_key: float, t: float):
+    # log2(2**decay_key + 2**t), computed without overflowing
+    if decay_key is None:
+        return t
+    high, low = max(decay_key, t), min(decay_key, t)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def add_use(decay_key: float, moment: datetime):
+    return combine_decay_keys(decay_key, age_in_half_lives(moment))
+
+
+@event.listens_for(Engine, "connect")
+def register_decay_function(dbapi_connection, connection_record):
+    # Lets the upsert in record_food_use add a use to the stored key inside SQLite
+    dbapi_connection.create_function("frequency_add_use", 2, combine_decay_keys, deterministic=True)
+
+
+def current_score(decay_key: float, now: datetime):
+    # The decayed number of uses as of `now`
+    return 2 ** (decay_key - age_in_half_lives(now))
+
+
+def record_food_use(db: Session, record: Record):
+    """
+    Count one more use of the record's food for its user. Runs inside the
+    caller's transaction, right after the Record is added.
+    """
+    consumed_at = record.consumed_at or datetime.now(crud.STORAGE_TIMEZONE)
+    # The latest use decides what a quick-log of this food records
+    latest_use = {
+        "filtered_id": record.filtered_food_id,
+        "type": record.type,
+        "carbs": record.carbs,
+        "protein": record.protein,
+        "fats": record.fats,
+        "calorie": record.calorie,
+        "grams": record.grams,
+        "meal_type": record.meal_type,
+        "last_used_at": crud.to_storage_time(consumed_at),
+    }
+    statement = sqlite_insert(FoodFrequency).values(
+        user_id=record.user_id, food_name=record.food_name, category=record.category,
+        use_count=1, decay_key=age_in_half_lives(consumed_at), **latest_use,
+    )
+    # One statement, so two first uses logged at once both count instead of one failing on the primary key
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[FoodFrequency.user_id, FoodFrequency.food_name, FoodFrequency.category],
+        set_={
+            **{column: statement.excluded[column] for column in latest_use},
+            "use_count": FoodFrequency.use_count + 1,
+            "decay_key": func.frequency_add_use(FoodFrequency.decay_key, statement.excluded.decay_key),
+        },
+    ))
+    frequent_foods_cache.pop(record.user_id)
+
+
+def rebuild_frequencies(db: Session, batch_size: int = 1000):
+    """
+    Recompute every user's counters from the records table, for data logged
+    before the counters existed. Returns the number of counters written.
+    """
+    counters = {}
+    for record in db.query(Record).order_by(Record.record_id).yield_per(batch_size):
+        key = (record.user_id, record.food_name, record.category)
+        counter = counters.setdefault(key, {"user_id": record.user_id, "food_name": record.food_name,
+                                            "category": record.category, "use_count": 0, "decay_key": None})
+        consumed_at = record.consumed_at or datetime.now(crud.STORAGE_TIMEZONE)
+        counter.update(filtered_id=record.filtered_food_id, type=record.type, carbs=record.carbs, protein=record.protein,
+                       fats=record.fats, calorie=record.calorie, grams=record.grams, meal_type=record.meal_type,
+                       last_used_at=crud.to_storage_time(consumed_at))
+        counter["use_count"] += 1
+        counter["decay_key"] = add_use(counter["decay_key"], consumed_at)
+
+    # The frequent-foods ETag follows the records version, so every user whose list may change gets a new one
+    affected_users = {user_id for (user_id,) in db.query(FoodFrequency.user_id).distinct()}
+    affected_users.update(user_id for user_id, _, _ in counters)
+    db.query(FoodFrequency).delete()
+    db.bulk_insert_mappings(FoodFrequency, list(counters.values()))
+    for user_id in sorted(affected_users):
+        crud.bump_data_version(db, user_id, "records")
+    db.commit()
+    frequent_foods_cache.clear()
+    return len(counters)
+
+
+def resolve_filtered_ids(db: Session, user_id: int, rows):
+    # The archive job moves superseded filtered_foods copies out; point those rows at the user's current copy
+    ids = {row["filtered_id"] for row in rows if row["filtered_id"] is not None}
+    present = set(db.execute(select(FilteredFood.filtered_id).where(FilteredFood.filtered_id.in_(ids))).scalars()) if ids else set()
+    for row in rows:
+        if row["filtered_id"] is not None and row["filtered_id"] not in present:
+            row["filtered_id"] = db.execute(
+                select(func.max(FilteredFood.filtered_id)).where(
+                    FilteredFood.user_id == user_id,
+                    FilteredFood.food_name == row["food_name"],
+                    FilteredFood.category == row["category"],
+                )
+            ).scalar()  # None when the food isn't in their filtered list any more
+    return rows
+
+
+def get_frequent_foods(db: Session, user_id: int, version: str, limit: int):
+    # Cached per user and tagged with the ETag (records and filtered_foods versions), so other workers' writes are noticed too
+    cached = frequent_foods_cache.get(user_id)
+    if cached is not None and cached[0] == version and cached[1] >= limit:
+        return cached[2][:limit]
+
+    # Plain dicts, so cached entries never outlive the session they were loaded in
+    rows = [
+        {column.name: getattr(frequency, column.name) for column in FoodFrequency.__table__.columns}
+        for frequency in db.query(FoodFrequency).filter(
+            FoodFrequency.user_id == user_id
+        ).order_by(FoodFrequency.decay_key.desc()).limit(limit)
+    ]
+    resolve_filtered_ids(db, user_id, rows)
+    frequent_foods_cache.set(user_id, (version, limit, rows))
+    return rows
@@ -1,36 +1,55 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Request, Response, Query
 from sqlalchemy.orm import Session, joinedload
-from typing import List
-from database import engine, SessionLocal, Base
+from typing import List, Optional
+import database
+from database import SessionLocal
+from config import Settings, get_settings
+from contextlib import asynccontextmanager
 import crud
 import schemas
 from starlette.middleware.cors import CORSMiddleware
-from models import FilteredFood, Food, User, Record, Progress
+from starlette.middleware.gzip import GZipMiddleware
+from models import FilteredFood, Food, User, Record, Progress, RecordSummary
 from schemas import FoodFilter, FilteredFoodResponse, RecordCreate, RecordResponse, NewRecordCreate,ProgressResponse,DailyCaloriesResponse
 from crud import filter_foods, get_filtered_foods
 from models import BMI as BMIDB
-from datetime import datetime, date
+from datetime import datetime, date, timezone
 import logging
 import pytz
-
-app = FastAPI()
-
-origins = [
-    "http://localhost:8081",
-    "http://localhost",
-    "http://127.0.0.1",
-    "http://192.168.1.5",
-]
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-Base.metadata.create_all(bind=engine)
+from conditional import version_validators, validator_headers, is_not_modified, cached_response
+import cache
+from similar import food_index
+import frequent
+import export
+import profiling
+import queries
+import dashboard
+import catalog
+import onboarding
+import secrets
+from events import broker, progress_channel, format_event, SubscriberLimitReached
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse, FileResponse
+import asyncio
+import os
+from admission import AdmissionControlMiddleware
+import metrics
+
+router = APIRouter(route_class=profiling.ProfiledRoute)
+
+# Only bodies above this size are worth the CPU; small polls go out as-is
+GZIP_MINIMUM_SIZE = 1024
+STREAM_KEEPALIVE_SECONDS = 15
+STREAM_RETRY_AFTER_SECONDS = 5
+
+
+class StreamAwareGZipMiddleware(GZipMiddleware):
+    # gzip holds event-stream chunks back until its buffer fills, which would stall server-sent events
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith("/stream"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
 
 def get_db():
     db = SessionLocal()
@@ -39,7 +58,7 @@ def get_db():
     finally:
         db.close()
 
-@app.post("/register", response_model=schemas.User)
+@router.post("/register", response_model=schemas.User)
 def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db_user = crud.get_user_by_username(db, username=user.username)
     print(f"Debug: Attempting to register user with username '{user.username}'. Found user: {db_user}")  # Debug line
@@ -51,7 +70,21 @@ def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     return crud.create_user(db=db, user=user)
 
 
-@app.post("/login")
+@router.post("/users/bulk", response_model=schemas.BulkUsersResponse)
+def register_users_bulk(payload: schemas.BulkUsersCreate, db: Session = Depends(get_db)):
+    """
+    Register up to onboarding.MAX_BULK_USERS users, each with an optional first
+    BMI record. Rows that can't be created are reported without failing the rest.
+    """
+    if len(payload.users) > onboarding.MAX_BULK_USERS:
+        raise HTTPException(status_code=413, detail=f"At most {onboarding.MAX_BULK_USERS} users per request.")
+
+    results = onboarding.create_users(db, payload.users)
+    created = sum(1 for result in results if result["status"] == "created")
+    return {"created": created, "failed": len(results) - created, "results": results}
+
+
+@router.post("/login")
 def login_user(user: schemas.UserLogin, db: Session = Depends(get_db)):
     # Look up the user by username
     db_user = crud.get_user_by_username(db, username=user.username)
@@ -59,7 +92,7 @@ def login_user(user: schemas.UserLogin, db: Session = Depends(get_db)):
         raise HTTPException(status_code=401, detail="Invalid username or password")
 
     # Verify the password
-    if not crud.pwd_context.verify(user.password, db_user.hashed_password):
+    if not crud.get_pwd_context().verify(user.password, db_user.hashed_password):
         raise HTTPException(status_code=401, detail="Invalid username or password")
 
     # Attempt to retrieve BMI record
@@ -81,18 +114,21 @@ def login_user(user: schemas.UserLogin, db: Session = Depends(get_db)):
 
 
 
-@app.post("/bmi", response_model=schemas.BMI)
+@router.post("/bmi", response_model=schemas.BMI)
 def create_bmi(bmi_data: schemas.BMICreate, db: Session = Depends(get_db)):
     return crud.create_bmi_record(db=db, bmi_data=bmi_data)
 
-@app.get("/bmi/user/{user_id}", response_model=schemas.BMI)
-def get_bmi_records_by_user(user_id: int, db: Session = Depends(get_db)):
-    bmi_record = crud.get_bmi_records_by_user(db, user_id=user_id)
-    if bmi_record is None:
-        raise HTTPException(status_code=404, detail="BMI record not found")
-    return bmi_record
+@router.get("/bmi/user/{user_id}", response_model=schemas.BMI)
+def get_bmi_records_by_user(user_id: int, request: Request, http_response: Response, db: Session = Depends(get_db)):
+    etag, last_modified = version_validators(db, user_id, "bmi")
 
-@app.post("/recommendation")
+    def load():
+        bmi_record = crud.get_bmi_records_by_user(db, user_id=user_id)
+        return schemas.BMI.model_validate(bmi_record, from_attributes=True) if bmi_record else None
+
+    return cached_response(request, http_response, "bmi", etag, last_modified, load, missing="BMI record not found")
+
+@router.post("/recommendation")
 def get_recommendation(bmi: float, db: Session = Depends(get_db)):
     recommendation = crud.get_recommendation(db, bmi)
     
@@ -101,7 +137,7 @@ def get_recommendation(bmi: float, db: Session = Depends(get_db)):
     else:
         raise HTTPException(status_code=404, detail="Recommendation not found")
     
-@app.post("/filter-foods/{user_id}", response_model=List[FilteredFoodResponse])
+@router.post("/filter-foods/{user_id}", response_model=List[FilteredFoodResponse])
 def filter_and_store_foods(user_id: int, answer: FoodFilter, db: Session = Depends(get_db)):
     try:
         user = db.query(User).filter(User.user_id == user_id).first()
@@ -137,38 +173,18 @@ def filter_and_store_foods(user_id: int, answer: FoodFilter, db: Session = Depen
         raise HTTPException(status_code=500, detail=str(e))
 
     
-@app.get("/filtered-foods/{user_id}", response_model=List[FilteredFoodResponse])
-def get_filtered_foods(user_id: int, db: Session = Depends(get_db)):
-    # Query the filtered_foods table directly
-    filtered_foods = db.query(FilteredFood).filter(FilteredFood.user_id == user_id).all()
-
-    if not filtered_foods:
-        raise HTTPException(status_code=404, detail="No filtered foods found for the given user ID.")
-
-    # Prepare the response including filtered_id and necessary fields
-    response = [
-        FilteredFoodResponse(
-            filtered_id=entry.filtered_id,  # Ensure the filtered_id is included in the response
-            food_name=entry.food_name,
-            calories=entry.calorie,
-            type=entry.type,
-            grams=entry.grams,
-            categories=entry.category,
-            mealtype=entry.meal_type,
-            carbs=int(float(entry.carbs.replace('g', '').strip())) if isinstance(entry.carbs, str) else entry.carbs,
-            protein=int(float(entry.protein.replace('g', '').strip())) if isinstance(entry.protein, str) else entry.protein,
-            fats=int(float(entry.fats.replace('g', '').strip())) if isinstance(entry.fats, str) else entry.fats,
-            recipe_link=entry.recipe_link  
-        )
-        for entry in filtered_foods
-    ]
-
-    return response
+@router.get("/filtered-foods/{user_id}", response_model=List[FilteredFoodResponse])
+def get_filtered_foods(user_id: int, request: Request, http_response: Response, db: Session = Depends(get_db)):
+    # Answer 304 from the change counter before touching filtered_foods
+    etag, last_modified = version_validators(db, user_id, "filtered_foods")
+    return cached_response(request, http_response, "filtered_foods", etag, last_modified,
+                           lambda: queries.get_filtered_foods(db, user_id),
+                           missing="No filtered foods found for the given user ID.")
 
 
 
 
-@app.post("/record-consumption", response_model=RecordResponse)
+@router.post("/record-consumption", response_model=RecordResponse)
 def record_consumption(record_data: RecordCreate, db: Session = Depends(get_db)):
     # Check if the user and filtered food exist
     user = db.query(User).filter(User.user_id == record_data.user_id).first()
@@ -197,10 +213,13 @@ def record_consumption(record_data: RecordCreate, db: Session = Depends(get_db))
         grams=filtered_food.grams,
         meal_type=filtered_food.meal_type,
         category=filtered_food.category,
-        consumed_at=datetime.now(pytz.timezone('Asia/Manila'))
+        consumed_at=datetime.now(pytz.timezone('Asia/Manila')),
+        local_date=crud.user_today(user)
     )
 
     db.add(record)
+    frequent.record_food_use(db, record)
+    crud.bump_data_version(db, record_data.user_id, "records")
     db.commit()
     db.refresh(record)
 
@@ -217,42 +236,115 @@ def record_consumption(record_data: RecordCreate, db: Session = Depends(get_db))
         grams=record.grams,
         meal_type=record.meal_type,
         category=record.category,
-        consumed_at=record.consumed_at
+        consumed_at=record.consumed_at,
+        local_date=record.local_date
     )
 
 
-@app.get("/records/{user_id}", response_model=List[schemas.RecordResponse])
-def get_user_records(user_id: int, db: Session = Depends(get_db)):
-    # Query to get all records for a specific user
-    records = db.query(Record).filter(Record.user_id == user_id).all()
-
-    if not records:
-        raise HTTPException(status_code=404, detail="No records found for the given user ID.")
-
-    # Prepare the response by explicitly including `filtered_id`
-    response = [
-        schemas.RecordResponse(
-            record_id=record.record_id,
-            user_id=record.user_id,
-            filtered_id=record.filtered_food_id,  # Ensure `filtered_id` is set correctly
-            food_name=record.food_name,
-            type=record.type,
-            carbs=int(record.carbs.replace('g', '').strip()) if isinstance(record.carbs, str) else record.carbs,
-            protein=int(record.protein.replace('g', '').strip()) if isinstance(record.protein, str) else record.protein,
-            fats=int(record.fats.replace('g', '').strip()) if isinstance(record.fats, str) else record.fats,
-            calorie=record.calorie,
-            grams=record.grams,
-            meal_type=record.meal_type,
-            category=record.category,
-            consumed_at=record.consumed_at
+@router.get("/records/{user_id}", response_model=List[schemas.RecordResponse])
+def get_user_records(user_id: int, request: Request, http_response: Response, include_archived: bool = False,
+                     start_date: Optional[date] = None, end_date: Optional[date] = None, db: Session = Depends(get_db)):
+    variant = ("archived" if include_archived else "recent", start_date, end_date)
+    etag, last_modified = version_validators(db, user_id, "records", *variant)
+
+    def load():
+        # Records for a specific user, optionally limited to a range of the user's local days
+        records = queries.get_records(db, user_id, start_date, end_date)
+        # Older records only come back when explicitly asked for, see maintenance.archive_old_records
+        archived_records = crud.get_archived_records(user_id, start_date, end_date) if include_archived else []
+        # Archived rows still carry the old column name; the response model drops the extra key
+        archived = [dict(row, filtered_id=row["filtered_food_id"]) for row in archived_records]
+        return archived + records
+
+    return cached_response(request, http_response, "records", etag, last_modified, load,
+                           missing="No records found for the given user ID.")
+ 
+
+@router.get("/dashboard/{user_id}", response_model=schemas.DashboardResponse)
+def get_dashboard(user_id: int, db: Session = Depends(get_db)):
+    """
+    Everything the home screen shows on open (user, latest BMI and plan, today's
+    progress, filtered foods and today's records) in one response.
+    """
+    user_dashboard = dashboard.get_dashboard(db, user_id)
+    if user_dashboard is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user_dashboard
+
+
+@router.get("/users/{user_id}/frequent-foods", response_model=List[schemas.FrequentFoodResponse])
+def get_frequent_foods(user_id: int, request: Request, http_response: Response, limit: int = Query(20, ge=1, le=100), db: Session = Depends(get_db)):
+    """
+    The user's most used foods, weighted towards recent meals, for quick logging.
+    """
+    # Archiving filtered_foods copies can change which filtered_id a row resolves to
+    filtered_version = crud.get_data_version(db, user_id, "filtered_foods")
+    etag, last_modified = version_validators(
+        db, user_id, "records", "frequent", limit, filtered_version.version if filtered_version else 0,
+        not_before=filtered_version.updated_at.replace(tzinfo=timezone.utc) if filtered_version else None,
+    )
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=validator_headers(etag, last_modified))
+    http_response.headers.update(validator_headers(etag, last_modified))
+
+    now = datetime.now(pytz.timezone('Asia/Manila'))
+    return [
+        schemas.FrequentFoodResponse(
+            **{key: value for key, value in row.items() if key not in ("user_id", "decay_key")},
+            score=round(frequent.current_score(row["decay_key"], now), 4)
         )
-        for record in records
+        for row in frequent.get_frequent_foods(db, user_id, etag, limit)
     ]
 
-    return response
- 
 
-@app.put("/bmi/user/{user_id}/update-weight", response_model=schemas.BMI)
+@router.get("/users/{user_id}/export")
+def export_user_history(user_id: int, format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+                        include_archived: bool = False, db: Session = Depends(get_db)):
+    """
+    Streams the user's records, BMI history and progress as NDJSON or CSV, a batch at a time.
+    """
+    if not db.query(User.user_id).filter(User.user_id == user_id).first():
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # The stream opens its own session; this request's session is closed before the body is sent
+    if format == "csv":
+        body, media_type = export.generate_csv(user_id, include_archived), "text/csv"
+    else:
+        body, media_type = export.generate_ndjson(user_id, include_archived), "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f"attachment; filename=user-{user_id}-export.{format}"})
+
+
+@router.get("/records/{user_id}/daily-summaries", response_model=List[schemas.RecordSummaryResponse])
+def get_record_summaries(user_id: int, start_date: date, end_date: date, db: Session = Depends(get_db)):
+    """
+    Per-day macro totals for records that have been moved to the archive.
+    """
+    return db.query(RecordSummary).filter(
+        RecordSummary.user_id == user_id,
+        RecordSummary.date >= start_date,
+        RecordSummary.date <= end_date
+    ).order_by(RecordSummary.date).all()
+
+
+@router.put("/users/{user_id}/timezone", response_model=schemas.User)
+def update_user_timezone(user_id: int, timezone_data: schemas.UpdateTimezoneSchema, db: Session = Depends(get_db)):
+    """
+    Change which calendar day counts as "today" for the user. Records already
+    stored keep the local_date they were written with.
+    """
+    user = db.query(User).filter(User.user_id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    user.timezone = crud.validate_timezone(timezone_data.timezone)
+    crud.bump_data_version(db, user_id, "progress")
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+@router.put("/bmi/user/{user_id}/update-weight", response_model=schemas.BMI)
 def update_user_weight(user_id: int, weight_data: schemas.UpdateWeightSchema, db: Session = Depends(get_db)):
     # Fetch the BMI record for the user
     bmi_record = crud.get_bmi_records_by_user(db, user_id=user_id)
@@ -279,6 +371,7 @@ def update_user_weight(user_id: int, weight_data: schemas.UpdateWeightSchema, db
     else:
         bmi_record.recommendation_id = 3 
 
+    crud.bump_data_version(db, user_id, "progress", "bmi")  # Today's progress carries the daily calorie target
     db.commit()
     db.refresh(bmi_record)
     
@@ -287,23 +380,66 @@ def update_user_weight(user_id: int, weight_data: schemas.UpdateWeightSchema, db
 
 
 
-@app.get("/foods")
+@router.get("/foods")
 def read_foods(db: Session = Depends(get_db)):
-    foods = db.query(Food).all()
-    return {"foods": foods}
+    return {"foods": queries.get_foods(db)}
+
+
+@router.get("/foods/changes", response_model=schemas.FoodChangesResponse)
+def read_food_changes(since: Optional[int] = Query(None, ge=0),
+                      limit: int = Query(catalog.CHANGES_PAGE_SIZE, ge=1, le=catalog.MAX_CHANGES_PAGE_SIZE),
+                      db: Session = Depends(get_db)):
+    """
+    Delta sync for the food catalog: what was added, edited or deleted since
+    the version the client last saw. Omit `since` on the first sync.
+    """
+    return catalog.get_catalog_changes(db, since, limit)
+
+
+@router.get("/foods/{food_id}/similar", response_model=List[schemas.SimilarFoodResponse])
+def get_similar_foods(food_id: int, user_id: Optional[int] = None, limit: int = Query(10, ge=1, le=50), db: Session = Depends(get_db)):
+    """
+    Foods from the same meal type with the closest per-gram macros, skipping
+    the allergen types the user filtered out.
+    """
+    excluded_types = crud.get_excluded_food_types(db, user_id) if user_id is not None else set()
+    neighbours = food_index.similar(db, food_id, limit, excluded_types)
+    if neighbours is None:
+        raise HTTPException(status_code=404, detail="Food not found.")
+
+    foods = {food.food_id: food for food in db.query(Food).filter(Food.food_id.in_([neighbour_id for _, neighbour_id in neighbours]))}
+    return [
+        schemas.SimilarFoodResponse(
+            food_id=food.food_id,
+            food_name=food.food_name,
+            type=food.type,
+            carbs=int(float(food.carbs.replace('g', '').strip())) if isinstance(food.carbs, str) else food.carbs,
+            protein=int(float(food.protein.replace('g', '').strip())) if isinstance(food.protein, str) else food.protein,
+            fats=int(float(food.fats.replace('g', '').strip())) if isinstance(food.fats, str) else food.fats,
+            calorie=food.calorie,
+            grams=food.grams,
+            meal_type=food.meal_type,
+            category=food.category,
+            recipe_link=food.recipe_link,
+            distance=round(distance, 4)
+        )
+        for distance, neighbour_id in neighbours
+        if (food := foods.get(neighbour_id)) is not None
+    ]
 
 
-@app.post("/progress/{user_id}/update", response_model=schemas.ProgressResponse)
+@router.post("/progress/{user_id}/update", response_model=schemas.ProgressResponse)
 def update_daily_progress(user_id: int, filtered_id: int, db: Session = Depends(get_db)):
     try:
         progress = crud.update_progress(db=db, user_id=user_id, filtered_id=filtered_id)
+        publish_progress(db, user_id)
         return progress
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/progress/{user_id}/update", response_model=schemas.ProgressResponse)
+@router.post("/progress/{user_id}/update", response_model=schemas.ProgressResponse)
 def update_daily_progress(user_id: int, filtered_id: int, db: Session = Depends(get_db)):
     """
     Endpoint to update or create daily progress for the user when consuming a food.
@@ -317,71 +453,91 @@ def update_daily_progress(user_id: int, filtered_id: int, db: Session = Depends(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/progress/{user_id}/today", response_model=ProgressResponse)
-def get_today_progress(user_id: int, db: Session = Depends(get_db)):
+@router.get("/progress/{user_id}/today", response_model=ProgressResponse)
+def get_today_progress(user_id: int, request: Request, http_response: Response, db: Session = Depends(get_db)):
     """
     Fetch progress for the current day, including BMI's daily_calories.
     """
-    today = date.today()
+    user = db.query(User).filter(User.user_id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    today = crud.user_today(user)
 
-    progress = db.query(Progress).filter(Progress.user_id == user_id, Progress.date == today).first()
+    # The date is part of the tag so yesterday's copy is never revalidated, or served from the cache, as today's
+    etag, last_modified = version_validators(db, user_id, "progress", today.isoformat(), not_before=crud.local_day_start(user, today))
+    return cached_response(request, http_response, "progress", etag, last_modified,
+                           lambda: crud.get_today_progress(db, user, today), missing="No progress found for today.")
 
-    if not progress:
-        raise HTTPException(status_code=404, detail="No progress found for today.")
-    
-    bmi_record = db.query(BMIDB).options(joinedload(BMIDB.recommendation)).filter(BMIDB.user_id == user_id).order_by(BMIDB.bmi_id.desc()).first()
 
-    if bmi_record and bmi_record.recommendation:
-        bmi_response = DailyCaloriesResponse(daily_calories=bmi_record.recommendation.daily_calories)
-    else:
-        bmi_response = DailyCaloriesResponse(daily_calories=2000)  
-
-    return ProgressResponse(
-        progress_id=progress.progress_id,
-        user_id=progress.user_id,
-        filtered_id=progress.filtered_id,
-        total_calories=progress.total_calories,
-        date=progress.date,
-        bmi=bmi_response 
-    )
+@router.get("/progress/{user_id}/stream")
+async def stream_progress(user_id: int, request: Request):
+    """
+    Server-sent events with the user's progress for today: the current totals
+    right away, then a new event whenever the totals change.
+    """
+    try:
+        subscription = broker.subscribe(progress_channel(user_id))
+    except SubscriberLimitReached as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(STREAM_RETRY_AFTER_SECONDS)})
+
+    try:
+        initial = await run_in_threadpool(load_today_progress, user_id)
+    except Exception:
+        subscription.close()
+        raise
+
+    async def events():
+        try:
+            # Tell EventSource clients how long to wait before reconnecting
+            yield f"retry: {STREAM_RETRY_AFTER_SECONDS * 1000}\n\n"
+            if initial is not None:
+                yield format_event("progress", initial)
+            while not await request.is_disconnected():
+                try:
+                    message = await subscription.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"  # Keeps proxies and mobile networks from closing an idle stream
+                    continue
+                yield format_event("progress", message)
+        finally:
+            subscription.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def load_today_progress(user_id: int):
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.user_id == user_id).first()
+        progress = crud.get_today_progress(db, user) if user else None
+        return progress.model_dump(mode="json") if progress else None
+    finally:
+        db.close()
+
+
+def publish_progress(db: Session, user_id: int):
+    # Only called after the write has committed, so subscribers never see uncommitted totals
+    user = db.query(User).filter(User.user_id == user_id).first()
+    progress = crud.get_today_progress(db, user) if user else None
+    if progress is not None:
+        broker.publish(progress_channel(user_id), progress.model_dump(mode="json"))
 
 
-@app.get("/progress/{user_id}/calories-per-day", response_model=List[ProgressResponse])
+@router.get("/progress/{user_id}/calories-per-day", response_model=List[ProgressResponse])
 def get_calories_per_day(user_id: int, start_date: date, end_date: date, db: Session = Depends(get_db)):
     """
     Get total calories consumed per day for a specific user between start_date and end_date.
     """
-    progress_records = db.query(Progress).filter(
-        Progress.user_id == user_id,
-        Progress.date >= start_date,
-        Progress.date <= end_date
-    ).all()
+    progress_records = queries.get_progress_range(db, user_id, start_date, end_date)
 
     if not progress_records:
         raise HTTPException(status_code=404, detail="No progress records found for the specified date range.")
 
-    response = []
-    for progress in progress_records:
-        bmi_record = db.query(BMIDB).options(joinedload(BMIDB.recommendation)).filter(BMIDB.user_id == user_id).order_by(BMIDB.bmi_id.desc()).first()
-
-        if bmi_record and bmi_record.recommendation:
-            bmi_response = DailyCaloriesResponse(daily_calories=bmi_record.recommendation.daily_calories)
-        else:
-            bmi_response = DailyCaloriesResponse(daily_calories=2000)
-
-        response.append(ProgressResponse(
-            progress_id=progress.progress_id,
-            user_id=progress.user_id,
-            filtered_id=progress.filtered_id,
-            total_calories=progress.total_calories,
-            date=progress.date,
-            bmi=bmi_response  
-        ))
-
-    return response
+    return progress_records
 
 
-@app.get("/progress/{user_id}/calories-per-day", response_model=List[schemas.ProgressResponse])
+@router.get("/progress/{user_id}/calories-per-day", response_model=List[schemas.ProgressResponse])
 def get_calories_per_day(user_id: int, start_date: date, end_date: date, db: Session = Depends(get_db)):
     """
     Get total calories consumed per day for a specific user between start_date and end_date.
@@ -397,13 +553,14 @@ def get_calories_per_day(user_id: int, start_date: date, end_date: date, db: Ses
     
     return progress_records
 
-@app.post("/add-record", response_model=schemas.RecordResponse)
+@router.post("/add-record", response_model=schemas.RecordResponse)
 def add_record(record_data: NewRecordCreate, db: Session = Depends(get_db)):
 
     user = db.query(User).filter(User.user_id == record_data.user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
+    consumed_at = crud.to_storage_time(record_data.consumed_at or datetime.now(pytz.timezone('Asia/Manila')))
     new_record = Record(
         user_id=record_data.user_id,
         food_name=record_data.food_name,
@@ -415,11 +572,14 @@ def add_record(record_data: NewRecordCreate, db: Session = Depends(get_db)):
         grams=record_data.grams,
         meal_type=record_data.meal_type,
         category=record_data.category,
-        consumed_at=record_data.consumed_at or datetime.now(pytz.timezone('Asia/Manila')),
+        consumed_at=consumed_at,
+        local_date=crud.local_date_for(user, record_data.consumed_at or consumed_at),
         filtered_food_id=None  
     )
 
     db.add(new_record)
+    frequent.record_food_use(db, new_record)
+    crud.bump_data_version(db, record_data.user_id, "records")
     db.commit()
     db.refresh(new_record)
 
@@ -431,8 +591,8 @@ def add_record(record_data: NewRecordCreate, db: Session = Depends(get_db)):
     # Get the recommended daily calories from the user's plan
     daily_calories = bmi_record.recommendation.daily_calories
 
-    # Step 4: Update the user's progress for today
-    today = datetime.now(pytz.timezone('Asia/Manila')).date()
+    # Step 4: Update the user's progress for the day the food was eaten, in the user's timezone
+    today = new_record.local_date
     
     # Check if a progress entry already exists for today
     progress = db.query(Progress).filter(Progress.user_id == record_data.user_id, Progress.date == today).first()
@@ -452,7 +612,9 @@ def add_record(record_data: NewRecordCreate, db: Session = Depends(get_db)):
         db.add(new_progress)
 
     # Commit changes to progress
+    crud.bump_data_version(db, record_data.user_id, "progress")
     db.commit()
+    publish_progress(db, record_data.user_id)
 
     # Explicitly set filtered_id to None in the response if no filtered_food_id exists
     return RecordResponse(
@@ -468,5 +630,123 @@ def add_record(record_data: NewRecordCreate, db: Session = Depends(get_db)):
         grams=new_record.grams,
         meal_type=new_record.meal_type,
         category=new_record.category,
-        consumed_at=new_record.consumed_at
+        consumed_at=new_record.consumed_at,
+        local_date=new_record.local_date
     )
+
+
+def require_admin(request: Request):
+    # The admin endpoints don't exist as far as clients can tell until NUTRI_ADMIN_TOKEN is set
+    admin_token = request.app.state.settings.admin_token
+    supplied = request.headers.get("X-Admin-Token", "")
+    if not admin_token or not secrets.compare_digest(supplied.encode(), admin_token.encode()):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@router.get("/admin/profiles", dependencies=[Depends(require_admin)])
+def list_profiles(request: Request):
+    """
+    Newest first. Send the admin token in X-Profile-Token on any request to have it profiled.
+    """
+    return request.app.state.trace_store.list()
+
+
+@router.get("/admin/profiles/{trace_id}", dependencies=[Depends(require_admin)])
+def get_profile(trace_id: str, request: Request):
+    trace = request.app.state.trace_store.load(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return trace
+
+
+@router.get("/admin/profiles/{trace_id}/download", dependencies=[Depends(require_admin)])
+def download_profile(trace_id: str, request: Request):
+    path = request.app.state.trace_store.path(trace_id, "prof")
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{trace_id}.prof")
+
+
+@router.get("/admin/backups", dependencies=[Depends(require_admin)])
+def list_backups(request: Request):
+    """
+    Snapshots on disk, newest first, and how the last backup run went.
+    """
+    import maintenance
+    return {
+        "backups": maintenance.list_backups(request.app.state.settings.backup_directory),
+        "job": request.app.state.backup_job.status,
+    }
+
+
+@router.post("/admin/backups", status_code=202, dependencies=[Depends(require_admin)])
+def start_backup(request: Request, compress: bool = False, verify: bool = True):
+    # Runs in the background; poll GET /admin/backups for the result
+    settings = request.app.state.settings
+    job = request.app.state.backup_job
+    if not job.start(settings.database_path, settings.backup_directory, settings.backup_keep, compress, verify=verify):
+        raise HTTPException(status_code=409, detail="A backup is already running")
+    return job.status
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Prometheus text format; admission control reports queue depth and shed counts here,
+    the response cache its lookups and hit ratio.
+    """
+    for resource, ratio in cache.hit_ratios().items():
+        metrics.set_gauge("response_cache_hit_ratio", ratio, {"resource": resource})
+    return metrics.render()
+
+
+def create_app(settings: Settings = None):
+    """
+    Build the API. Nothing touches the database until the app starts up,
+    so importing this module stays cheap for every worker.
+    """
+    settings = settings or get_settings()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Imported here, not at the top, so importing this module stays cheap
+        import maintenance
+        if settings.init_db_on_startup:
+            maintenance.init_db(settings.database_path, settings.archive_database_path)
+        maintenance.ensure_catalog_triggers(settings.database_path)
+        database.init_engine(settings)
+        app.state.backup_job = maintenance.BackgroundJob("backup", maintenance.backup_database)
+        yield
+        onboarding.shutdown_hash_pool()
+        database.dispose_engine()
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.settings = settings
+    cache.configure_response_cache(settings)
+    app.state.trace_store = profiling.TraceStore(settings.profile_directory, settings.profile_keep)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=settings.cors_origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(StreamAwareGZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE)
+    if settings.admin_token or settings.profile_sample_rate:
+        profiling.install_sql_timing()
+        app.add_middleware(
+            profiling.ProfilingMiddleware,
+            store=app.state.trace_store,
+            sample_rate=settings.profile_sample_rate,
+            admin_token=settings.admin_token,
+        )
+    # Added last so it runs first: shed requests are turned away before any other work
+    app.add_middleware(AdmissionControlMiddleware, routes=router.routes, limits=settings.route_limits)
+
+    app.include_router(router)
+    return app
+
+
+# `uvicorn main:app`; use `uvicorn --factory main:create_app` to skip building it at import
+app = create_app()
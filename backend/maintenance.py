@@ -0,0 +1,745 @@
+import sqlite3
+import threading
+import time
+import logging
+import argparse
+import gzip
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+import pytz
+from config import get_settings
+
+DEFAULT_TIMEZONE = 'Asia/Manila'  # Same as models.DEFAULT_TIMEZONE
+
+# Tables that hang off tbl_users, in the order they have to be emptied
+# (records, progress and user_food_frequencies point at filtered_foods, so they go first)
+USER_DEPENDENT_TABLES = ['records', 'progress', 'user_food_frequencies', 'filtered_foods', 'bmi_data', 'record_daily_summaries',
+                         'user_data_versions', 'user_food_filters']
+# Their user_id leads a unique index or the primary key already
+USER_INDEX_EXEMPT_TABLES = {'user_food_frequencies', 'record_daily_summaries', 'user_data_versions', 'user_food_filters'}
+# Per-user tables in the archive database
+ARCHIVE_TABLES = ['records', 'filtered_foods']
+
+DELETE_BATCH_SIZE = 500  # Rows removed per transaction
+BATCH_PAUSE_SECONDS = 0.01  # Gives other writers a chance between batches
+
+RETENTION_DAYS = 180  # Records older than this are summarised and archived
+ARCHIVE_BATCH_SIZE = 500  # Under SQLite's 999 bound parameter limit
+VACUUM_PAGES_PER_STEP = 1000
+
+BACKUP_PAGES_PER_STEP = 100  # Pages copied per read lock; a few hundred KB, about a millisecond
+MAX_BACKUP_RESTARTS = 5  # Writes restart a stepped backup; after this many it finishes in one step
+# Microseconds and a random suffix keep two backups started in the same second apart
+BACKUP_NAME_PATTERN = re.compile(r'^nutri-\d{8}-\d{6}(-\d{6}-[0-9a-f]{8})?\.db(\.gz)?$')
+
+RECORD_COLUMNS = ['record_id', 'user_id', 'filtered_food_id', 'food_name', 'type', 'carbs', 'protein', 'fats',
+                  'calorie', 'grams', 'meal_type', 'category', 'consumed_at', 'local_date']
+FILTERED_FOOD_COLUMNS = ['filtered_id', 'user_id', 'food_id', 'food_name', 'type', 'carbs', 'protein', 'fats',
+                         'calorie', 'grams', 'meal_type', 'category', 'recipe_link']
+
+# Same columns as models.RecordSummary so the job also works on a database the API hasn't touched yet
+SUMMARY_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS record_daily_summaries (
+    summary_id INTEGER NOT NULL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES tbl_users (user_id),
+    date DATE NOT NULL,
+    record_count INTEGER NOT NULL,
+    carbs FLOAT NOT NULL,
+    protein FLOAT NOT NULL,
+    fats FLOAT NOT NULL,
+    calorie INTEGER NOT NULL,
+    grams INTEGER NOT NULL
+)'''
+
+ARCHIVE_SCHEMA_SQL = [
+    '''CREATE TABLE IF NOT EXISTS archive.records (
+        record_id INTEGER NOT NULL PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        filtered_food_id INTEGER,
+        food_name VARCHAR NOT NULL,
+        type VARCHAR NOT NULL,
+        carbs INTEGER NOT NULL,
+        protein INTEGER NOT NULL,
+        fats INTEGER NOT NULL,
+        calorie INTEGER NOT NULL,
+        grams INTEGER NOT NULL,
+        meal_type VARCHAR NOT NULL,
+        category VARCHAR NOT NULL,
+        consumed_at DATETIME,
+        local_date DATE
+    )''',
+    'CREATE INDEX IF NOT EXISTS archive.ix_records_user_id ON records (user_id)',
+    '''CREATE TABLE IF NOT EXISTS archive.filtered_foods (
+        filtered_id INTEGER NOT NULL PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        food_id INTEGER NOT NULL,
+        food_name VARCHAR NOT NULL,
+        type VARCHAR NOT NULL,
+        carbs VARCHAR NOT NULL,
+        protein VARCHAR NOT NULL,
+        fats VARCHAR NOT NULL,
+        calorie INTEGER NOT NULL,
+        grams INTEGER NOT NULL,
+        meal_type VARCHAR NOT NULL,
+        category VARCHAR NOT NULL,
+        recipe_link VARCHAR
+    )''',
+    'CREATE INDEX IF NOT EXISTS archive.ix_filtered_foods_user_id ON filtered_foods (user_id)',
+]
+
+
+def existing_tables(conn: sqlite3.Connection):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def ensure_user_indexes(conn: sqlite3.Connection):
+    # Batched deletes and per-user lookups need user_id indexes; names match models.py.
+    # Tables the API hasn't created yet (a brand-new nutri.db) are skipped.
+    tables = existing_tables(conn)
+    for table in USER_DEPENDENT_TABLES:
+        if table not in tables or table in USER_INDEX_EXEMPT_TABLES:
+            continue
+        conn.execute(f'CREATE INDEX IF NOT EXISTS ix_{table}_user_id ON {table} (user_id)')
+    conn.commit()
+
+
+def ensure_retention_schema(conn: sqlite3.Connection):
+    conn.execute(SUMMARY_TABLE_SQL)
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS ix_record_daily_summaries_user_date ON record_daily_summaries (user_id, date)')
+    # Lookups the archive job makes for every batch
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_records_consumed_at ON records (consumed_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_records_filtered_food_id ON records (filtered_food_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_progress_filtered_id ON progress (filtered_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_filtered_foods_user_food ON filtered_foods (user_id, food_id)')
+    conn.commit()
+
+
+CATALOG_CHANGE_LOG_SQL = [
+    '''CREATE TABLE IF NOT EXISTS food_changes (
+        change_id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+        food_id INTEGER NOT NULL,
+        operation VARCHAR NOT NULL,
+        changed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )''',
+    # Triggers catch every writer: the API, the Flask admin and bulk imports alike
+    '''CREATE TRIGGER IF NOT EXISTS foods_log_insert AFTER INSERT ON foods BEGIN
+        INSERT INTO food_changes (food_id, operation) VALUES (NEW.food_id, 'insert');
+    END''',
+    # Only real changes: the admin import rewrites every row it matches, most of them unchanged
+    '''CREATE TRIGGER IF NOT EXISTS foods_log_real_update AFTER UPDATE ON foods
+    WHEN OLD.food_id IS NOT NEW.food_id OR OLD.food_name IS NOT NEW.food_name OR OLD.type IS NOT NEW.type
+        OR OLD.carbs IS NOT NEW.carbs OR OLD.protein IS NOT NEW.protein OR OLD.fats IS NOT NEW.fats
+        OR OLD.calorie IS NOT NEW.calorie OR OLD.grams IS NOT NEW.grams OR OLD.meal_type IS NOT NEW.meal_type
+        OR OLD.category IS NOT NEW.category OR OLD.recipe_link IS NOT NEW.recipe_link
+    BEGIN
+        INSERT INTO food_changes (food_id, operation) VALUES (NEW.food_id, 'update');
+    END''',
+    # Replaced by foods_log_real_update; dropped only after that exists, so no update goes unlogged
+    'DROP TRIGGER IF EXISTS foods_log_update',
+    '''CREATE TRIGGER IF NOT EXISTS foods_log_delete AFTER DELETE ON foods BEGIN
+        INSERT INTO food_changes (food_id, operation) VALUES (OLD.food_id, 'delete');
+    END''',
+]
+
+
+def ensure_catalog_change_log(conn: sqlite3.Connection):
+    for statement in CATALOG_CHANGE_LOG_SQL:
+        conn.execute(statement)
+    conn.commit()
+
+
+def ensure_catalog_triggers(database_path: str):
+    # Run at API startup as well: create_all makes food_changes but not the triggers that fill it
+    conn = sqlite3.connect(database_path, timeout=10)
+    try:
+        if 'foods' in existing_tables(conn):
+            ensure_catalog_change_log(conn)
+    finally:
+        conn.close()
+
+
+def ensure_timezone_schema(conn: sqlite3.Connection):
+    # Columns added after the first release; create_all never alters existing tables
+    user_columns = {row[1] for row in conn.execute('PRAGMA table_info(tbl_users)')}
+    if 'timezone' not in user_columns:
+        conn.execute(f"ALTER TABLE tbl_users ADD COLUMN timezone VARCHAR NOT NULL DEFAULT '{DEFAULT_TIMEZONE}'")
+    record_columns = {row[1] for row in conn.execute('PRAGMA table_info(records)')}
+    if 'local_date' not in record_columns:
+        conn.execute('ALTER TABLE records ADD COLUMN local_date DATE')
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_records_user_local_date ON records (user_id, local_date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS ix_progress_user_date ON progress (user_id, date)')
+    conn.commit()
+
+
+# Same columns as models.Record. AUTOINCREMENT keeps ids of archived records from being handed out again
+RECORDS_TABLE_SQL = '''
+CREATE TABLE {name} (
+    record_id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES tbl_users (user_id),
+    filtered_food_id INTEGER REFERENCES filtered_foods (filtered_id),
+    food_name VARCHAR NOT NULL,
+    type VARCHAR NOT NULL,
+    carbs INTEGER NOT NULL,
+    protein INTEGER NOT NULL,
+    fats INTEGER NOT NULL,
+    calorie INTEGER NOT NULL,
+    grams INTEGER NOT NULL,
+    meal_type VARCHAR NOT NULL,
+    category VARCHAR NOT NULL,
+    consumed_at DATETIME,
+    local_date DATE
+)'''
+
+
+def ensure_record_autoincrement(conn: sqlite3.Connection):
+    # Without AUTOINCREMENT SQLite reuses the ids of the newest rows once they are archived or deleted.
+    # The table can't be altered into it, so older databases get it rebuilt once (expects local_date to exist)
+    table_sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'records'").fetchone()
+    if table_sql is None or 'AUTOINCREMENT' in table_sql[0].upper():
+        return False
+    index_sql = [row[0] for row in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'records' AND sql IS NOT NULL")]
+    column_list = ', '.join(RECORD_COLUMNS)
+    conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(RECORDS_TABLE_SQL.format(name='records_rebuild'))
+        conn.execute(f'INSERT INTO records_rebuild ({column_list}) SELECT {column_list} FROM records')
+        conn.execute('DROP TABLE records')
+        conn.execute('ALTER TABLE records_rebuild RENAME TO records')
+        for statement in index_sql:
+            conn.execute(statement)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return True
+
+
+def ensure_record_ids_past_archive(conn: sqlite3.Connection):
+    # Expects the archive database attached as `archive`. New records must never take an archived id:
+    # the sequence starts past the archive, and live rows that took one before ids were monotonic get a new id
+    archive_max = conn.execute('SELECT MAX(record_id) FROM archive.records').fetchone()[0] or 0
+    sequence = conn.execute("SELECT seq FROM main.sqlite_sequence WHERE name = 'records'").fetchone()
+    if sequence is None:
+        conn.execute("INSERT INTO main.sqlite_sequence (name, seq) VALUES ('records', ?)", (archive_max,))
+        next_id = archive_max
+    else:
+        next_id = max(sequence[0], archive_max)
+    collisions = conn.execute(
+        'SELECT record_id, user_id FROM main.records WHERE record_id IN (SELECT record_id FROM archive.records) ORDER BY record_id').fetchall()
+    for record_id, user_id in collisions:
+        next_id += 1
+        conn.execute('UPDATE main.records SET record_id = ? WHERE record_id = ?', (next_id, record_id))
+        bump_data_versions(conn, 'records', 'SELECT ? AS user_id', (user_id,))
+    conn.execute("UPDATE main.sqlite_sequence SET seq = ? WHERE name = 'records'", (next_id,))
+    conn.commit()
+    return len(collisions)
+
+
+def ensure_archive_schema(conn: sqlite3.Connection):
+    # Expects the archive database attached as `archive`
+    for statement in ARCHIVE_SCHEMA_SQL:
+        conn.execute(statement)
+    # Archives made before records.local_date existed; the day is then worked out like for live records
+    record_columns = {row[1] for row in conn.execute('PRAGMA archive.table_info(records)')}
+    if 'local_date' not in record_columns:
+        conn.execute('ALTER TABLE archive.records ADD COLUMN local_date DATE')
+    conn.execute('CREATE INDEX IF NOT EXISTS archive.ix_records_user_local_date ON records (user_id, local_date)')
+    conn.commit()
+    backfill_local_dates(conn, table='archive.records')
+
+
+def backfill_local_dates(conn: sqlite3.Connection, batch_size: int = ARCHIVE_BATCH_SIZE, table: str = 'records'):
+    # Fills local_date for records written before the column existed, walking the primary key in batches
+    storage_timezone = pytz.timezone(DEFAULT_TIMEZONE)  # consumed_at is stored as Manila wall time
+    timezones = {}
+    last_id, updated = 0, 0
+    while True:
+        rows = conn.execute(f'''
+            SELECT r.record_id, r.consumed_at, u.timezone FROM {table} r
+            LEFT JOIN main.tbl_users u ON u.user_id = r.user_id
+            WHERE r.record_id > ? AND r.local_date IS NULL AND r.consumed_at IS NOT NULL
+            ORDER BY r.record_id LIMIT ?''', (last_id, batch_size)).fetchall()
+        if not rows:
+            return updated
+
+        updates = []
+        for record_id, consumed_at, timezone in rows:
+            timezone = timezone or DEFAULT_TIMEZONE
+            if timezone not in timezones:
+                timezones[timezone] = pytz.timezone(timezone) if timezone in pytz.all_timezones_set else storage_timezone
+            try:
+                consumed = storage_timezone.localize(datetime.fromisoformat(consumed_at))
+                local_date = consumed.astimezone(timezones[timezone]).date().isoformat()
+            except ValueError:
+                local_date = consumed_at[:10]
+            updates.append((local_date, record_id))
+        conn.executemany(f'UPDATE {table} SET local_date = ? WHERE record_id = ?', updates)
+        conn.commit()
+        updated += len(updates)
+        last_id = rows[-1][0]
+        time.sleep(BATCH_PAUSE_SECONDS)
+
+
+def delete_in_batches(conn: sqlite3.Connection, table: str, where: str, params=(), batch_size: int = DELETE_BATCH_SIZE):
+    # Each batch is its own short transaction so a big delete never holds the write lock for long
+    deleted = 0
+    while True:
+        cursor = conn.execute(
+            f'DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT ?)',
+            (*params, batch_size),
+        )
+        conn.commit()
+        deleted += cursor.rowcount
+        if cursor.rowcount < batch_size:
+            return deleted
+        time.sleep(BATCH_PAUSE_SECONDS)
+
+
+def delete_archived_rows(conn: sqlite3.Connection, archive_path: str, where: str, params=(), batch_size: int = DELETE_BATCH_SIZE):
+    # Same batched delete on the archive database, if there is one
+    if not archive_path or not os.path.exists(archive_path):
+        return {}
+    deleted = {}
+    conn.execute('ATTACH DATABASE ? AS archive', (archive_path,))
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM archive.sqlite_master WHERE type = 'table'")}
+        for table in ARCHIVE_TABLES:
+            if table in tables:
+                deleted[f'archive.{table}'] = delete_in_batches(conn, f'archive.{table}', where, params, batch_size)
+    finally:
+        conn.rollback()
+        conn.execute('DETACH DATABASE archive')
+    return deleted
+
+
+def delete_user_cascade(conn: sqlite3.Connection, user_id: int, batch_size: int = DELETE_BATCH_SIZE, archive_path: str = None):
+    # Dependent rows first, the user last, so an interrupted delete can simply be retried.
+    # User ids can be handed out again, so nothing of the old user may stay behind for the next one.
+    deleted = {}
+    tables = existing_tables(conn)
+    for table in USER_DEPENDENT_TABLES:
+        if table in tables:
+            deleted[table] = delete_in_batches(conn, table, 'user_id = ?', (user_id,), batch_size)
+    deleted.update(delete_archived_rows(conn, archive_path, 'user_id = ?', (user_id,), batch_size))
+    conn.execute('DELETE FROM tbl_users WHERE user_id = ?', (user_id,))
+    conn.commit()
+    return deleted
+
+
+def cleanup_orphans(conn: sqlite3.Connection, batch_size: int = DELETE_BATCH_SIZE, archive_path: str = None):
+    # Removes rows left behind by users that were deleted before the cascade existed
+    deleted = {}
+    tables = existing_tables(conn)
+    for table in [table for table in USER_DEPENDENT_TABLES if table in tables]:
+        deleted[table] = delete_in_batches(
+            conn, table,
+            'user_id IS NULL OR user_id NOT IN (SELECT user_id FROM tbl_users)',
+            batch_size=batch_size,
+        )
+    deleted.update(delete_archived_rows(
+        conn, archive_path, 'user_id IS NULL OR user_id NOT IN (SELECT user_id FROM main.tbl_users)', batch_size=batch_size))
+    return deleted
+
+
+def bump_data_versions(conn: sqlite3.Connection, resource: str, user_query: str, params):
+    # Moving rows out changes what the read endpoints return, so their ETags have to change too
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_data_versions'").fetchone():
+        return
+    conn.execute(f'''
+        INSERT INTO user_data_versions (user_id, resource, version, updated_at)
+        SELECT user_id, ?, 1, ? FROM ({user_query}) WHERE true
+        ON CONFLICT (user_id, resource) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at''',
+        (resource, datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f'), *params))
+
+
+def move_rows(conn: sqlite3.Connection, table: str, columns, key: str, ids):
+    # Copies rows into the attached archive database and removes them from the main one
+    placeholders = ', '.join('?' * len(ids))
+    column_list = ', '.join(columns)
+    # A plain INSERT: an id that is already archived is a bug to fail on, not history to overwrite
+    conn.execute(f'INSERT INTO archive.{table} ({column_list}) '
+                 f'SELECT {column_list} FROM main.{table} WHERE {key} IN ({placeholders})', ids)
+    conn.execute(f'DELETE FROM main.{table} WHERE {key} IN ({placeholders})', ids)
+
+
+def archive_old_records(conn: sqlite3.Connection, archive_path: str,
+                        retention_days: int = RETENTION_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE):
+    # consumed_at is stored as Manila local time, so the cutoff is computed in the same zone
+    cutoff = (datetime.now(pytz.timezone('Asia/Manila')) - timedelta(days=retention_days)).strftime('%Y-%m-%d')
+    ensure_retention_schema(conn)
+    ensure_timezone_schema(conn)
+    ensure_record_autoincrement(conn)
+    # Rows without a local_date would reach the archive without one
+    backfill_local_dates(conn)
+    conn.execute('ATTACH DATABASE ? AS archive', (archive_path,))
+    try:
+        ensure_archive_schema(conn)
+        ensure_record_ids_past_archive(conn)
+
+        archived_records = 0
+        while True:
+            ids = [row[0] for row in conn.execute(
+                'SELECT record_id FROM records WHERE consumed_at < ? ORDER BY record_id LIMIT ?', (cutoff, batch_size))]
+            if not ids:
+                break
+            placeholders = ', '.join('?' * len(ids))
+            # Summary, archive copy and delete commit together, so a batch is never counted twice
+            conn.execute(f'''
+                INSERT INTO record_daily_summaries (user_id, date, record_count, carbs, protein, fats, calorie, grams)
+                SELECT user_id, COALESCE(local_date, date(consumed_at)), COUNT(*), SUM(carbs), SUM(protein), SUM(fats), SUM(calorie), SUM(grams)
+                FROM records WHERE record_id IN ({placeholders})
+                GROUP BY user_id, COALESCE(local_date, date(consumed_at))
+                ON CONFLICT (user_id, date) DO UPDATE SET
+                    record_count = record_count + excluded.record_count,
+                    carbs = carbs + excluded.carbs,
+                    protein = protein + excluded.protein,
+                    fats = fats + excluded.fats,
+                    calorie = calorie + excluded.calorie,
+                    grams = grams + excluded.grams''', ids)
+            bump_data_versions(conn, 'records', f'SELECT DISTINCT user_id FROM records WHERE record_id IN ({placeholders})', ids)
+            move_rows(conn, 'records', RECORD_COLUMNS, 'record_id', ids)
+            conn.commit()
+            archived_records += len(ids)
+            time.sleep(BATCH_PAUSE_SECONDS)
+
+        # Every /filter-foods call stores a fresh copy of the catalog; older copies that
+        # nothing in the main database points at any more can go to the archive as well
+        archived_filtered_foods = 0
+        while True:
+            ids = [row[0] for row in conn.execute('''
+                SELECT f.filtered_id FROM filtered_foods f
+                WHERE f.filtered_id < (SELECT MAX(f2.filtered_id) FROM filtered_foods f2
+                                       WHERE f2.user_id = f.user_id AND f2.food_id = f.food_id)
+                  AND NOT EXISTS (SELECT 1 FROM records r WHERE r.filtered_food_id = f.filtered_id)
+                  AND NOT EXISTS (SELECT 1 FROM progress p WHERE p.filtered_id = f.filtered_id)
+                LIMIT ?''', (batch_size,))]
+            if not ids:
+                break
+            placeholders = ', '.join('?' * len(ids))
+            bump_data_versions(conn, 'filtered_foods', f'SELECT DISTINCT user_id FROM filtered_foods WHERE filtered_id IN ({placeholders})', ids)
+            move_rows(conn, 'filtered_foods', FILTERED_FOOD_COLUMNS, 'filtered_id', ids)
+            conn.commit()
+            archived_filtered_foods += len(ids)
+            time.sleep(BATCH_PAUSE_SECONDS)
+    finally:
+        conn.rollback()  # A half-done batch must not be left open, or DETACH fails
+        conn.execute('DETACH DATABASE archive')
+
+    return {'records': archived_records, 'filtered_foods': archived_filtered_foods,
+            'freed_pages': incremental_vacuum(conn)}
+
+
+def enable_incremental_vacuum(conn: sqlite3.Connection):
+    # auto_vacuum can only be switched on an existing database by rebuilding it once
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        return False
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+    return True
+
+
+def incremental_vacuum(conn: sqlite3.Connection, pages_per_step: int = VACUUM_PAGES_PER_STEP):
+    # Returns free pages to the filesystem a few at a time instead of one long VACUUM
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return 0
+    freed = 0
+    while True:
+        free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if free_pages == 0:
+            return freed
+        conn.execute(f'PRAGMA incremental_vacuum({pages_per_step})').fetchall()
+        conn.commit()
+        freed += min(free_pages, pages_per_step)
+        time.sleep(BATCH_PAUSE_SECONDS)
+
+
+class BackupRestarted(Exception):
+    pass
+
+
+def copy_database(source: sqlite3.Connection, target: sqlite3.Connection, pages_per_step: int = BACKUP_PAGES_PER_STEP):
+    # Online backup API: each step holds a read lock only while it copies its pages. A writer
+    # waiting to commit makes the next step return BUSY, and the backup backs off for `sleep`.
+    # Returns how often writes restarted it.
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > MAX_BACKUP_RESTARTS:
+                raise BackupRestarted()
+        last_remaining = remaining
+
+    try:
+        source.backup(target, pages=pages_per_step, progress=progress, sleep=BATCH_PAUSE_SECONDS)
+    except BackupRestarted:
+        # Writers kept changing pages already copied; one step holds the read lock until it's done
+        source.backup(target, pages=-1)
+    return restarts
+
+
+def list_backups(backup_directory: str):
+    # Newest first; the names sort by time
+    if not os.path.isdir(backup_directory):
+        return []
+    names = sorted((name for name in os.listdir(backup_directory) if BACKUP_NAME_PATTERN.match(name)), reverse=True)
+    return [{'name': name, 'size': os.path.getsize(os.path.join(backup_directory, name))} for name in names]
+
+
+def rotate_backups(backup_directory: str, keep: int):
+    removed = []
+    for backup in list_backups(backup_directory)[keep:]:
+        os.remove(os.path.join(backup_directory, backup['name']))
+        removed.append(backup['name'])
+    return removed
+
+
+def count_rows(conn: sqlite3.Connection):
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+    return {table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for table in tables}
+
+
+def verify_backup(backup_path: str, database_path: str):
+    """
+    Restores the backup to a scratch file and checks it the way we'd rely on
+    it: PRAGMA integrity_check must say ok and every live table must be there.
+    Row counts are compared with the live database; differences are listed,
+    but only mean something if nothing was written since the backup.
+    """
+    with tempfile.TemporaryDirectory() as scratch:
+        restored_path = backup_path
+        try:
+            if backup_path.endswith('.gz'):
+                restored_path = os.path.join(scratch, 'restored.db')
+                with gzip.open(backup_path, 'rb') as compressed, open(restored_path, 'wb') as restored:
+                    shutil.copyfileobj(compressed, restored)
+
+            restored = sqlite3.connect(f'file:{restored_path}?mode=ro', uri=True)
+            try:
+                integrity = [row[0] for row in restored.execute('PRAGMA integrity_check')]
+                backup_counts = count_rows(restored)
+            finally:
+                restored.close()
+        except (OSError, EOFError, sqlite3.DatabaseError) as e:
+            # Truncated gzip, not a database at all, ...
+            integrity, backup_counts = [str(e)], {}
+
+    live = sqlite3.connect(f'file:{database_path}?mode=ro', uri=True, timeout=10)
+    try:
+        live_counts = count_rows(live)
+    finally:
+        live.close()
+
+    missing_tables = sorted(set(live_counts) - set(backup_counts))
+    different_counts = {
+        table: {'backup': backup_counts[table], 'live': count}
+        for table, count in live_counts.items()
+        if table in backup_counts and backup_counts[table] != count
+    }
+    return {
+        'ok': integrity == ['ok'] and not missing_tables,
+        'integrity_check': integrity[:20],
+        'tables': len(backup_counts),
+        'rows': sum(backup_counts.values()),
+        'missing_tables': missing_tables,
+        'different_counts': different_counts,
+    }
+
+
+def backup_database(database_path: str, backup_directory: str, keep: int, compress: bool = False,
+                    pages_per_step: int = BACKUP_PAGES_PER_STEP, verify: bool = True):
+    """
+    Snapshot of the live database into backup_directory as
+    nutri-YYYYMMDD-HHMMSS-ffffff-<random>.db (.db.gz with compress), safe
+    while the API and the admin keep writing. Keeps the newest `keep` snapshots.
+    A failed run leaves nothing behind.
+    """
+    started = time.monotonic()
+    os.makedirs(backup_directory, exist_ok=True)
+    name = datetime.utcnow().strftime('nutri-%Y%m%d-%H%M%S-%f') + f'-{uuid.uuid4().hex[:8]}.db' + ('.gz' if compress else '')
+    path = os.path.join(backup_directory, name)
+    # Built under a temporary name so a half-written file is never taken for a backup
+    partial_path = os.path.join(backup_directory, f'.{name}.partial')
+
+    try:
+        source = sqlite3.connect(database_path, timeout=10)
+        try:
+            target = sqlite3.connect(partial_path, timeout=10)
+            try:
+                restarts = copy_database(source, target, pages_per_step)
+                pages = target.execute('PRAGMA page_count').fetchone()[0]
+            finally:
+                target.close()
+        finally:
+            source.close()
+
+        if compress:
+            with open(partial_path, 'rb') as raw, gzip.open(partial_path + '.gz', 'wb', compresslevel=6) as compressed:
+                shutil.copyfileobj(raw, compressed)
+            os.remove(partial_path)
+            os.replace(partial_path + '.gz', path)
+        else:
+            os.replace(partial_path, path)
+    except BaseException:
+        # A half-written copy would only fill the disk; rotation never sees hidden .partial files
+        for leftover in (partial_path, partial_path + '.gz'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+
+    result = {
+        'path': path,
+        'size': os.path.getsize(path),
+        'pages': pages,
+        'restarts': restarts,
+        'seconds': round(time.monotonic() - started, 3),
+        'removed': rotate_backups(backup_directory, keep),
+    }
+    if verify:
+        result['verification'] = verify_backup(path, database_path)
+    return result
+
+
+class BackgroundJob:
+    # Runs one job at a time on a daemon thread and remembers how the last run went
+
+    def __init__(self, name, target):
+        self.name = name
+        self.target = target
+        self.lock = threading.Lock()
+        self.status = {'running': False, 'started_at': None, 'finished_at': None, 'result': None, 'error': None}
+
+    def start(self, *args, **kwargs):
+        with self.lock:
+            if self.status['running']:
+                return False
+            self.status = {'running': True, 'started_at': time.time(), 'finished_at': None, 'result': None, 'error': None}
+        threading.Thread(target=self._run, args=args, kwargs=kwargs, daemon=True).start()
+        return True
+
+    def _run(self, *args, **kwargs):
+        result, error = None, None
+        try:
+            result = self.target(*args, **kwargs)
+        except Exception as e:
+            logging.error(f"Error in {self.name}: {str(e)}")
+            error = str(e)
+        with self.lock:
+            self.status.update(running=False, finished_at=time.time(), result=result, error=error)
+
+
+def init_db(database_path: str, archive_path: str = None):
+    # The API no longer creates tables on import; run this after deploying model changes
+    from sqlalchemy import create_engine, event
+    import database
+    engine = create_engine(f'sqlite:///{database_path}')
+    event.listen(engine, 'connect', database.set_sqlite_pragmas)
+    database.init_db(engine)
+    engine.dispose()
+
+    # create_all skips indexes on tables that already existed
+    conn = sqlite3.connect(database_path, timeout=10)
+    try:
+        ensure_user_indexes(conn)
+        ensure_retention_schema(conn)
+        ensure_timezone_schema(conn)
+        ensure_record_autoincrement(conn)
+        ensure_catalog_change_log(conn)
+        if archive_path and os.path.exists(archive_path):
+            conn.execute('ATTACH DATABASE ? AS archive', (archive_path,))
+            try:
+                ensure_archive_schema(conn)
+                ensure_record_ids_past_archive(conn)
+            finally:
+                conn.execute('DETACH DATABASE archive')
+    finally:
+        conn.close()
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description='NutriGabay database maintenance')
+    parser.add_argument('--db', default=settings.database_path, help='Path to nutri.db')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    init = commands.add_parser('init-db', help='Create any missing tables and indexes')
+    init.add_argument('--archive-db', default=settings.archive_database_path)
+
+    archive = commands.add_parser('archive', help='Summarise and archive old records')
+    archive.add_argument('--archive-db', default=settings.archive_database_path)
+    archive.add_argument('--days', type=int, default=RETENTION_DAYS, help='Keep records newer than this many days')
+    archive.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+
+    commands.add_parser('enable-incremental-vacuum', help='One-time switch of the database to incremental auto-vacuum')
+    cleanup = commands.add_parser('cleanup-orphans', help='Remove rows that belong to deleted users')
+    cleanup.add_argument('--archive-db', default=settings.archive_database_path)
+    commands.add_parser('backfill-local-dates', help='Fill records.local_date for records written before it existed')
+    commands.add_parser('rebuild-frequent-foods', help='Recompute the per-user frequent food counters from records')
+
+    backup = commands.add_parser('backup', help='Snapshot the database while it stays in use')
+    backup.add_argument('--directory', default=settings.backup_directory)
+    backup.add_argument('--keep', type=int, default=settings.backup_keep, help='Snapshots to keep, newest first')
+    backup.add_argument('--compress', action='store_true', help='gzip the snapshot')
+    backup.add_argument('--pages-per-step', type=int, default=BACKUP_PAGES_PER_STEP)
+    backup.add_argument('--no-verify', action='store_true', help='Skip the restore check')
+
+    verify = commands.add_parser('verify-backup', help='Restore a snapshot to a scratch file and check it against the database')
+    verify.add_argument('backup_path')
+
+    args = parser.parse_args()
+    if args.command == 'init-db':
+        init_db(args.db, args.archive_db)
+        print(f'Initialised {args.db}')
+        return
+    if args.command == 'rebuild-frequent-foods':
+        import database
+        import frequent
+        settings.database_path = args.db
+        database.init_engine(settings)
+        db = database.SessionLocal()
+        try:
+            print(f'Rebuilt {frequent.rebuild_frequencies(db)} counters')
+        finally:
+            db.close()
+            database.dispose_engine()
+        return
+    if not os.path.exists(args.db):
+        parser.error(f'{args.db} does not exist')
+    if args.command in ('backup', 'verify-backup'):
+        if args.command == 'backup':
+            result = backup_database(args.db, args.directory, args.keep, args.compress, args.pages_per_step, not args.no_verify)
+            verification = result.get('verification')
+        else:
+            if not os.path.exists(args.backup_path):
+                parser.error(f'{args.backup_path} does not exist')
+            result = verification = verify_backup(args.backup_path, args.db)
+        print(result)
+        if verification is not None and not verification['ok']:
+            raise SystemExit(1)
+        return
+    conn = sqlite3.connect(args.db, timeout=10)
+    try:
+        if args.command == 'archive':
+            print(archive_old_records(conn, args.archive_db, args.days, min(args.batch_size, ARCHIVE_BATCH_SIZE)))
+        elif args.command == 'enable-incremental-vacuum':
+            print('Switched to incremental auto-vacuum' if enable_incremental_vacuum(conn) else 'Already using incremental auto-vacuum')
+        elif args.command == 'cleanup-orphans':
+            ensure_user_indexes(conn)
+            print(cleanup_orphans(conn, archive_path=args.archive_db))
+        elif args.command == 'backfill-local-dates':
+            ensure_timezone_schema(conn)
+            print(f'Backfilled {backfill_local_dates(conn)} records')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import threading
+
+# Minimal in-process metrics, rendered in the Prometheus text format by GET /metrics.
+# Values are per worker; a scraper sums them across workers.
+
+lock = threading.Lock()
+counters = {}
+gauges = {}
+help_texts = {}
+
+
+def describe(name: str, help_text: str):
+    help_texts[name] = help_text
+
+
+def _key(name: str, labels: dict):
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def inc(name: str, labels: dict = None, amount: float = 1):
+    key = _key(name, labels)
+    with lock:
+        counters[key] = counters.get(key, 0) + amount
+
+
+def set_gauge(name: str, value: float, labels: dict = None):
+    with lock:
+        gauges[_key(name, labels)] = value
+
+
+def add_gauge(name: str, amount: float, labels: dict = None):
+    key = _key(name, labels)
+    with lock:
+        gauges[key] = gauges.get(key, 0) + amount
+
+
+def render():
+    lines = []
+    with lock:
+        samples = [("counter", counters), ("gauge", gauges)]
+        for metric_type, values in samples:
+            for name in sorted({name for name, _ in values}):
+                if name in help_texts:
+                    lines.append(f"# HELP {name} {help_texts[name]}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for (sample_name, labels), value in sorted(values.items()):
+                    if sample_name != name:
+                        continue
+                    label_text = ",".join(f'{label}="{label_value}"' for label, label_value in labels)
+                    lines.append(f"{name}{{{label_text}}} {value:g}" if label_text else f"{name} {value:g}")
+    return "\n".join(lines) + "\n"
@@ -1,9 +1,13 @@
-from sqlalchemy import Column, Integer, Float, String, ForeignKey, DateTime, Boolean,Date
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, DateTime, Boolean,Date, Index
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
 from database import Base
 from datetime import datetime
 import pytz  # Import pytz for timezone handling
 
+# Used for users created before they could pick a timezone
+DEFAULT_TIMEZONE = 'Asia/Manila'
+
 
 class User(Base):
     __tablename__ = "tbl_users"
@@ -14,6 +18,7 @@ class User(Base):
     firstname = Column(String)
     lastname = Column(String)
     age = Column(Integer)
+    timezone = Column(String, nullable=False, default=DEFAULT_TIMEZONE, server_default=DEFAULT_TIMEZONE)  # IANA name, decides what "today" means
 
     # Relationships
     bmi_records = relationship("BMI", back_populates="user")
@@ -27,7 +32,7 @@ class BMI(Base):
     height = Column(Float)
     weight = Column(Float)
     bmi = Column(Float)
-    user_id = Column(Integer, ForeignKey("tbl_users.user_id"))
+    user_id = Column(Integer, ForeignKey("tbl_users.user_id"), index=True)
     
     recommendation_id = Column(Integer, ForeignKey("recommendations.id"))
 
@@ -60,11 +65,14 @@ class Food(Base):
     category = Column(String, nullable=False)
     recipe_link = Column(String, nullable=True)
 
+    # Lookup key for the admin bulk import upsert
+    __table_args__ = (Index('ix_foods_name_category', 'food_name', 'category'),)
+
 class FilteredFood(Base):
     __tablename__ = "filtered_foods"
 
     filtered_id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("tbl_users.user_id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("tbl_users.user_id"), nullable=False, index=True)
     food_id = Column(Integer, ForeignKey("foods.food_id"), nullable=False)
     food_name = Column(String, nullable=False)
     type = Column(String, nullable=False)
@@ -86,7 +94,7 @@ class FilteredFood(Base):
 class Record(Base):
     __tablename__ = "records"
     record_id = Column(Integer, primary_key=True, index=True)  # Renamed 'id' to 'record_id'
-    user_id = Column(Integer, ForeignKey("tbl_users.user_id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("tbl_users.user_id"), nullable=False, index=True)
     filtered_food_id = Column(Integer, ForeignKey("filtered_foods.filtered_id"), nullable=True)  # Referenced filtered_id
     food_name = Column(String, nullable=False)
     type = Column(String, nullable=False)
@@ -98,17 +106,21 @@ class Record(Base):
     meal_type = Column(String, nullable=False)
     category = Column(String, nullable=False)
     consumed_at = Column(DateTime, default=lambda: datetime.now(pytz.timezone('Asia/Manila')))  # Timezone
+    local_date = Column(Date, nullable=True)  # Day in the user's timezone, set when the record is written
 
     # Relationships
     user = relationship("User", back_populates="records")
     filtered_food = relationship("FilteredFood", back_populates="records")  # Unchanged
 
+    # AUTOINCREMENT: ids of archived records must never be handed out again (see maintenance.archive_old_records)
+    __table_args__ = (Index('ix_records_user_local_date', 'user_id', 'local_date'), {'sqlite_autoincrement': True})
+
 
 class Progress(Base):
     __tablename__ = "progress"
 
     progress_id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("tbl_users.user_id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("tbl_users.user_id"), nullable=False, index=True)
     filtered_id = Column(Integer, ForeignKey("filtered_foods.filtered_id"), nullable=False)
     total_calories = Column(Integer, nullable=False)  # Track total calories consumed
     date = Column(Date, default=lambda: datetime.now(pytz.timezone('Asia/Manila')).date())  # Date when calories are tracked
@@ -116,4 +128,77 @@ class Progress(Base):
 
     # Relationships
     user = relationship("User", backref="progress_records")
-    filtered_food = relationship("FilteredFood", backref="progress_records")
\ No newline at end of file
+    filtered_food = relationship("FilteredFood", backref="progress_records")
+
+    # `date` is the user's local day (see crud.user_today), so day lookups are exact index hits
+    __table_args__ = (Index('ix_progress_user_date', 'user_id', 'date'),)
+
+
+class RecordSummary(Base):
+    # Per-day totals kept in place of records that were moved to the archive database
+    __tablename__ = "record_daily_summaries"
+
+    summary_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("tbl_users.user_id"), nullable=False)
+    date = Column(Date, nullable=False)
+    record_count = Column(Integer, nullable=False)
+    carbs = Column(Float, nullable=False)
+    protein = Column(Float, nullable=False)
+    fats = Column(Float, nullable=False)
+    calorie = Column(Integer, nullable=False)
+    grams = Column(Integer, nullable=False)
+
+    __table_args__ = (Index('ix_record_daily_summaries_user_date', 'user_id', 'date', unique=True),)
+
+
+class UserDataVersion(Base):
+    # Bumped by every write to a user's records, progress or filtered foods; backs the ETags on the read endpoints
+    __tablename__ = "user_data_versions"
+
+    user_id = Column(Integer, ForeignKey("tbl_users.user_id"), primary_key=True)
+    resource = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False)
+
+
+class FoodChange(Base):
+    # Append-only log of catalog edits, written by triggers on foods (see maintenance.ensure_catalog_change_log)
+    __tablename__ = "food_changes"
+
+    change_id = Column(Integer, primary_key=True)
+    food_id = Column(Integer, nullable=False)
+    operation = Column(String, nullable=False)  # insert, update or delete
+    changed_at = Column(DateTime, nullable=False, server_default=func.current_timestamp())
+
+    __table_args__ = {'sqlite_autoincrement': True}  # change_id must never be reused
+
+
+class FoodFrequency(Base):
+    # Per-user, time-decayed use counts for the quick-log screen (see frequent.py)
+    __tablename__ = "user_food_frequencies"
+
+    user_id = Column(Integer, ForeignKey("tbl_users.user_id"), primary_key=True)
+    food_name = Column(String, primary_key=True)
+    category = Column(String, primary_key=True)
+    filtered_id = Column(Integer, ForeignKey("filtered_foods.filtered_id"), nullable=True)  # From the latest use
+    type = Column(String, nullable=False)
+    carbs = Column(Float, nullable=False)
+    protein = Column(Float, nullable=False)
+    fats = Column(Float, nullable=False)
+    calorie = Column(Integer, nullable=False)
+    grams = Column(Integer, nullable=False)
+    meal_type = Column(String, nullable=False)
+    use_count = Column(Integer, nullable=False, default=0)
+    last_used_at = Column(DateTime, nullable=False)
+    decay_key = Column(Float, nullable=False)  # log2 of the forward-decayed use count
+
+    __table_args__ = (Index('ix_user_food_frequencies_rank', 'user_id', 'decay_key'),)
+
+
+class UserFoodFilter(Base):
+    # The user's latest /filter-foods answers, as the food types they rule out
+    __tablename__ = "user_food_filters"
+
+    user_id = Column(Integer, ForeignKey("tbl_users.user_id"), primary_key=True)
+    excluded_types = Column(String, nullable=False)  # Comma-separated Food.type values, '' for none
+    updated_at = Column(DateTime, nullable=False)
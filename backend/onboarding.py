@@ -0,0 +1,142 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+import crud
+from models import BMI, User, DEFAULT_TIMEZONE
+
+MAX_BULK_USERS = 1000  # Rows per request
+LOOKUP_CHUNK_SIZE = 500  # Usernames per IN (...), well under SQLite's bound-parameter limit
+
+hash_pool = None
+hash_pool_lock = threading.Lock()
+
+
+def hash_password(password: str):
+    # Runs in a pool process
+    return crud.get_pwd_context().hash(password)
+
+
+def get_hash_pool():
+    # Separate processes use every core whichever bcrypt backend passlib picks, and keep the
+    # API's own threadpool free. Spawned, not forked: threadpool threads may be holding locks.
+    global hash_pool
+    with hash_pool_lock:
+        if hash_pool is None:
+            hash_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context("spawn"))
+        return hash_pool
+
+
+def shutdown_hash_pool():
+    global hash_pool
+    with hash_pool_lock:
+        if hash_pool is not None:
+            hash_pool.shutdown(cancel_futures=True)
+            hash_pool = None
+
+
+def hash_passwords(passwords):
+    if len(passwords) <= 1:
+        return [hash_password(password) for password in passwords]
+    pool = get_hash_pool()
+    chunksize = max(1, len(passwords) // ((os.cpu_count() or 1) * 4))
+    return list(pool.map(hash_password, passwords, chunksize=chunksize))
+
+
+def existing_usernames(db: Session, usernames):
+    found = set()
+    for start in range(0, len(usernames), LOOKUP_CHUNK_SIZE):
+        chunk = usernames[start:start + LOOKUP_CHUNK_SIZE]
+        found.update(db.execute(select(User.username).where(User.username.in_(chunk))).scalars())
+    return found
+
+
+def validate_row(row):
+    if row.timezone:
+        crud.validate_timezone(row.timezone)  # Raises HTTPException(400) with the message we report
+    if (row.height is None) != (row.weight is None):
+        return "height and weight must be given together"
+    if row.height is not None and (row.height <= 0 or row.weight <= 0):
+        return "height and weight must be positive"
+    return None
+
+
+def create_users(db: Session, rows):
+    """
+    Registers many users at once: one lookup for taken usernames, passwords
+    hashed across a process pool, then users and their optional first BMI
+    records inserted in a single transaction. Returns one result per row;
+    a bad row never stops the others.
+    """
+    results = [{"index": index, "username": row.username, "status": "error"} for index, row in enumerate(rows)]
+
+    pending = []
+    seen = set()
+    for index, row in enumerate(rows):
+        try:
+            error = validate_row(row)
+        except HTTPException as exc:
+            error = exc.detail
+        if error is None and row.username in seen:
+            error = "Username appears more than once in this batch"
+        seen.add(row.username)
+        if error:
+            results[index]["error"] = error
+        else:
+            pending.append(index)
+
+    taken = existing_usernames(db, [rows[index].username for index in pending])
+    for index in [index for index in pending if rows[index].username in taken]:
+        results[index]["error"] = "Username already registered"
+    pending = [index for index in pending if rows[index].username not in taken]
+
+    hashes = hash_passwords([rows[index].password for index in pending])
+
+    if pending:
+        # DO NOTHING covers a /register that took one of the names since the lookup above
+        statement = sqlite_insert(User).on_conflict_do_nothing(index_elements=[User.username]).returning(User.user_id, User.username)
+        inserted = dict((username, user_id) for user_id, username in db.execute(statement, [
+            {
+                "username": rows[index].username,
+                "hashed_password": hashed,
+                "firstname": rows[index].firstname,
+                "lastname": rows[index].lastname,
+                "age": rows[index].age,
+                "timezone": rows[index].timezone or DEFAULT_TIMEZONE,
+            }
+            for index, hashed in zip(pending, hashes)
+        ]))
+
+        bmi_rows = []
+        for index in pending:
+            user_id = inserted.get(rows[index].username)
+            if user_id is None:
+                results[index]["error"] = "Username already registered"
+                continue
+            results[index].update(status="created", user_id=user_id)
+            if rows[index].height is not None:
+                bmi_value = crud.calculate_bmi(rows[index].weight, rows[index].height)
+                bmi_rows.append((index, {
+                    "height": rows[index].height,
+                    "weight": rows[index].weight,
+                    "bmi": bmi_value,
+                    "user_id": user_id,
+                    "recommendation_id": crud.recommendation_id_for(bmi_value),
+                }))
+
+        if bmi_rows:
+            bmi_ids = db.execute(
+                sqlite_insert(BMI).returning(BMI.bmi_id, sort_by_parameter_order=True),
+                [values for _, values in bmi_rows],
+            ).scalars().all()
+            for (index, _), bmi_id in zip(bmi_rows, bmi_ids):
+                results[index]["bmi_id"] = bmi_id
+        # As crud.create_bmi_record does; also keeps a reused user id from matching the deleted user's ETags
+        crud.bump_data_versions(db, [result["user_id"] for result in results if result["status"] == "created"], "progress", "bmi")
+        db.commit()
+
+    return results
@@ -0,0 +1,262 @@
+import contextvars
+import cProfile
+import functools
+import inspect
+import io
+import json
+import os
+import pstats
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+import uuid
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.concurrency import run_in_threadpool
+
+PROFILE_HEADER = "x-profile-token"  # Carries the admin token to force a profile of one request
+MAX_SQL_STATEMENTS = 500  # Per trace; anything past this is only counted
+TOP_FUNCTIONS = 30  # Rows of the cumulative-time summary stored next to the raw profile
+TRACE_ID_PATTERN = re.compile(r"^\d{13}-[0-9a-f]{8}$")
+SUMMARY_FIELDS = ["trace_id", "method", "path", "reason", "status", "duration_ms", "sql_count", "sql_ms"]
+
+# The trace of the request being handled, if it is being profiled; threadpool calls inherit it
+current_trace = contextvars.ContextVar("current_trace", default=None)
+# Only one cProfile.Profile can be enabled at a time: per thread up to 3.11, per process from 3.12
+# (sys.monitoring), where a second enable() raises ValueError. Whoever holds this runs profiled.
+profiler_lock = threading.Lock()
+
+
+class Trace:
+    def __init__(self, method: str, path: str, reason: str):
+        self.trace_id = f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.reason = reason  # "header" or "sampled"
+        self.started = time.perf_counter()
+        self.status = None
+        self.duration_ms = None
+        self.stats = None
+        self.sql = []
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.lock = threading.Lock()
+
+    def add_profile(self, profiler: cProfile.Profile):
+        with self.lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(profiler)
+            else:
+                self.stats.add(profiler)
+
+    def add_sql(self, statement: str, duration_ms: float):
+        with self.lock:
+            self.sql_count += 1
+            self.sql_ms += duration_ms
+            if len(self.sql) < MAX_SQL_STATEMENTS:
+                self.sql.append({"statement": statement, "ms": round(duration_ms, 3)})
+
+    def summary(self):
+        summary = {field: getattr(self, field) for field in SUMMARY_FIELDS}
+        summary["sql_ms"] = round(self.sql_ms, 3)
+        return summary
+
+
+def start_profiler():
+    # None when another profiler (a debugger, coverage, an outer cProfile) already owns the hook
+    if sys.version_info < (3, 12) and sys.getprofile() is not None:
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None
+    return profiler
+
+
+def profile_call(function):
+    """
+    Wraps an endpoint so it runs under cProfile when its request is being
+    profiled. Sync endpoints run in a threadpool thread, which is why the
+    profiler is switched on here rather than in the middleware.
+    """
+    if getattr(function, "profiled", False):
+        return function  # include_router builds the route again from the already wrapped endpoint
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            trace = current_trace.get()
+            # Concurrent profiled requests run unprofiled rather than fail
+            if trace is None or not profiler_lock.acquire(blocking=False):
+                return await function(*args, **kwargs)
+            try:
+                profiler = start_profiler()
+                if profiler is None:
+                    return await function(*args, **kwargs)
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    profiler.disable()
+                    trace.add_profile(profiler)
+            finally:
+                profiler_lock.release()
+    else:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            trace = current_trace.get()
+            if trace is None or not profiler_lock.acquire(blocking=False):
+                return function(*args, **kwargs)
+            try:
+                profiler = start_profiler()
+                if profiler is None:
+                    return function(*args, **kwargs)
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    profiler.disable()
+                    trace.add_profile(profiler)
+            finally:
+                profiler_lock.release()
+    wrapper.profiled = True
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    # FastAPI reads the signature through functools.wraps, so parameters and response models are unchanged
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, profile_call(endpoint), **kwargs)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_trace.get() is not None:
+        conn.info.setdefault("profile_query_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = current_trace.get()
+    started = conn.info.get("profile_query_started")
+    if trace is not None and started:
+        trace.add_sql(statement, (time.perf_counter() - started.pop()) * 1000)
+
+
+def install_sql_timing():
+    # Listens on every engine, but only when profiling is configured at all
+    if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+
+
+class TraceStore:
+    """
+    Ring buffer of traces on disk: <id>.json holds the summary, SQL list and top
+    functions, <id>.prof the raw cProfile stats (open with pstats or snakeviz).
+    Only the newest `keep` traces are kept.
+    """
+
+    def __init__(self, directory: str, keep: int):
+        self.directory = directory
+        self.keep = keep
+        self.lock = threading.Lock()
+
+    def path(self, trace_id: str, extension: str):
+        if not TRACE_ID_PATTERN.match(trace_id):
+            return None
+        return os.path.join(self.directory, f"{trace_id}.{extension}")
+
+    def trace_ids(self):
+        if not os.path.isdir(self.directory):
+            return []
+        names = [name[:-5] for name in os.listdir(self.directory) if name.endswith(".json")]
+        return sorted((name for name in names if TRACE_ID_PATTERN.match(name)), reverse=True)
+
+    def save(self, trace: Trace):
+        document = trace.summary()
+        document["sql"] = trace.sql
+        if trace.stats is not None:
+            text = io.StringIO()
+            trace.stats.stream = text
+            trace.stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            document["top_functions"] = text.getvalue()
+
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            if trace.stats is not None:
+                trace.stats.dump_stats(self.path(trace.trace_id, "prof"))
+            # Written under a temporary name so list() never sees half a file
+            path = self.path(trace.trace_id, "json")
+            with open(path + ".tmp", "w") as handle:
+                json.dump(document, handle)
+            os.replace(path + ".tmp", path)
+            for old_id in self.trace_ids()[self.keep:]:
+                for extension in ("json", "prof"):
+                    try:
+                        os.remove(self.path(old_id, extension))
+                    except FileNotFoundError:
+                        pass
+
+    def list(self):
+        summaries = []
+        for trace_id in self.trace_ids():
+            document = self.load(trace_id)
+            if document is not None:
+                summaries.append({field: document.get(field) for field in SUMMARY_FIELDS})
+        return summaries
+
+    def load(self, trace_id: str):
+        path = self.path(trace_id, "json")
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path) as handle:
+                return json.load(handle)
+        except OSError:
+            return None  # Rotated away since it was listed
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a request when it carries the admin token in X-Profile-Token, or
+    at random with probability `sample_rate`. Only added to the app when one
+    of those is configured, so a normal deployment pays nothing for it.
+    """
+
+    def __init__(self, app, store: TraceStore, sample_rate: float = 0.0, admin_token: str = None):
+        self.app = app
+        self.store = store
+        self.sample_rate = sample_rate
+        self.admin_token = admin_token.encode() if admin_token else None
+
+    def reason(self, scope):
+        if self.admin_token:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER.encode():
+                    return "header" if secrets.compare_digest(value, self.admin_token) else None
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        reason = self.reason(scope) if scope["type"] == "http" else None
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(scope["method"], scope["path"], reason)
+
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", trace.trace_id.encode())]
+            await send(message)
+
+        token = current_trace.set(trace)
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            current_trace.reset(token)
+            trace.duration_ms = round((time.perf_counter() - trace.started) * 1000, 3)
+            await run_in_threadpool(self.store.save, trace)
@@ -0,0 +1,153 @@
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.orm import Session, aliased
+from models import BMI, FilteredFood, Food, Progress, Recommendation, Record, User, UserDataVersion
+
+# Read paths on Core select()s: rows come back as plain tuples/mappings with no identity map,
+# change tracking or ORM instances. The statements are built once here, so each call only
+# binds parameters and SQLAlchemy serves the compiled SQL from its statement cache.
+
+DEFAULT_DAILY_CALORIES = 2000  # When the user has no BMI record with a recommendation yet
+
+FOODS = select(Food.__table__).order_by(Food.food_id)
+
+FILTERED_FOODS_BY_USER = select(
+    FilteredFood.filtered_id,
+    FilteredFood.food_name,
+    FilteredFood.calorie.label("calories"),
+    FilteredFood.type,
+    FilteredFood.grams,
+    FilteredFood.category.label("categories"),
+    FilteredFood.meal_type.label("mealtype"),
+    FilteredFood.carbs,
+    FilteredFood.protein,
+    FilteredFood.fats,
+    FilteredFood.recipe_link,
+).where(FilteredFood.user_id == bindparam("user_id")).order_by(FilteredFood.filtered_id)
+
+RECORDS_BY_USER = select(
+    Record.record_id,
+    Record.user_id,
+    Record.filtered_food_id.label("filtered_id"),
+    Record.food_name,
+    Record.type,
+    Record.carbs,
+    Record.protein,
+    Record.fats,
+    Record.calorie,
+    Record.grams,
+    Record.meal_type,
+    Record.category,
+    Record.consumed_at,
+    Record.local_date,
+).where(Record.user_id == bindparam("user_id")).order_by(Record.record_id)
+
+PROGRESS_RANGE = select(
+    Progress.progress_id,
+    Progress.user_id,
+    Progress.filtered_id,
+    Progress.total_calories,
+    Progress.date,
+).where(
+    Progress.user_id == bindparam("user_id"),
+    Progress.date >= bindparam("start_date"),
+    Progress.date <= bindparam("end_date"),
+).order_by(Progress.date)
+
+# Daily calories of the plan attached to the user's most recent BMI record
+LATEST_DAILY_CALORIES = (
+    select(Recommendation.daily_calories)
+    .select_from(BMI.__table__.outerjoin(Recommendation.__table__, BMI.recommendation_id == Recommendation.id))
+    .where(BMI.user_id == bindparam("user_id"))
+    .order_by(BMI.bmi_id.desc())
+    .limit(1)
+)
+
+
+# The user with their latest BMI record and its plan, in one round trip
+LatestBMI = aliased(BMI)
+LATEST_BMI_ID = select(func.max(LatestBMI.bmi_id)).where(LatestBMI.user_id == User.user_id).scalar_subquery()
+USER_WITH_LATEST_BMI = (
+    select(
+        User.user_id, User.username, User.firstname, User.lastname, User.age, User.timezone,
+        BMI.bmi_id, BMI.height, BMI.weight, BMI.bmi,
+        Recommendation.daily_calories, Recommendation.plan,
+    )
+    .select_from(
+        User.__table__
+        .outerjoin(BMI.__table__, BMI.bmi_id == LATEST_BMI_ID)
+        .outerjoin(Recommendation.__table__, BMI.recommendation_id == Recommendation.id)
+    )
+    .where(User.user_id == bindparam("user_id"))
+)
+
+PROGRESS_ON_DAY = select(
+    Progress.progress_id,
+    Progress.user_id,
+    Progress.filtered_id,
+    Progress.total_calories,
+    Progress.date,
+).where(Progress.user_id == bindparam("user_id"), Progress.date == bindparam("day"))
+
+DATA_VERSIONS = select(UserDataVersion.resource, UserDataVersion.version).where(UserDataVersion.user_id == bindparam("user_id"))
+
+
+def parse_macro(value):
+    # Macros may be stored like '5g'
+    if isinstance(value, str):
+        return int(float(value.replace('g', '').strip()))
+    return value
+
+
+def with_parsed_macros(row):
+    row = dict(row)
+    for key in ("carbs", "protein", "fats"):
+        row[key] = parse_macro(row[key])
+    return row
+
+
+def get_foods(db: Session):
+    return [dict(row) for row in db.execute(FOODS).mappings()]
+
+
+def get_filtered_foods(db: Session, user_id: int):
+    return [with_parsed_macros(row) for row in db.execute(FILTERED_FOODS_BY_USER, {"user_id": user_id}).mappings()]
+
+
+def get_records(db: Session, user_id: int, start_date=None, end_date=None):
+    # The optional day range is added to the base statement; its cache key still only depends on which bounds are set
+    statement = RECORDS_BY_USER
+    params = {"user_id": user_id}
+    if start_date:
+        statement = statement.where(Record.local_date >= bindparam("start_date"))
+        params["start_date"] = start_date
+    if end_date:
+        statement = statement.where(Record.local_date <= bindparam("end_date"))
+        params["end_date"] = end_date
+    return [with_parsed_macros(row) for row in db.execute(statement, params).mappings()]
+
+
+def get_latest_daily_calories(db: Session, user_id: int):
+    daily_calories = db.execute(LATEST_DAILY_CALORIES, {"user_id": user_id}).scalar()
+    return daily_calories if daily_calories is not None else DEFAULT_DAILY_CALORIES
+
+
+def get_user_with_latest_bmi(db: Session, user_id: int):
+    return db.execute(USER_WITH_LATEST_BMI, {"user_id": user_id}).first()
+
+
+def get_progress_on_day(db: Session, user_id: int, day):
+    row = db.execute(PROGRESS_ON_DAY, {"user_id": user_id, "day": day}).mappings().first()
+    return dict(row) if row else None
+
+
+def get_data_versions(db: Session, user_id: int):
+    return dict(db.execute(DATA_VERSIONS, {"user_id": user_id}).all())
+
+
+def get_progress_range(db: Session, user_id: int, start_date, end_date):
+    rows = db.execute(PROGRESS_RANGE, {"user_id": user_id, "start_date": start_date, "end_date": end_date}).mappings().all()
+    if not rows:
+        return []
+    # Every day in the range reports the same current plan, so it is looked up once, not per row
+    bmi = {"daily_calories": get_latest_daily_calories(db, user_id)}
+    return [{**row, "bmi": bmi} for row in rows]
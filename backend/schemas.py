@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime, date
-from typing import Optional
+from typing import Optional, Union
 from typing import List
 
 class UserCreate(BaseModel):
@@ -9,6 +9,7 @@ class UserCreate(BaseModel):
     firstname: str  
     lastname: str   
     age: int        
+    timezone: Optional[str] = None  # IANA name, defaults to Asia/Manila
 
 class User(BaseModel):
     user_id: int
@@ -16,10 +17,14 @@ class User(BaseModel):
     firstname: str
     lastname: str
     age: int
+    timezone: str
 
     class Config:
         orm_mode = True
 
+class UpdateTimezoneSchema(BaseModel):
+    timezone: str
+
 class UserLogin(BaseModel):  
     username: str
     password: str
@@ -111,6 +116,7 @@ class RecordResponse(BaseModel):
     meal_type: str
     category: str
     consumed_at: datetime
+    local_date: Optional[date] = None
 
 
 
@@ -166,7 +172,113 @@ class NewRecordCreate(BaseModel):
     grams: int
     meal_type: str
     category: str
-    consumed_at: datetime = datetime.now()
+    consumed_at: Optional[datetime] = None  # Defaults to now when the record is stored
+
+    class Config:
+        orm_mode = True
+
+class RecordSummaryResponse(BaseModel):
+    date: date
+    record_count: int
+    carbs: float
+    protein: float
+    fats: float
+    calorie: int
+    grams: int
 
     class Config:
         orm_mode = True
+
+class SimilarFoodResponse(BaseModel):
+    food_id: int
+    food_name: str
+    type: str
+    carbs: int
+    protein: int
+    fats: int
+    calorie: int
+    grams: int
+    meal_type: str
+    category: str
+    recipe_link: Optional[str]
+    distance: float  # Euclidean distance between normalized per-gram macro vectors
+
+class FrequentFoodResponse(BaseModel):
+    filtered_id: Optional[int]  # Pass to /record-consumption to log it again
+    food_name: str
+    type: str
+    carbs: float
+    protein: float
+    fats: float
+    calorie: int
+    grams: int
+    meal_type: str
+    category: str
+    use_count: int
+    last_used_at: datetime
+    score: float  # Uses weighted by recency, halving every HALF_LIFE_DAYS
+
+class DashboardBMIResponse(BaseModel):
+    bmi_id: int
+    height: float
+    weight: float
+    bmi: float
+
+class DashboardResponse(BaseModel):
+    date: date  # The user's local day that "today" refers to
+    user: User
+    bmi: Optional[DashboardBMIResponse]
+    recommendation: Optional[RecommendationResponse]
+    daily_calories: int  # From the recommendation, or the 2000 kcal default
+    progress_today: Optional[ProgressResponse]
+    filtered_foods: List[FilteredFoodResponse]
+    records_today: List[RecordResponse]
+
+class BulkUserCreate(UserCreate):
+    # Optional first BMI record, created together with the user
+    height: Optional[float] = None
+    weight: Optional[float] = None
+
+class BulkUsersCreate(BaseModel):
+    users: List[BulkUserCreate]
+
+class BulkUserResult(BaseModel):
+    index: int  # Position in the request's users list
+    username: str
+    status: str  # "created" or "error"
+    user_id: Optional[int] = None
+    bmi_id: Optional[int] = None
+    error: Optional[str] = None
+
+class BulkUsersResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkUserResult]
+
+class CatalogFoodResponse(BaseModel):
+    # Same values as /foods returns, so synced rows and a full download look alike
+    food_id: int
+    food_name: str
+    type: str
+    carbs: Union[int, float, str]  # The seeded catalog stores macros as text like '5g'
+    protein: Union[int, float, str]
+    fats: Union[int, float, str]
+    calorie: int
+    grams: int
+    meal_type: str
+    category: str
+    recipe_link: Optional[str]
+    version: Optional[int] = None  # Catalog version of the food's last change; unset in a full snapshot
+    updated_at: Optional[datetime] = None
+
+class FoodTombstone(BaseModel):
+    food_id: int
+    version: int
+    deleted_at: datetime
+
+class FoodChangesResponse(BaseModel):
+    version: int  # Pass back as ?since= on the next sync
+    reset: bool  # True when foods is the whole catalog and the local copy should be replaced
+    has_more: bool
+    foods: List[CatalogFoodResponse]
+    deleted: List[FoodTombstone]
@@ -0,0 +1,229 @@
+import heapq
+import math
+import threading
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# carbs, protein, fats, calorie per gram
+DIMENSIONS = 4
+# A tree is rebuilt from scratch once this share of its nodes are deleted or were inserted after the build
+REBUILD_RATIO = 0.25
+
+
+def parse_grams_value(value):
+    # Macros are stored like '5g' in the catalog
+    if isinstance(value, str):
+        return float(value.replace('g', '').strip() or 0)
+    return float(value or 0)
+
+
+def per_gram_vector(row):
+    grams = float(row["grams"] or 0)
+    if grams <= 0:
+        return None
+    return (
+        parse_grams_value(row["carbs"]) / grams,
+        parse_grams_value(row["protein"]) / grams,
+        parse_grams_value(row["fats"]) / grams,
+        float(row["calorie"] or 0) / grams,
+    )
+
+
+class Node:
+    __slots__ = ("point", "food_id", "food_type", "axis", "left", "right", "active")
+
+    def __init__(self, point, food_id, food_type, axis):
+        self.point = point
+        self.food_id = food_id
+        self.food_type = food_type
+        self.axis = axis
+        self.left = None
+        self.right = None
+        self.active = True
+
+
+class KDTree:
+    """
+    KD-tree over normalized macro vectors. Inserts attach new leaves and deletes
+    only mark nodes inactive, so catalog edits never need a full rebuild right away.
+    """
+
+    def __init__(self, entries=()):
+        self.nodes = {}
+        self.root = None
+        self.changes = 0
+        self.build(list(entries))
+
+    def build(self, entries):
+        # entries: (point, food_id, food_type)
+        self.nodes = {}
+        self.changes = 0
+        self.root = self._build(entries, 0)
+
+    def _build(self, entries, depth):
+        if not entries:
+            return None
+        axis = depth % DIMENSIONS
+        entries.sort(key=lambda entry: entry[0][axis])
+        middle = len(entries) // 2
+        point, food_id, food_type = entries[middle]
+        node = Node(point, food_id, food_type, axis)
+        self.nodes[food_id] = node
+        node.left = self._build(entries[:middle], depth + 1)
+        node.right = self._build(entries[middle + 1:], depth + 1)
+        return node
+
+    def entries(self):
+        return [(node.point, node.food_id, node.food_type) for node in self.nodes.values() if node.active]
+
+    def needs_rebuild(self):
+        return self.changes > max(len(self.nodes), 1) * REBUILD_RATIO
+
+    def insert(self, point, food_id, food_type):
+        self.remove(food_id)
+        if self.root is None:
+            self.root = Node(point, food_id, food_type, 0)
+            self.nodes[food_id] = self.root
+            return
+        node = self.root
+        while True:
+            side = "left" if point[node.axis] < node.point[node.axis] else "right"
+            child = getattr(node, side)
+            if child is None:
+                child = Node(point, food_id, food_type, (node.axis + 1) % DIMENSIONS)
+                setattr(node, side, child)
+                self.nodes[food_id] = child
+                self.changes += 1
+                return
+            node = child
+
+    def remove(self, food_id):
+        node = self.nodes.pop(food_id, None)
+        if node is not None:
+            node.active = False
+            self.changes += 1
+
+    def nearest(self, point, k, accept):
+        # Max-heap of the best k as (-distance, food_id)
+        best = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            diff = point[node.axis] - node.point[node.axis]
+            near, far = (node.left, node.right) if diff < 0 else (node.right, node.left)
+
+            if node.active and accept(node):
+                distance = math.dist(point, node.point)
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, node.food_id))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, node.food_id))
+
+            # The far side can only help if the splitting plane is closer than the current k-th best
+            if len(best) < k or abs(diff) < -best[0][0]:
+                stack.append(far)
+            stack.append(near)
+        return sorted((-negative, food_id) for negative, food_id in best)
+
+
+class SimilarFoodsIndex:
+    """
+    One KD-tree per meal_type over the foods table, kept current by replaying
+    the food_changes log that the triggers on foods write.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.trees = {}
+        self.meal_types = {}
+        self.scale = (1.0,) * DIMENSIONS
+        self.last_change_id = None
+
+    def normalize(self, vector):
+        return tuple(value / scale for value, scale in zip(vector, self.scale))
+
+    def rebuild(self, db: Session):
+        last_change_id = db.execute(text("SELECT COALESCE(MAX(change_id), 0) FROM food_changes")).scalar()
+        rows = db.execute(text("SELECT food_id, type, carbs, protein, fats, calorie, grams, meal_type FROM foods")).mappings().all()
+        vectors = [(row, per_gram_vector(row)) for row in rows]
+        vectors = [(row, vector) for row, vector in vectors if vector is not None]
+
+        # Scale every dimension by its spread so calories don't drown out the macros
+        if vectors:
+            scale = []
+            for axis in range(DIMENSIONS):
+                values = [vector[axis] for _, vector in vectors]
+                mean = sum(values) / len(values)
+                spread = math.sqrt(sum((value - mean) ** 2 for value in values) / len(values))
+                scale.append(spread or 1.0)
+            self.scale = tuple(scale)
+
+        by_meal_type = {}
+        self.meal_types = {}
+        for row, vector in vectors:
+            by_meal_type.setdefault(row["meal_type"], []).append((self.normalize(vector), row["food_id"], row["type"]))
+            self.meal_types[row["food_id"]] = row["meal_type"]
+        self.trees = {meal_type: KDTree(entries) for meal_type, entries in by_meal_type.items()}
+        self.last_change_id = last_change_id
+
+    def apply_changes(self, db: Session):
+        changes = db.execute(
+            text("SELECT change_id, food_id FROM food_changes WHERE change_id > :last ORDER BY change_id"),
+            {"last": self.last_change_id},
+        ).all()
+        if not changes:
+            return
+
+        changed_ids = list({food_id for _, food_id in changes})
+        for start in range(0, len(changed_ids), 500):
+            part = changed_ids[start:start + 500]
+            placeholders = ", ".join(f":id{i}" for i in range(len(part)))
+            rows = db.execute(
+                text(f"SELECT food_id, type, carbs, protein, fats, calorie, grams, meal_type FROM foods WHERE food_id IN ({placeholders})"),
+                {f"id{i}": food_id for i, food_id in enumerate(part)},
+            ).mappings().all()
+            current = {row["food_id"]: row for row in rows}
+
+            for food_id in part:
+                old_meal_type = self.meal_types.pop(food_id, None)
+                if old_meal_type in self.trees:
+                    self.trees[old_meal_type].remove(food_id)
+                row = current.get(food_id)
+                vector = per_gram_vector(row) if row else None
+                if vector is None:
+                    continue  # Deleted, or has no grams to normalize by
+                tree = self.trees.setdefault(row["meal_type"], KDTree())
+                tree.insert(self.normalize(vector), food_id, row["type"])
+                self.meal_types[food_id] = row["meal_type"]
+
+        for tree in self.trees.values():
+            if tree.needs_rebuild():
+                tree.build(tree.entries())
+        self.last_change_id = changes[-1][0]
+
+    def refresh(self, db: Session):
+        with self.lock:
+            if self.last_change_id is None:
+                self.rebuild(db)
+            else:
+                self.apply_changes(db)
+
+    def similar(self, db: Session, food_id: int, limit: int = 10, excluded_types=frozenset()):
+        """
+        Foods with the closest per-gram macros to `food_id`, from the same meal_type,
+        skipping any type in `excluded_types`. Returns [(distance, food_id)].
+        """
+        self.refresh(db)
+        with self.lock:
+            meal_type = self.meal_types.get(food_id)
+            tree = self.trees.get(meal_type)
+            if tree is None or food_id not in tree.nodes:
+                return None
+            point = tree.nodes[food_id].point
+            accept = lambda node: node.food_id != food_id and node.food_type not in excluded_types
+            return tree.nearest(point, limit, accept)
+
+
+food_index = SimilarFoodsIndex()
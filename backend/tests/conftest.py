@@ -0,0 +1,110 @@
+import os
+import shutil
+import sqlite3
+import sys
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import maintenance  # noqa: E402
+from config import Settings  # noqa: E402
+from main import create_app  # noqa: E402
+
+# Answers to the onboarding questions that keep every food
+NO_RESTRICTIONS = {
+    "pork": False,  # True means "no pork"
+    "allergic_to_milk": False,
+    "allergic_to_fish": False,
+    "allergic_to_soy": False,
+    "allergic_to_chicken": False,
+    "allergic_to_mussels": False,
+    "allergic_to_beef": False,
+}
+
+
+class FakeRedis:
+    """
+    In-memory stand-in for redis.Redis: values come back as bytes and
+    set() honours ex= and nx= the way the real client does.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and time.monotonic() >= expires:
+            del self.data[key]
+            return None
+        return value
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and self.get(key) is not None:
+            return None
+        if isinstance(value, str):
+            value = value.encode()
+        self.data[key] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+
+@pytest.fixture
+def settings(tmp_path):
+    # A throwaway copy of nutri.db, so the catalog and recommendations are the real ones
+    database_path = str(tmp_path / "nutri.db")
+    shutil.copy(os.path.join(BACKEND_DIR, "nutri.db"), database_path)
+    maintenance.init_db(database_path)
+    return Settings(
+        database_path=database_path,
+        archive_database_path=str(tmp_path / "nutri_archive.db"),
+        route_limits={},
+        profile_directory=str(tmp_path / "profiles"),
+        backup_directory=str(tmp_path / "backups"),
+    )
+
+
+@pytest.fixture
+def client(settings):
+    with TestClient(create_app(settings)) as client:
+        yield client
+
+
+@pytest.fixture
+def admin_client(settings, monkeypatch):
+    import admin
+    monkeypatch.setattr(admin, "settings", settings)
+    monkeypatch.setattr(admin, "indexes_checked", False)
+    return admin.app.test_client()
+
+
+@pytest.fixture
+def db_conn(settings):
+    conn = sqlite3.connect(settings.database_path)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def user_id(db_conn):
+    # Inserted directly; registering would spend a bcrypt hash on every test
+    with db_conn:
+        user_id = db_conn.execute(
+            "INSERT INTO tbl_users (username, hashed_password, firstname, lastname, age, timezone) "
+            "VALUES ('test-user', 'x', 'Test', 'User', 30, 'Asia/Manila')"
+        ).lastrowid
+        db_conn.execute(
+            "INSERT INTO bmi_data (height, weight, bmi, user_id, recommendation_id) VALUES (1.7, 65.0, 22.5, ?, 2)", (user_id,))
+    return user_id
+
+
+@pytest.fixture
+def filtered_foods(client, user_id):
+    response = client.post(f"/filter-foods/{user_id}", json=NO_RESTRICTIONS)
+    assert response.status_code == 200
+    return response.json()
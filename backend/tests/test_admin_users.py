@@ -0,0 +1,85 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import maintenance
+
+
+def log_food(client, user_id, filtered_foods):
+    response = client.post("/record-consumption", json={"user_id": user_id, "filtered_id": filtered_foods[0]["filtered_id"]})
+    assert response.status_code == 200
+
+
+def add_user(db_conn, username):
+    with db_conn:
+        return db_conn.execute("INSERT INTO tbl_users (username, hashed_password, firstname, lastname, age) VALUES (?, 'x', 'Other', 'User', 40)",
+                               (username,)).lastrowid
+
+
+def user_rows(conn, user_id, tables):
+    return {table: conn.execute(f"SELECT COUNT(*) FROM {table} WHERE user_id = ?", (user_id,)).fetchone()[0] for table in tables}
+
+
+def test_user_table_is_paged_and_searchable(admin_client, db_conn):
+    for number in range(30):
+        add_user(db_conn, f"paged-{number:02d}")
+
+    first_page = admin_client.get("/user?q=paged-&sort=username&per_page=25").get_data(as_text=True)
+    second_page = admin_client.get("/user?q=paged-&sort=username&per_page=25&page=2").get_data(as_text=True)
+
+    assert "paged-00" in first_page and "paged-24" in first_page and "paged-25" not in first_page
+    assert "paged-25" in second_page and "paged-29" in second_page and "paged-00" not in second_page
+
+
+def test_unknown_sort_column_falls_back_to_the_default(admin_client):
+    response = admin_client.get("/user?sort=hashed_password;DROP TABLE tbl_users")
+
+    assert response.status_code == 200
+
+
+def test_delete_removes_everything_the_user_owns(client, admin_client, db_conn, settings, user_id, filtered_foods):
+    other_id = add_user(db_conn, "bystander")
+    with db_conn:
+        db_conn.execute("INSERT INTO bmi_data (height, weight, bmi, user_id, recommendation_id) VALUES (1.8, 80, 24.7, ?, 2)", (other_id,))
+    log_food(client, user_id, filtered_foods)
+    log_food(client, user_id, filtered_foods)
+    client.post(f"/progress/{user_id}/update", params={"filtered_id": filtered_foods[0]["filtered_id"]})
+    # One record goes to the archive (and the daily summaries) first
+    old = (datetime.now() - timedelta(days=maintenance.RETENTION_DAYS + 1)).strftime("%Y-%m-%d %H:%M:%S")
+    with db_conn:
+        db_conn.execute("UPDATE records SET consumed_at = ? WHERE record_id = (SELECT MIN(record_id) FROM records WHERE user_id = ?)",
+                        (old, user_id))
+    maintenance.archive_old_records(db_conn, settings.archive_database_path)
+    assert all(user_rows(db_conn, user_id, maintenance.USER_DEPENDENT_TABLES).values())
+
+    response = admin_client.post(f"/delete_user/{user_id}")
+
+    assert response.status_code == 302
+    assert db_conn.execute("SELECT COUNT(*) FROM tbl_users WHERE user_id = ?", (user_id,)).fetchone()[0] == 0
+    assert not any(user_rows(db_conn, user_id, maintenance.USER_DEPENDENT_TABLES).values())
+    archive = sqlite3.connect(settings.archive_database_path)
+    try:
+        assert not any(user_rows(archive, user_id, maintenance.ARCHIVE_TABLES).values())
+    finally:
+        archive.close()
+    assert user_rows(db_conn, other_id, ["bmi_data"]) == {"bmi_data": 1}
+
+
+def test_delete_works_in_small_batches(client, db_conn, user_id, filtered_foods):
+    for _ in range(5):
+        log_food(client, user_id, filtered_foods)
+
+    deleted = maintenance.delete_user_cascade(db_conn, user_id, batch_size=2)
+
+    assert deleted["records"] == 5
+    assert deleted["filtered_foods"] == len(filtered_foods)
+
+
+def test_cleanup_orphans_removes_rows_of_users_deleted_without_the_cascade(client, db_conn, settings, user_id, filtered_foods):
+    log_food(client, user_id, filtered_foods)
+    with db_conn:
+        db_conn.execute("DELETE FROM tbl_users WHERE user_id = ?", (user_id,))
+
+    deleted = maintenance.cleanup_orphans(db_conn, archive_path=settings.archive_database_path)
+
+    assert deleted["records"] >= 1 and deleted["filtered_foods"] >= len(filtered_foods)
+    assert not any(user_rows(db_conn, user_id, maintenance.USER_DEPENDENT_TABLES).values())
@@ -0,0 +1,99 @@
+import asyncio
+import dataclasses
+
+import pytest
+from fastapi.testclient import TestClient
+
+import cache
+import metrics
+from admission import RouteGate
+from config import RouteLimit
+from conftest import NO_RESTRICTIONS
+from main import create_app
+
+FILTER_FOODS = "POST /filter-foods/{user_id}"
+
+
+@pytest.fixture
+def limited_client(settings):
+    # Two filter-foods calls per user, then nothing for a very long time
+    limits = {FILTER_FOODS: RouteLimit(concurrency=2, queue=4, queue_timeout=2.0, rate=0.001, burst=2, key="user")}
+    with TestClient(create_app(dataclasses.replace(settings, route_limits=limits))) as client:
+        yield client
+
+
+def sample(name, **labels):
+    # The value of one line of /metrics, as this worker has counted it so far
+    label_text = ",".join(f'{label}="{value}"' for label, value in sorted(labels.items()))
+    line_start = f"{name}{{{label_text}}} " if label_text else f"{name} "
+    for line in metrics.render().splitlines():
+        if line.startswith(line_start):
+            return float(line[len(line_start):])
+    return 0
+
+
+def filter_foods(client, user_id):
+    return client.post(f"/filter-foods/{user_id}", json=NO_RESTRICTIONS)
+
+
+def test_over_the_rate_gets_429(limited_client, user_id):
+    shed = sample("admission_shed_total", route=FILTER_FOODS, reason="rate")
+    admitted = sample("admission_admitted_total", route=FILTER_FOODS)
+
+    responses = [filter_foods(limited_client, user_id) for _ in range(3)]
+
+    assert [response.status_code for response in responses] == [200, 200, 429]
+    assert responses[2].json() == {"detail": "Too many requests, slow down."}
+    assert int(responses[2].headers["Retry-After"]) > 1
+    assert sample("admission_shed_total", route=FILTER_FOODS, reason="rate") == shed + 1
+    assert sample("admission_admitted_total", route=FILTER_FOODS) == admitted + 2
+
+
+def test_rate_is_kept_per_user(limited_client, user_id, db_conn):
+    with db_conn:
+        other_id = db_conn.execute("INSERT INTO tbl_users (username, hashed_password, firstname, lastname, age) "
+                                   "VALUES ('other-user', 'x', 'Other', 'User', 40)").lastrowid
+    for _ in range(2):
+        filter_foods(limited_client, user_id)
+
+    assert filter_foods(limited_client, user_id).status_code == 429
+    assert filter_foods(limited_client, other_id).status_code == 200
+
+
+def test_unlisted_routes_are_never_limited(limited_client, user_id):
+    assert all(limited_client.get(f"/bmi/user/{user_id}").status_code == 200 for _ in range(10))
+
+
+def test_full_queue_and_queue_timeout_are_refused():
+    async def scenario():
+        no_queue = RouteGate("no queue", RouteLimit(concurrency=1, queue=0, queue_timeout=1.0, rate=1, burst=1))
+        short_wait = RouteGate("short wait", RouteLimit(concurrency=1, queue=1, queue_timeout=0.01, rate=1, burst=1))
+        results = [await no_queue.acquire(), await no_queue.acquire(), await short_wait.acquire(), await short_wait.acquire()]
+        no_queue.release()
+        results.append(await no_queue.acquire())
+        return results, short_wait.waiting
+
+    results, waiting = asyncio.run(scenario())
+
+    assert results == [True, False, True, False, True]
+    assert waiting == 0
+
+
+def test_metrics_report_the_response_cache(client, user_id, monkeypatch):
+    monkeypatch.setattr(cache, "response_cache", cache.ResponseCache(cache.MemoryBackend(), ttl=60))
+    hits = sample("response_cache_requests_total", resource="bmi", result="hit")
+    misses = sample("response_cache_requests_total", resource="bmi", result="miss")
+    for _ in range(3):
+        client.get(f"/bmi/user/{user_id}")
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert "# TYPE response_cache_requests_total counter" in body
+    assert "# HELP response_cache_hit_ratio Share of per-user response cache lookups that hit" in body
+    assert sample("response_cache_requests_total", resource="bmi", result="hit") == hits + 2
+    assert sample("response_cache_requests_total", resource="bmi", result="miss") == misses + 1
+    ratio = sample("response_cache_hit_ratio", resource="bmi")
+    assert ratio == pytest.approx((hits + 2) / (hits + misses + 3), abs=1e-5)
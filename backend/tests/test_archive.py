@@ -0,0 +1,100 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import maintenance
+
+OLD = (datetime.now() - timedelta(days=maintenance.RETENTION_DAYS + 1)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def log_food(client, user_id, filtered_foods):
+    response = client.post("/record-consumption", json={"user_id": user_id, "filtered_id": filtered_foods[0]["filtered_id"]})
+    assert response.status_code == 200
+    return response.json()["record_id"]
+
+
+def age_records(db_conn, user_id):
+    with db_conn:
+        db_conn.execute("UPDATE records SET consumed_at = ? WHERE user_id = ?", (OLD, user_id))
+
+
+def archived_ids(settings, user_id):
+    archive = sqlite3.connect(settings.archive_database_path)
+    try:
+        return [row[0] for row in archive.execute("SELECT record_id FROM records WHERE user_id = ? ORDER BY record_id", (user_id,))]
+    finally:
+        archive.close()
+
+
+def test_archiving_twice_keeps_both_records(client, db_conn, settings, user_id, filtered_foods):
+    # The seeded records are old as well; without them the table is empty after the first run
+    with db_conn:
+        db_conn.execute("DELETE FROM records")
+    first = log_food(client, user_id, filtered_foods)
+    age_records(db_conn, user_id)
+    maintenance.archive_old_records(db_conn, settings.archive_database_path)
+
+    # The records table is empty now; the next id must still not be the archived one
+    second = log_food(client, user_id, filtered_foods)
+    age_records(db_conn, user_id)
+    maintenance.archive_old_records(db_conn, settings.archive_database_path)
+
+    assert second > first
+    assert archived_ids(settings, user_id) == [first, second]
+    records = client.get(f"/records/{user_id}?include_archived=true").json()
+    assert sorted(record["record_id"] for record in records) == [first, second]
+
+
+def test_live_record_holding_an_archived_id_is_renumbered(client, db_conn, settings, user_id, filtered_foods):
+    # What a database archived before ids were monotonic can look like
+    record_id = log_food(client, user_id, filtered_foods)
+    archive = sqlite3.connect(settings.archive_database_path)
+    with archive:
+        archive.execute("""CREATE TABLE records (
+            record_id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER NOT NULL, filtered_food_id INTEGER,
+            food_name VARCHAR NOT NULL, type VARCHAR NOT NULL, carbs INTEGER NOT NULL, protein INTEGER NOT NULL,
+            fats INTEGER NOT NULL, calorie INTEGER NOT NULL, grams INTEGER NOT NULL, meal_type VARCHAR NOT NULL,
+            category VARCHAR NOT NULL, consumed_at DATETIME, local_date DATE)""")
+        archive.execute("INSERT INTO records VALUES (?, ?, NULL, 'Turon', 'Snack ', 30, 2, 6, 180, 80, 'Snack', 'Dessert', ?, NULL)",
+                        (record_id, user_id, OLD))
+    archive.close()
+
+    maintenance.init_db(settings.database_path, settings.archive_database_path)
+
+    renumbered = db_conn.execute("SELECT record_id FROM records WHERE user_id = ?", (user_id,)).fetchone()[0]
+    assert renumbered > record_id
+    age_records(db_conn, user_id)
+    maintenance.archive_old_records(db_conn, settings.archive_database_path)
+    assert archived_ids(settings, user_id) == [record_id, renumbered]
+
+
+def summaries(client, user_id, start_date, end_date):
+    response = client.get(f"/records/{user_id}/daily-summaries", params={"start_date": start_date, "end_date": end_date})
+    assert response.status_code == 200
+    return response.json()
+
+
+def archive_on_day(client, db_conn, settings, user_id, filtered_foods, day, count):
+    for _ in range(count):
+        log_food(client, user_id, filtered_foods)
+    with db_conn:
+        db_conn.execute("UPDATE records SET consumed_at = ?, local_date = ? WHERE user_id = ? AND consumed_at > ?",
+                        (OLD, day, user_id, OLD))
+    maintenance.archive_old_records(db_conn, settings.archive_database_path)
+
+
+def test_daily_summaries_total_the_archived_days(client, db_conn, settings, user_id, filtered_foods):
+    food = db_conn.execute("SELECT carbs, protein, fats, calorie, grams FROM filtered_foods WHERE filtered_id = ?",
+                           (filtered_foods[0]["filtered_id"],)).fetchone()
+    carbs, protein, fats, calorie, grams = (float(str(value).replace("g", "")) for value in food)
+    archive_on_day(client, db_conn, settings, user_id, filtered_foods, "2020-03-01", 2)
+    archive_on_day(client, db_conn, settings, user_id, filtered_foods, "2020-03-03", 1)
+    # A later run that reaches a day already summarised adds to it
+    archive_on_day(client, db_conn, settings, user_id, filtered_foods, "2020-03-01", 1)
+
+    days = summaries(client, user_id, "2020-03-01", "2020-03-31")
+
+    assert [(day["date"], day["record_count"]) for day in days] == [("2020-03-01", 3), ("2020-03-03", 1)]
+    assert days[0] == {"date": "2020-03-01", "record_count": 3, "carbs": 3 * carbs, "protein": 3 * protein, "fats": 3 * fats,
+                       "calorie": 3 * calorie, "grams": 3 * grams}
+    assert [day["date"] for day in summaries(client, user_id, "2020-03-02", "2020-03-03")] == ["2020-03-03"]
+    assert summaries(client, user_id, "2021-01-01", "2021-01-31") == []
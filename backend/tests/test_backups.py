@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+import maintenance
+
+
+def test_backups_in_the_same_second_get_their_own_files(settings):
+    first = maintenance.backup_database(settings.database_path, settings.backup_directory, keep=5, verify=False)
+    second = maintenance.backup_database(settings.database_path, settings.backup_directory, keep=5, verify=False)
+
+    assert first["path"] != second["path"]
+    assert [backup["name"] for backup in maintenance.list_backups(settings.backup_directory)] == \
+        sorted([os.path.basename(first["path"]), os.path.basename(second["path"])], reverse=True)
+
+
+def test_failed_backup_leaves_no_partial_file(settings, monkeypatch):
+    def fail(source, target, pages_per_step):
+        target.execute("CREATE TABLE half_written (id INTEGER)")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(maintenance, "copy_database", fail)
+    with pytest.raises(OSError):
+        maintenance.backup_database(settings.database_path, settings.backup_directory, keep=5, compress=True)
+
+    assert os.listdir(settings.backup_directory) == []
+
+
+def test_compressed_backup_verifies(settings):
+    result = maintenance.backup_database(settings.database_path, settings.backup_directory, keep=5, compress=True)
+
+    assert result["path"].endswith(".db.gz")
+    assert result["verification"]["ok"]
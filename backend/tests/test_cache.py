@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import cache
+import maintenance
+import queries
+from conftest import NO_RESTRICTIONS, FakeRedis
+
+
+@pytest.fixture(params=["memory", "redis"])
+def response_cache(request, client, monkeypatch):
+    if request.param == "memory":
+        backend = cache.MemoryBackend()
+    else:
+        backend = cache.RedisBackend(FakeRedis())
+    response_cache = cache.ResponseCache(backend, ttl=60)
+    monkeypatch.setattr(cache, "response_cache", response_cache)
+    return response_cache
+
+
+def get(client, path, etag=None):
+    return client.get(path, headers={"If-None-Match": etag} if etag else {})
+
+
+def assert_changed(client, path, before):
+    # A new body under a new tag, and the old tag no longer gets a 304
+    after = get(client, path)
+    assert after.status_code == 200
+    assert after.headers["ETag"] != before.headers["ETag"]
+    assert get(client, path, before.headers["ETag"]).status_code == 200
+    return after
+
+
+def test_repeated_read_is_served_from_the_cache(client, response_cache, user_id, filtered_foods, monkeypatch):
+    calls = []
+    get_filtered_foods = queries.get_filtered_foods
+    monkeypatch.setattr(queries, "get_filtered_foods", lambda *args: calls.append(args) or get_filtered_foods(*args))
+
+    first = get(client, f"/filtered-foods/{user_id}")
+    second = get(client, f"/filtered-foods/{user_id}")
+
+    assert first.json() == second.json()
+    assert first.headers["ETag"] == second.headers["ETag"]
+    assert len(calls) == 1
+
+
+def test_cached_404_is_served_again(client, response_cache, user_id):
+    assert get(client, f"/records/{user_id}").status_code == 404
+    assert get(client, f"/records/{user_id}").status_code == 404
+
+
+def test_matching_etag_gets_304(client, response_cache, user_id, filtered_foods):
+    first = get(client, f"/filtered-foods/{user_id}")
+    assert get(client, f"/filtered-foods/{user_id}", first.headers["ETag"]).status_code == 304
+
+
+def test_filter_foods_refreshes_filtered_foods(client, response_cache, user_id, filtered_foods):
+    before = get(client, f"/filtered-foods/{user_id}")
+
+    client.post(f"/filter-foods/{user_id}", json=dict(NO_RESTRICTIONS, pork=False))
+
+    after = assert_changed(client, f"/filtered-foods/{user_id}", before)
+    assert len(after.json()) > len(before.json())
+
+
+def test_record_consumption_refreshes_records(client, response_cache, user_id, filtered_foods):
+    client.post("/record-consumption", json={"user_id": user_id, "filtered_id": filtered_foods[0]["filtered_id"]})
+    before = get(client, f"/records/{user_id}")
+
+    client.post("/record-consumption", json={"user_id": user_id, "filtered_id": filtered_foods[1]["filtered_id"]})
+
+    assert len(assert_changed(client, f"/records/{user_id}", before).json()) == 2
+
+
+def test_add_record_refreshes_records_and_progress(client, response_cache, user_id, filtered_foods):
+    # /add-record can't start the day's progress row itself (progress.filtered_id is NOT NULL)
+    food = filtered_foods[0]
+    client.post(f"/progress/{user_id}/update", params={"filtered_id": food["filtered_id"]})
+    record = {"user_id": user_id, "food_name": "Turon", "type": "Snack ", "carbs": 30, "protein": 2, "fats": 6,
+              "calorie": 180, "grams": 80, "meal_type": "Snack", "category": "Dessert"}
+    client.post("/add-record", json=record)
+    records = get(client, f"/records/{user_id}")
+    progress = get(client, f"/progress/{user_id}/today")
+
+    client.post("/add-record", json=record)
+
+    assert len(assert_changed(client, f"/records/{user_id}", records).json()) == 2
+    assert assert_changed(client, f"/progress/{user_id}/today", progress).json()["total_calories"] == food["calories"] + 360
+
+
+def test_progress_update_refreshes_progress(client, response_cache, user_id, filtered_foods):
+    food = filtered_foods[0]
+    client.post(f"/progress/{user_id}/update", params={"filtered_id": food["filtered_id"]})
+    before = get(client, f"/progress/{user_id}/today")
+
+    client.post(f"/progress/{user_id}/update", params={"filtered_id": food["filtered_id"]})
+
+    after = assert_changed(client, f"/progress/{user_id}/today", before)
+    assert after.json()["total_calories"] == 2 * food["calories"]
+
+
+def test_update_weight_refreshes_bmi(client, response_cache, user_id):
+    before = get(client, f"/bmi/user/{user_id}")
+
+    client.put(f"/bmi/user/{user_id}/update-weight", json={"weight": 80.0})
+
+    assert assert_changed(client, f"/bmi/user/{user_id}", before).json()["weight"] == 80.0
+
+
+def test_write_outside_the_api_is_not_hidden_by_the_cache(client, response_cache, db_conn, user_id, filtered_foods):
+    # Stands in for the archive job or another worker: the rows change and only the version row says so
+    client.post("/record-consumption", json={"user_id": user_id, "filtered_id": filtered_foods[0]["filtered_id"]})
+    before = get(client, f"/records/{user_id}")
+    old = (datetime.now() - timedelta(days=maintenance.RETENTION_DAYS + 1)).strftime("%Y-%m-%d %H:%M:%S")
+    with db_conn:
+        db_conn.execute("UPDATE records SET consumed_at = ? WHERE user_id = ?", (old, user_id))
+    maintenance.archive_old_records(db_conn, client.app.state.settings.archive_database_path)
+
+    assert get(client, f"/records/{user_id}", before.headers["ETag"]).status_code == 404
+    assert len(get(client, f"/records/{user_id}?include_archived=true").json()) == 1
@@ -0,0 +1,107 @@
+import io
+import json
+
+
+def sync(client, **params):
+    response = client.get("/foods/changes", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_first_sync_sends_the_whole_catalog(client, db_conn):
+    changes = sync(client)
+
+    assert changes["reset"] is True
+    assert len(changes["foods"]) == db_conn.execute("SELECT COUNT(*) FROM foods").fetchone()[0]
+
+
+def test_nothing_changed(client):
+    version = sync(client)["version"]
+
+    changes = sync(client, since=version)
+
+    assert changes == {"version": version, "reset": False, "has_more": False, "foods": [], "deleted": []}
+
+
+def test_edits_inserts_and_deletes_since_a_version(client, db_conn):
+    version = sync(client)["version"]
+    # Written the way the Flask admin writes, behind the API's back
+    with db_conn:
+        db_conn.execute("UPDATE foods SET calorie = 999 WHERE food_id = 1")
+        new_id = db_conn.execute(
+            "INSERT INTO foods (food_name, type, carbs, protein, fats, calorie, grams, meal_type, category) "
+            "VALUES ('Turon', 'Snack ', 30, 2, 6, 180, 80, 'Snack', 'Dessert')").lastrowid
+        db_conn.execute("DELETE FROM foods WHERE food_id = 2")
+
+    changes = sync(client, since=version)
+
+    assert changes["reset"] is False
+    assert {food["food_id"]: food["calorie"] for food in changes["foods"]} == {1: 999, new_id: 180}
+    assert [tombstone["food_id"] for tombstone in changes["deleted"]] == [2]
+    assert changes["version"] > version
+
+
+def test_changed_then_deleted_food_is_only_a_tombstone(client, db_conn):
+    version = sync(client)["version"]
+    with db_conn:
+        db_conn.execute("UPDATE foods SET calorie = 999 WHERE food_id = 1")
+        db_conn.execute("DELETE FROM foods WHERE food_id = 1")
+
+    changes = sync(client, since=version)
+
+    assert changes["foods"] == []
+    assert [tombstone["food_id"] for tombstone in changes["deleted"]] == [1]
+
+
+def test_pages_follow_the_version(client, db_conn):
+    version = sync(client)["version"]
+    with db_conn:
+        for food_id in (1, 2, 3):
+            db_conn.execute("UPDATE foods SET calorie = calorie + 1 WHERE food_id = ?", (food_id,))
+
+    first = sync(client, since=version, limit=2)
+    second = sync(client, since=first["version"], limit=2)
+
+    assert first["has_more"] is True
+    assert [food["food_id"] for food in first["foods"]] == [1, 2]
+    assert second["has_more"] is False
+    assert [food["food_id"] for food in second["foods"]] == [3]
+
+
+def test_version_from_the_future_resets(client):
+    version = sync(client)["version"]
+
+    changes = sync(client, since=version + 100)
+
+    assert changes["reset"] is True
+    assert changes["version"] == version
+
+
+def import_foods(admin_client, content, filename="foods.ndjson"):
+    response = admin_client.post("/food/import?format=json", data={"file": (io.BytesIO(content.encode()), filename)},
+                                 content_type="multipart/form-data")
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_reimporting_the_same_catalog_changes_nothing(client, admin_client):
+    exported = admin_client.get("/food/export?format=ndjson").get_data(as_text=True)
+    import_foods(admin_client, exported)  # The first pass may tidy up how the seeded rows are written
+    version = sync(client)["version"]
+
+    report = import_foods(admin_client, exported)
+
+    assert report["failed"] == 0 and report["updated"] > 0
+    assert sync(client, since=version) == {"version": version, "reset": False, "has_more": False, "foods": [], "deleted": []}
+
+
+def test_reimport_with_a_real_change_is_logged(client, admin_client):
+    exported = admin_client.get("/food/export?format=ndjson").get_data(as_text=True)
+    import_foods(admin_client, exported)
+    version = sync(client)["version"]
+    first = json.loads(exported.splitlines()[0])
+
+    import_foods(admin_client, json.dumps(dict(first, calorie=first["calorie"] + 1)) + "\n")
+
+    changes = sync(client, since=version)
+    assert [(food["food_id"], food["calorie"]) for food in changes["foods"]] == [(first["food_id"], first["calorie"] + 1)]
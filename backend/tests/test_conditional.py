@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+import pytz
+
+
+def log_food(client, user_id, filtered_foods):
+    response = client.post("/record-consumption", json={"user_id": user_id, "filtered_id": filtered_foods[0]["filtered_id"]})
+    assert response.status_code == 200
+
+
+def test_read_carries_validators(client, user_id, filtered_foods):
+    log_food(client, user_id, filtered_foods)
+
+    response = client.get(f"/records/{user_id}")
+
+    assert response.headers["ETag"].startswith('W/"records-')
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    assert parsedate_to_datetime(response.headers["Last-Modified"]) <= datetime.now(timezone.utc)
+
+
+def test_if_none_match(client, user_id, filtered_foods):
+    log_food(client, user_id, filtered_foods)
+    etag = client.get(f"/records/{user_id}").headers["ETag"]
+
+    assert client.get(f"/records/{user_id}", headers={"If-None-Match": etag}).status_code == 304
+    # Weak comparison: the strong form of the tag matches too
+    assert client.get(f"/records/{user_id}", headers={"If-None-Match": etag.removeprefix("W/")}).status_code == 304
+    assert client.get(f"/records/{user_id}", headers={"If-None-Match": '"something-else"'}).status_code == 200
+
+
+def test_variants_get_their_own_tags(client, user_id, filtered_foods):
+    log_food(client, user_id, filtered_foods)
+    recent = client.get(f"/records/{user_id}").headers["ETag"]
+
+    response = client.get(f"/records/{user_id}?include_archived=true", headers={"If-None-Match": recent})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != recent
+
+
+def test_if_modified_since(client, user_id, filtered_foods):
+    log_food(client, user_id, filtered_foods)
+    last_modified = client.get(f"/records/{user_id}").headers["Last-Modified"]
+    earlier = format_datetime(parsedate_to_datetime(last_modified) - timedelta(seconds=1), usegmt=True)
+
+    assert client.get(f"/records/{user_id}", headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get(f"/records/{user_id}", headers={"If-Modified-Since": earlier}).status_code == 200
+    # If-None-Match decides when both are sent
+    headers = {"If-Modified-Since": last_modified, "If-None-Match": '"something-else"'}
+    assert client.get(f"/records/{user_id}", headers=headers).status_code == 200
+
+
+def test_write_changes_the_tag(client, user_id, filtered_foods):
+    log_food(client, user_id, filtered_foods)
+    etag = client.get(f"/records/{user_id}").headers["ETag"]
+
+    log_food(client, user_id, filtered_foods)
+
+    assert client.get(f"/records/{user_id}", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_todays_progress_is_not_modified_since_yesterday(client, db_conn, user_id, filtered_foods):
+    # Progress last written yesterday (by the counter): a copy fetched yesterday must not be revalidated as today's
+    client.post(f"/progress/{user_id}/update", params={"filtered_id": filtered_foods[0]["filtered_id"]})
+    yesterday = datetime.now(timezone.utc) - timedelta(days=1)
+    with db_conn:
+        db_conn.execute("UPDATE user_data_versions SET updated_at = ? WHERE user_id = ? AND resource = 'progress'",
+                        (yesterday.strftime("%Y-%m-%d %H:%M:%S.%f"), user_id))
+
+    response = client.get(f"/progress/{user_id}/today", headers={"If-Modified-Since": format_datetime(yesterday, usegmt=True)})
+
+    assert response.status_code == 200
+    manila = pytz.timezone("Asia/Manila")
+    start_of_day = manila.localize(datetime.combine(datetime.now(manila).date(), datetime.min.time()))
+    assert parsedate_to_datetime(response.headers["Last-Modified"]) == start_of_day
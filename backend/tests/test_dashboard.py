@@ -0,0 +1,88 @@
+import pytest
+
+import dashboard
+from cache import LRUCache
+
+
+@pytest.fixture(autouse=True)
+def builds(monkeypatch):
+    # A fresh per-worker cache for every test, and a count of the dashboards actually built
+    monkeypatch.setattr(dashboard, "dashboard_cache", LRUCache(maxsize=dashboard.HOT_USERS))
+    calls = []
+    build_dashboard = dashboard.build_dashboard
+    monkeypatch.setattr(dashboard, "build_dashboard", lambda db, user_id: calls.append(user_id) or build_dashboard(db, user_id))
+    return calls
+
+
+def get_dashboard(client, user_id):
+    response = client.get(f"/dashboard/{user_id}")
+    assert response.status_code == 200
+    return response.json()
+
+
+def log_food(client, user_id, filtered_foods):
+    response = client.post("/record-consumption", json={"user_id": user_id, "filtered_id": filtered_foods[0]["filtered_id"]})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_everything_the_home_screen_needs(client, user_id, filtered_foods):
+    record = log_food(client, user_id, filtered_foods)
+    client.post(f"/progress/{user_id}/update", params={"filtered_id": filtered_foods[0]["filtered_id"]})
+
+    home = get_dashboard(client, user_id)
+
+    assert home["date"] == record["local_date"]
+    assert (home["user"]["username"], home["user"]["timezone"]) == ("test-user", "Asia/Manila")
+    assert (home["bmi"]["height"], home["bmi"]["weight"], home["bmi"]["bmi"]) == (1.7, 65.0, 22.5)
+    assert home["daily_calories"] == home["recommendation"]["daily_calories"]
+    assert home["progress_today"]["total_calories"] == filtered_foods[0]["calories"]
+    assert home["progress_today"]["bmi"] == {"daily_calories": home["daily_calories"]}
+    assert [food["filtered_id"] for food in home["filtered_foods"]] == [food["filtered_id"] for food in filtered_foods]
+    assert [entry["record_id"] for entry in home["records_today"]] == [record["record_id"]]
+
+
+def test_new_user_gets_empty_sections_and_the_default_target(client, db_conn):
+    with db_conn:
+        new_id = db_conn.execute("INSERT INTO tbl_users (username, hashed_password, firstname, lastname, age) "
+                                 "VALUES ('new-user', 'x', 'New', 'User', 20)").lastrowid
+
+    home = get_dashboard(client, new_id)
+
+    assert (home["bmi"], home["recommendation"], home["progress_today"]) == (None, None, None)
+    assert home["daily_calories"] == 2000
+    assert home["filtered_foods"] == [] and home["records_today"] == []
+
+
+def test_repeated_opens_are_served_from_the_cache(client, user_id, filtered_foods, builds):
+    first = get_dashboard(client, user_id)
+    second = get_dashboard(client, user_id)
+
+    assert first == second
+    assert builds == [user_id]
+
+
+def test_writes_through_the_api_show_up_at_once(client, user_id, filtered_foods, builds):
+    get_dashboard(client, user_id)
+
+    log_food(client, user_id, filtered_foods)
+    after_record = get_dashboard(client, user_id)
+    client.put(f"/bmi/user/{user_id}/update-weight", json={"weight": 80.0})
+    after_weight = get_dashboard(client, user_id)
+
+    assert len(after_record["records_today"]) == 1
+    assert after_weight["bmi"]["weight"] == 80.0
+    assert builds == [user_id] * 3
+
+
+def test_cached_dashboard_expires(client, user_id, filtered_foods, builds, monkeypatch):
+    monkeypatch.setattr(dashboard, "DASHBOARD_TTL_SECONDS", 0)
+
+    get_dashboard(client, user_id)
+    get_dashboard(client, user_id)
+
+    assert builds == [user_id] * 2
+
+
+def test_unknown_user(client):
+    assert client.get("/dashboard/999999").status_code == 404
@@ -0,0 +1,139 @@
+import asyncio
+import json
+
+import pytest
+
+import main
+from events import LocalBroker, SubscriberLimitReached, format_event, progress_channel
+
+
+async def read_stream(app, path, until, on_chunk=None):
+    """
+    Drive the ASGI app by hand: TestClient buffers the whole body, which never
+    ends for an event stream. Returns the events read once until(events) holds.
+    """
+    disconnected = asyncio.Event()
+    events, buffer = [], ""
+    status = {}
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal buffer
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+            status["headers"] = dict(message["headers"])
+            return
+        buffer += message.get("body", b"").decode()
+        while "\n\n" in buffer:
+            event, buffer = buffer.split("\n\n", 1)
+            events.append(event)
+            if on_chunk is not None:
+                await on_chunk(events)
+        if until(events):
+            disconnected.set()
+
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+             "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+             "headers": [(b"host", b"testserver")], "client": ("testclient", 50000), "server": ("testserver", 80)}
+    await asyncio.wait_for(app(scope, receive, send), timeout=10)
+    return status, events
+
+
+def progress_events(events):
+    return [json.loads(event.split("data: ", 1)[1]) for event in events if event.startswith("event: progress")]
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    broker = LocalBroker(max_subscribers=3, max_per_channel=2)
+    monkeypatch.setattr(main, "broker", broker)
+    return broker
+
+
+def log_food(client, user_id, filtered_foods):
+    response = client.post(f"/progress/{user_id}/update", params={"filtered_id": filtered_foods[0]["filtered_id"]})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_format_event():
+    assert format_event("progress", {"total_calories": 120}) == 'event: progress\ndata: {"total_calories": 120}\n\n'
+
+
+def test_stream_sends_current_totals_then_each_change(client, broker, user_id, filtered_foods):
+    first = log_food(client, user_id, filtered_foods)
+
+    async def log_again(events):
+        if len(progress_events(events)) == 1:
+            await asyncio.to_thread(log_food, client, user_id, filtered_foods)
+
+    status, events = asyncio.run(read_stream(client.app, f"/progress/{user_id}/stream",
+                                             until=lambda events: len(progress_events(events)) == 2, on_chunk=log_again))
+
+    assert status["code"] == 200
+    assert status["headers"][b"content-type"].startswith(b"text/event-stream")
+    assert events[0] == "retry: 5000"
+    initial, changed = progress_events(events)
+    assert initial["total_calories"] == first["total_calories"]
+    assert changed["total_calories"] == 2 * first["total_calories"]
+    assert broker.count == 0  # The subscription is dropped when the client goes away
+
+
+def test_stream_without_progress_waits_for_the_first_meal(client, broker, user_id, filtered_foods):
+    async def log_first(events):
+        if events == ["retry: 5000"]:
+            await asyncio.to_thread(log_food, client, user_id, filtered_foods)
+
+    _, events = asyncio.run(read_stream(client.app, f"/progress/{user_id}/stream",
+                                        until=lambda events: len(progress_events(events)) == 1, on_chunk=log_first))
+
+    assert events[0] == "retry: 5000"
+    assert len(progress_events(events)) == 1
+
+
+def test_idle_stream_sends_keepalives(client, broker, user_id, monkeypatch):
+    monkeypatch.setattr(main, "STREAM_KEEPALIVE_SECONDS", 0.01)
+
+    _, events = asyncio.run(read_stream(client.app, f"/progress/{user_id}/stream", until=lambda events: len(events) == 3))
+
+    assert events == ["retry: 5000", ": keepalive", ": keepalive"]
+
+
+def test_too_many_streams_for_one_user(client, broker, user_id):
+    async def open_streams():
+        broker.subscribe(progress_channel(user_id))
+        broker.subscribe(progress_channel(user_id))
+        return await read_stream(client.app, f"/progress/{user_id}/stream", until=lambda events: True)
+
+    status, _ = asyncio.run(open_streams())
+
+    assert status["code"] == 503
+    assert status["headers"][b"retry-after"] == b"5"
+
+
+def test_broker_limits_and_latest_message_wins():
+    async def scenario():
+        broker = LocalBroker(max_subscribers=2, max_per_channel=1)
+        first = broker.subscribe("progress:1")
+        with pytest.raises(SubscriberLimitReached):
+            broker.subscribe("progress:1")
+        broker.subscribe("progress:2")
+        with pytest.raises(SubscriberLimitReached):
+            broker.subscribe("progress:3")
+
+        broker.publish("progress:1", {"total_calories": 100})
+        broker.publish("progress:1", {"total_calories": 200})
+        await asyncio.sleep(0)
+        latest = await first.get(timeout=1)
+
+        first.close()
+        first.close()
+        return latest, broker.count, broker.subscribe("progress:3")
+
+    latest, count, _ = asyncio.run(scenario())
+
+    assert latest == {"total_calories": 200}
+    assert count == 1
@@ -0,0 +1,86 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+import export
+import maintenance
+
+OLD = (datetime.now() - timedelta(days=maintenance.RETENTION_DAYS + 1)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def log_food(client, user_id, filtered_foods, count=1):
+    record_ids = []
+    for _ in range(count):
+        response = client.post("/record-consumption", json={"user_id": user_id, "filtered_id": filtered_foods[0]["filtered_id"]})
+        assert response.status_code == 200
+        record_ids.append(response.json()["record_id"])
+    return record_ids
+
+
+def export_rows(client, user_id, **params):
+    response = client.get(f"/users/{user_id}/export", params=params)
+    assert response.status_code == 200
+    return response, [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_ndjson_has_records_bmi_and_progress(client, user_id, filtered_foods):
+    record_ids = log_food(client, user_id, filtered_foods, count=2)
+    client.post(f"/progress/{user_id}/update", params={"filtered_id": filtered_foods[0]["filtered_id"]})
+
+    response, rows = export_rows(client, user_id)
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["content-disposition"] == f"attachment; filename=user-{user_id}-export.ndjson"
+    assert [row["kind"] for row in rows] == ["record", "record", "bmi", "progress"]
+    assert all(row["user_id"] == user_id for row in rows)
+    assert [row["record_id"] for row in rows[:2]] == record_ids
+    assert rows[0]["food_name"] == filtered_foods[0]["food_name"]
+    datetime.fromisoformat(rows[0]["consumed_at"])
+    assert (rows[2]["bmi"], rows[2]["recommendation_id"]) == (22.5, 2)
+    assert rows[3]["total_calories"] == filtered_foods[0]["calories"]
+
+
+def test_archived_records_only_when_asked(client, db_conn, settings, user_id, filtered_foods):
+    archived_id, live_id = log_food(client, user_id, filtered_foods, count=2)
+    with db_conn:
+        db_conn.execute("UPDATE records SET consumed_at = ? WHERE record_id = ?", (OLD, archived_id))
+    maintenance.archive_old_records(db_conn, settings.archive_database_path)
+
+    _, without_archive = export_rows(client, user_id)
+    _, with_archive = export_rows(client, user_id, include_archived=True)
+
+    assert [(row["kind"], row["record_id"]) for row in without_archive if "record" in row["kind"]] == [("record", live_id)]
+    assert [(row["kind"], row["record_id"]) for row in with_archive if "record" in row["kind"]] == \
+        [("archived_record", archived_id), ("record", live_id)]
+
+
+def test_csv_is_one_table_with_a_kind_column(client, user_id, filtered_foods):
+    log_food(client, user_id, filtered_foods)
+
+    response = client.get(f"/users/{user_id}/export", params={"format": "csv"})
+
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert list(rows[0]) == export.CSV_COLUMNS
+    assert [row["kind"] for row in rows] == ["record", "bmi"]
+    assert rows[0]["food_name"] == filtered_foods[0]["food_name"] and rows[0]["bmi"] == ""
+    assert rows[1]["bmi"] == "22.5" and rows[1]["food_name"] == ""
+
+
+def test_rows_are_read_and_sent_in_batches(client, user_id, filtered_foods, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 2)
+    record_ids = log_food(client, user_id, filtered_foods, count=5)
+
+    chunks = list(export.generate_ndjson(user_id))
+
+    # Records in 2 + 2 + 1, then the single BMI row
+    assert [chunk.count("\n") for chunk in chunks] == [2, 2, 1, 1]
+    rows = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+    assert [row["record_id"] for row in rows if row["kind"] == "record"] == record_ids
+    _, streamed = export_rows(client, user_id)
+    assert streamed == rows
+
+
+def test_unknown_user(client):
+    assert client.get("/users/999999/export").status_code == 404
@@ -0,0 +1,57 @@
+import csv
+import io
+import json
+
+SNACK = {"food_name": "Turon", "type": "Snack", "carbs": "30", "protein": "2 g", "fats": 6.5, "calorie": 180, "grams": 80,
+         "meal_type": "Snack", "category": "Dessert"}
+
+
+def import_foods(admin_client, content, filename="foods.ndjson", **form):
+    response = admin_client.post("/food/import?format=json", data=dict(form, file=(io.BytesIO(content.encode()), filename)),
+                                 content_type="multipart/form-data")
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def ndjson(*rows):
+    return "".join(json.dumps(row) + "\n" for row in rows)
+
+
+def stored(db_conn, food_name):
+    return db_conn.execute("SELECT type, carbs, protein, fats FROM foods WHERE food_name = ?", (food_name,)).fetchone()
+
+
+def test_imported_type_takes_the_catalogs_spelling(admin_client, db_conn):
+    # The seeded catalog stores 'Snack ' with a trailing space
+    assert db_conn.execute("SELECT COUNT(*) FROM foods WHERE type = 'Snack '").fetchone()[0] > 0
+
+    report = import_foods(admin_client, ndjson(SNACK))
+
+    assert report["inserted"] == 1
+    assert stored(db_conn, "Turon") == ("Snack ", "30g", "2g", "6.5g")
+    assert db_conn.execute("SELECT COUNT(*) FROM foods WHERE type = 'Snack'").fetchone()[0] == 0
+
+
+def test_unknown_type_needs_allow_new_types(admin_client, db_conn):
+    row = dict(SNACK, type="Insects")
+
+    rejected = import_foods(admin_client, ndjson(row))
+    accepted = import_foods(admin_client, ndjson(row), allow_new_types="on")
+
+    assert rejected["errors"] == [{"row": 1, "error": "Unknown type 'Insects'"}]
+    assert accepted["inserted"] == 1
+    assert stored(db_conn, "Turon")[0] == "Insects"
+
+
+def test_csv_rows_upsert_by_name_and_category(admin_client, db_conn):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(SNACK))
+    writer.writeheader()
+    writer.writerow(SNACK)
+    writer.writerow(dict(SNACK, calorie=200))
+    writer.writerow(dict(SNACK, calorie="lots"))
+
+    report = import_foods(admin_client, buffer.getvalue(), filename="foods.csv")
+
+    assert (report["inserted"], report["updated"], report["failed"]) == (1, 0, 1)
+    assert db_conn.execute("SELECT calorie FROM foods WHERE food_name = 'Turon'").fetchall() == [(200,)]
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import crud
+import database
+import frequent
+
+
+def log_food(client, user_id, food):
+    response = client.post("/record-consumption", json={"user_id": user_id, "filtered_id": food["filtered_id"]})
+    assert response.status_code == 200
+
+
+def frequent_foods(client, user_id, **headers):
+    return client.get(f"/users/{user_id}/frequent-foods", headers=headers)
+
+
+def test_decay_key_adds_uses():
+    moment = crud.STORAGE_TIMEZONE.localize(datetime(2026, 1, 1))
+    twice = frequent.add_use(frequent.add_use(None, moment), moment)
+
+    assert frequent.current_score(twice, moment) == pytest.approx(2)
+    # One half-life later both uses count half
+    assert frequent.current_score(twice, moment + timedelta(days=frequent.HALF_LIFE_DAYS)) == pytest.approx(1)
+
+
+def test_recent_use_outranks_many_old_ones():
+    now = crud.STORAGE_TIMEZONE.localize(datetime(2026, 1, 1))
+    old = None
+    for _ in range(3):
+        old = frequent.add_use(old, now - timedelta(days=5 * frequent.HALF_LIFE_DAYS))
+
+    assert frequent.add_use(None, now) > old
+
+
+def test_most_used_food_comes_first(client, user_id, filtered_foods):
+    log_food(client, user_id, filtered_foods[0])
+    log_food(client, user_id, filtered_foods[1])
+    log_food(client, user_id, filtered_foods[1])
+
+    foods = frequent_foods(client, user_id).json()
+
+    assert [(food["food_name"], food["use_count"]) for food in foods] == [
+        (filtered_foods[1]["food_name"], 2), (filtered_foods[0]["food_name"], 1)]
+    assert foods[0]["filtered_id"] == filtered_foods[1]["filtered_id"]
+    assert foods[0]["score"] > foods[1]["score"]
+
+
+def test_limit(client, user_id, filtered_foods):
+    for food in filtered_foods[:3]:
+        log_food(client, user_id, food)
+
+    assert len(frequent_foods(client, user_id).json()) == 3
+    assert len(client.get(f"/users/{user_id}/frequent-foods?limit=2").json()) == 2
+
+
+def test_rebuild_counts_records_logged_before_the_counters(client, db_conn, user_id, filtered_foods):
+    food = filtered_foods[0]
+    etag = frequent_foods(client, user_id).headers["ETag"]
+    # Records written without going through record_food_use
+    with db_conn:
+        for _ in range(2):
+            db_conn.execute(
+                "INSERT INTO records (user_id, filtered_food_id, food_name, type, carbs, protein, fats, calorie, grams, "
+                "meal_type, category, consumed_at) VALUES (?, ?, ?, ?, 1, 1, 1, ?, ?, ?, ?, ?)",
+                (user_id, food["filtered_id"], food["food_name"], food["type"], food["calories"], food["grams"],
+                 food["mealtype"], food["categories"], datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+    db = database.SessionLocal()
+    try:
+        assert frequent.rebuild_frequencies(db) >= 1
+    finally:
+        db.close()
+
+    # Other workers keep their cached lists; the new ETag is what tells them apart
+    response = frequent_foods(client, user_id, **{"If-None-Match": etag})
+    assert response.status_code == 200
+    assert [(row["food_name"], row["use_count"]) for row in response.json()] == [(food["food_name"], 2)]
@@ -0,0 +1,72 @@
+import pytest
+
+import maintenance
+import onboarding
+
+
+@pytest.fixture(autouse=True)
+def cheap_hashes(monkeypatch):
+    # bcrypt in a spawned process pool is what the endpoint is for, but too slow to repeat in every test
+    monkeypatch.setattr(onboarding, "hash_passwords", lambda passwords: [f"hashed:{password}" for password in passwords])
+
+
+def new_user(username, **fields):
+    return dict({"username": username, "password": "secret", "firstname": "Test", "lastname": "User", "age": 30}, **fields)
+
+
+def bulk(client, *users):
+    response = client.post("/users/bulk", json={"users": list(users)})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_creates_users_and_their_first_bmi(client, db_conn):
+    result = bulk(client, new_user("bulk-a", height=1.7, weight=65.0), new_user("bulk-b", timezone="America/New_York"))
+
+    assert result["created"] == 2 and result["failed"] == 0
+    with_bmi, without_bmi = result["results"]
+    assert with_bmi["bmi_id"] is not None and without_bmi["bmi_id"] is None
+    assert db_conn.execute("SELECT timezone, hashed_password FROM tbl_users WHERE user_id = ?", (without_bmi["user_id"],)).fetchone() == \
+        ("America/New_York", "hashed:secret")
+    bmi = client.get(f"/bmi/user/{with_bmi['user_id']}").json()
+    assert bmi["bmi"] == pytest.approx(65.0 / 1.7 ** 2)
+
+
+def test_bad_rows_are_reported_without_failing_the_rest(client, user_id):
+    result = bulk(
+        client,
+        new_user("test-user"),  # Taken by the user_id fixture
+        new_user("bulk-twice"),
+        new_user("bulk-twice"),
+        new_user("bulk-half-bmi", height=1.7),
+        new_user("bulk-nowhere", timezone="Mars/Olympus_Mons"),
+        new_user("bulk-fine"),
+    )
+
+    assert result["created"] == 2
+    errors = {row["index"]: row.get("error") for row in result["results"] if row["status"] == "error"}
+    assert errors == {
+        0: "Username already registered",
+        2: "Username appears more than once in this batch",
+        3: "height and weight must be given together",
+        4: "Unknown timezone 'Mars/Olympus_Mons'.",
+    }
+
+
+def test_too_many_users_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(onboarding, "MAX_BULK_USERS", 1)
+
+    assert client.post("/users/bulk", json={"users": [new_user("bulk-a"), new_user("bulk-b")]}).status_code == 413
+
+
+def test_reused_user_id_does_not_see_the_deleted_users_cached_reads(client, db_conn, settings):
+    old_id = bulk(client, new_user("bulk-old"))["results"][0]["user_id"]
+    stale = client.get(f"/bmi/user/{old_id}")
+    assert stale.status_code == 404
+    maintenance.delete_user_cascade(db_conn, old_id, archive_path=settings.archive_database_path)
+
+    new_id = bulk(client, new_user("bulk-new", height=1.7, weight=65.0))["results"][0]["user_id"]
+
+    assert new_id == old_id
+    assert client.get(f"/bmi/user/{new_id}").status_code == 200
+    assert client.get(f"/progress/{new_id}/today").status_code == 404  # No meals yet, but not the old user's answer
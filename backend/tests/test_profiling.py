@@ -0,0 +1,79 @@
+import dataclasses
+import pstats
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import create_app
+
+ADMIN = {"X-Admin-Token": "admin-secret"}
+
+
+@pytest.fixture
+def admin_settings(settings):
+    return dataclasses.replace(settings, admin_token="admin-secret", profile_keep=2)
+
+
+@pytest.fixture
+def profiled_client(admin_settings):
+    with TestClient(create_app(admin_settings)) as client:
+        yield client
+
+
+def profiled_get(client, path):
+    response = client.get(path, headers={"X-Profile-Token": "admin-secret"})
+    assert response.status_code == 200
+    return response.headers["X-Profile-Id"]
+
+
+def test_admin_token_header_records_a_trace(profiled_client, user_id):
+    trace_id = profiled_get(profiled_client, f"/bmi/user/{user_id}")
+
+    trace = profiled_client.get(f"/admin/profiles/{trace_id}", headers=ADMIN).json()
+
+    assert {key: trace[key] for key in ("trace_id", "method", "path", "reason", "status")} == \
+        {"trace_id": trace_id, "method": "GET", "path": f"/bmi/user/{user_id}", "reason": "header", "status": 200}
+    assert trace["sql_count"] == len(trace["sql"]) > 0
+    assert any("FROM bmi_data" in query["statement"] for query in trace["sql"])
+    assert "(get_bmi_records_by_user)" in trace["top_functions"]
+    assert profiled_client.get("/admin/profiles", headers=ADMIN).json()[0]["trace_id"] == trace_id
+
+
+def test_raw_profile_downloads(profiled_client, user_id, tmp_path):
+    trace_id = profiled_get(profiled_client, f"/bmi/user/{user_id}")
+
+    response = profiled_client.get(f"/admin/profiles/{trace_id}/download", headers=ADMIN)
+
+    assert response.status_code == 200
+    path = tmp_path / "downloaded.prof"
+    path.write_bytes(response.content)
+    assert pstats.Stats(str(path)).total_calls > 0
+
+
+def test_only_the_newest_traces_are_kept(profiled_client, user_id):
+    trace_ids = [profiled_get(profiled_client, f"/bmi/user/{user_id}") for _ in range(3)]
+
+    listed = [trace["trace_id"] for trace in profiled_client.get("/admin/profiles", headers=ADMIN).json()]
+
+    assert listed == sorted(trace_ids[1:], reverse=True)
+    assert profiled_client.get(f"/admin/profiles/{trace_ids[0]}", headers=ADMIN).status_code == 404
+
+
+def test_wrong_or_missing_token_is_not_profiled(profiled_client, user_id):
+    wrong = profiled_client.get(f"/bmi/user/{user_id}", headers={"X-Profile-Token": "guess"})
+    plain = profiled_client.get(f"/bmi/user/{user_id}")
+
+    assert "X-Profile-Id" not in wrong.headers and "X-Profile-Id" not in plain.headers
+    assert profiled_client.get("/admin/profiles", headers=ADMIN).json() == []
+
+
+def test_admin_endpoints_are_hidden_without_the_token(client, profiled_client):
+    assert client.get("/admin/profiles", headers=ADMIN).status_code == 404  # No token configured
+    assert profiled_client.get("/admin/profiles").status_code == 404
+    assert profiled_client.get("/admin/profiles/../../etc/passwd", headers=ADMIN).status_code == 404
+
+
+def test_profiling_is_off_by_default(client, user_id):
+    response = client.get(f"/bmi/user/{user_id}", headers={"X-Profile-Token": "admin-secret"})
+
+    assert "X-Profile-Id" not in response.headers
@@ -0,0 +1,107 @@
+import math
+
+import pytest
+
+import main
+from similar import KDTree, SimilarFoodsIndex, per_gram_vector
+
+
+@pytest.fixture(autouse=True)
+def fresh_index(monkeypatch):
+    # The index is process-wide, and every test gets its own copy of the database
+    index = SimilarFoodsIndex()
+    monkeypatch.setattr(main, "food_index", index)
+    return index
+
+
+def similar(client, food_id, **params):
+    response = client.get(f"/foods/{food_id}/similar", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+def brute_force(index, db_conn, food_id, excluded_types=()):
+    rows = db_conn.execute("SELECT food_id, type, carbs, protein, fats, calorie, grams, meal_type FROM foods").fetchall()
+    columns = ("food_id", "type", "carbs", "protein", "fats", "calorie", "grams", "meal_type")
+    foods = {row[0]: dict(zip(columns, row)) for row in rows}
+    target = foods[food_id]
+    point = index.normalize(per_gram_vector(target))
+    return sorted(
+        (round(math.dist(point, index.normalize(per_gram_vector(food))), 4), other_id)
+        for other_id, food in foods.items()
+        if other_id != food_id and food["meal_type"] == target["meal_type"] and food["type"] not in excluded_types
+    )
+
+
+def lunch_food(db_conn, food_type):
+    return db_conn.execute("SELECT food_id FROM foods WHERE meal_type = 'Lunch' AND type = ? ORDER BY food_id", (food_type,)).fetchone()[0]
+
+
+def test_matches_a_brute_force_search_of_the_meal_type(client, db_conn, fresh_index):
+    food_id = lunch_food(db_conn, "Chicken")
+
+    foods = similar(client, food_id, limit=50)
+
+    assert [(food["distance"], food["food_id"]) for food in foods] == brute_force(fresh_index, db_conn, food_id)
+    assert {food["meal_type"] for food in foods} == {"Lunch"}
+
+
+def test_limit_keeps_the_closest(client, db_conn):
+    food_id = lunch_food(db_conn, "Chicken")
+
+    everything = similar(client, food_id, limit=50)
+    closest = similar(client, food_id, limit=3)
+
+    assert closest == everything[:3]
+
+
+def test_skips_the_types_the_user_filtered_out(client, db_conn, user_id, fresh_index):
+    response = client.post(f"/filter-foods/{user_id}", json={
+        "pork": True, "allergic_to_milk": False, "allergic_to_fish": True, "allergic_to_soy": False,
+        "allergic_to_chicken": False, "allergic_to_mussels": False, "allergic_to_beef": False,
+    })
+    assert response.status_code == 200
+    food_id = lunch_food(db_conn, "Chicken")
+
+    foods = similar(client, food_id, user_id=user_id, limit=50)
+
+    assert not {"Pork", "Fish"} & {food["type"] for food in foods}
+    assert [(food["distance"], food["food_id"]) for food in foods] == \
+        brute_force(fresh_index, db_conn, food_id, excluded_types={"Pork", "Fish"})
+
+
+def test_follows_catalog_edits(client, db_conn):
+    food_id = lunch_food(db_conn, "Chicken")
+    similar(client, food_id)  # Builds the index
+    with db_conn:
+        twin_id = db_conn.execute(
+            "INSERT INTO foods (food_name, type, carbs, protein, fats, calorie, grams, meal_type, category) "
+            "SELECT 'Twin', 'Tofu', carbs, protein, fats, calorie, grams, meal_type, category FROM foods WHERE food_id = ?",
+            (food_id,)).lastrowid
+        nearest_id = similar(client, food_id)[0]["food_id"]
+        db_conn.execute("DELETE FROM foods WHERE food_id = ?", (nearest_id,))
+
+    foods = similar(client, food_id, limit=50)
+
+    assert (foods[0]["food_id"], foods[0]["distance"]) == (twin_id, 0)
+    assert nearest_id not in {food["food_id"] for food in foods[1:]}
+
+
+def test_unknown_food(client):
+    assert client.get("/foods/999999/similar").status_code == 404
+
+
+def test_tree_nearest_after_inserts_and_removes():
+    points = {food_id: (food_id % 7, food_id % 5, food_id % 3, food_id % 11) for food_id in range(1, 60)}
+    tree = KDTree((point, food_id, "Any") for food_id, point in points.items() if food_id < 40)
+    for food_id in range(40, 60):
+        tree.insert(points[food_id], food_id, "Any")
+    for food_id in range(1, 60, 4):
+        tree.remove(food_id)
+        del points[food_id]
+    target = (3, 2, 1, 4)
+
+    found = tree.nearest(target, 5, lambda node: True)
+
+    expected = sorted((math.dist(target, point), food_id) for food_id, point in points.items())[:5]
+    assert [distance for distance, _ in found] == [distance for distance, _ in expected]
@@ -0,0 +1,86 @@
+import sqlite3
+from datetime import datetime
+
+import pytz
+
+import maintenance
+
+
+def set_timezone(client, user_id, timezone):
+    response = client.put(f"/users/{user_id}/timezone", json={"timezone": timezone})
+    assert response.status_code == 200
+    return response
+
+
+def log_food(client, user_id, filtered_foods):
+    response = client.post("/record-consumption", json={"user_id": user_id, "filtered_id": filtered_foods[0]["filtered_id"]})
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_unknown_timezone_is_rejected(client, user_id):
+    assert client.put(f"/users/{user_id}/timezone", json={"timezone": "Mars/Olympus_Mons"}).status_code == 400
+
+
+def test_record_is_dated_in_the_users_timezone(client, user_id, filtered_foods):
+    set_timezone(client, user_id, "America/New_York")
+
+    record = log_food(client, user_id, filtered_foods)
+
+    assert record["local_date"] == datetime.now(pytz.timezone("America/New_York")).date().isoformat()
+
+
+def test_add_record_dates_a_past_meal_by_the_users_day(client, db_conn, user_id, filtered_foods):
+    set_timezone(client, user_id, "America/New_York")
+    # /add-record can't start a day's progress row itself (progress.filtered_id is NOT NULL)
+    with db_conn:
+        db_conn.execute("INSERT INTO progress (user_id, filtered_id, total_calories, date, daily_calories) VALUES (?, ?, 0, '2026-01-01', 2000)",
+                        (user_id, filtered_foods[0]["filtered_id"]))
+    record = {"user_id": user_id, "food_name": "Turon", "type": "Snack ", "carbs": 30, "protein": 2, "fats": 6,
+              "calorie": 180, "grams": 80, "meal_type": "Snack", "category": "Dessert",
+              "consumed_at": "2026-01-02T08:00:00+08:00"}
+
+    response = client.post("/add-record", json=record)
+
+    # 08:00 in Manila is still the evening before in New York
+    assert response.json()["local_date"] == "2026-01-01"
+    assert db_conn.execute("SELECT total_calories FROM progress WHERE user_id = ? AND date = '2026-01-01'", (user_id,)).fetchone() == (180,)
+    assert len(client.get(f"/records/{user_id}?start_date=2026-01-01&end_date=2026-01-01").json()) == 1
+    assert client.get(f"/records/{user_id}?start_date=2026-01-02&end_date=2026-01-02").status_code == 404
+
+
+def test_archived_records_keep_the_users_day(client, db_conn, settings, user_id, filtered_foods):
+    set_timezone(client, user_id, "America/New_York")
+    log_food(client, user_id, filtered_foods)
+    # A record from before local_date existed
+    with db_conn:
+        db_conn.execute("UPDATE records SET consumed_at = '2020-01-02 08:00:00', local_date = NULL WHERE user_id = ?", (user_id,))
+
+    maintenance.archive_old_records(db_conn, settings.archive_database_path)
+
+    archived = client.get(f"/records/{user_id}?include_archived=true&start_date=2020-01-01&end_date=2020-01-01").json()
+    assert [record["local_date"] for record in archived] == ["2020-01-01"]
+    assert client.get(f"/records/{user_id}?include_archived=true&start_date=2020-01-02&end_date=2020-01-02").status_code == 404
+
+
+def test_init_db_migrates_an_archive_without_local_date(db_conn, settings, user_id):
+    with db_conn:
+        db_conn.execute("UPDATE tbl_users SET timezone = 'America/New_York' WHERE user_id = ?", (user_id,))
+    archive = sqlite3.connect(settings.archive_database_path)
+    with archive:
+        archive.execute("""CREATE TABLE records (
+            record_id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER NOT NULL, filtered_food_id INTEGER,
+            food_name VARCHAR NOT NULL, type VARCHAR NOT NULL, carbs INTEGER NOT NULL, protein INTEGER NOT NULL,
+            fats INTEGER NOT NULL, calorie INTEGER NOT NULL, grams INTEGER NOT NULL, meal_type VARCHAR NOT NULL,
+            category VARCHAR NOT NULL, consumed_at DATETIME)""")
+        archive.execute("INSERT INTO records VALUES (1, ?, NULL, 'Turon', 'Snack ', 30, 2, 6, 180, 80, 'Snack', 'Dessert', "
+                        "'2020-01-02 08:00:00')", (user_id,))
+    archive.close()
+
+    maintenance.init_db(settings.database_path, settings.archive_database_path)
+
+    archive = sqlite3.connect(settings.archive_database_path)
+    try:
+        assert archive.execute("SELECT local_date FROM records WHERE record_id = 1").fetchone() == ("2020-01-01",)
+    finally:
+        archive.close()
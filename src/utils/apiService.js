@@ -153,6 +153,27 @@ export const getProgressForUserToday = async (userId) => {
   }
 };
 
+// Function to get everything the home screen shows (user, BMI, plan, today's progress, foods, today's records) in one call
+export const getDashboard = async (userId) => {
+  try {
+    const response = await axios.get(`${API_URL}/dashboard/${userId}`);
+    return response.data;
+  } catch (error) {
+    throw new Error(error.response?.data?.detail || 'Failed to fetch dashboard');
+  }
+};
+
+// Function to get food catalog changes since the version from the last sync (omit it the first time)
+export const getFoodChanges = async (since) => {
+  try {
+    const params = since === undefined || since === null ? {} : { since };
+    const response = await axios.get(`${API_URL}/foods/changes`, { params });
+    return response.data;
+  } catch (error) {
+    throw new Error(error.response?.data?.detail || 'Failed to fetch food changes');
+  }
+};
+
 // Function to get progress by date range
 export const getProgressByDateRange = async (userId, startDate, endDate) => {
   try {